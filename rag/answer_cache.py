@@ -0,0 +1,172 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from embedding_cache import normalize_query
+
+# Result headers carry the query's similarity scores (see context_packer.format_header)
+SIMILARITY_PATTERN = re.compile(r"\(Similarity: -?[0-9.]+\)")
+
+
+def hash_context(context):
+    """
+    Hash the retrieved context an answer was generated from.
+
+    Similarity scores are left out, since they differ between paraphrases
+    of a question that retrieve the same passages.
+
+    Args:
+        context (str): Context string passed to the generation model
+
+    Returns:
+        str: Hex SHA-256 digest of the context without similarity scores
+    """
+    return hashlib.sha256(SIMILARITY_PATTERN.sub('', context).encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    Two-level in-memory cache for generated answers.
+
+    The exact level is keyed by (generation model, context hash, normalized
+    query). On an exact miss, the semantic level compares the query embedding
+    with those of cached answers for the same model, context and embedding
+    model, and reuses the closest answer if its cosine similarity is at least
+    `similarity_threshold`. Entries expire after `ttl_seconds`, and the least
+    recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=86400, similarity_threshold=0.95):
+        """
+        Args:
+            max_entries (int): Maximum number of cached answers
+            ttl_seconds (float): Age after which an answer is no longer served (None for no expiry)
+            similarity_threshold (float): Minimum query cosine similarity for a semantic hit
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # key -> (answer, normalized query embedding or None, group, created time)
+        self._entries = OrderedDict()
+        # (model, context hash, embedding model) -> keys of entries with a query embedding
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _expired(self, created, now):
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _remove(self, key):
+        _, _, group, _ = self._entries.pop(key)
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+    def _semantic_lookup(self, group, query_embedding, now):
+        keys = list(self._groups.get(group, ()))
+        for key in keys:
+            if self._expired(self._entries[key][3], now):
+                self._remove(key)
+        keys = [key for key in keys if key in self._entries]
+        if not keys:
+            return None
+        cached = np.stack([self._entries[key][1] for key in keys])
+        similarities = cached @ query_embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return keys[best]
+
+    def get(self, query, context, model_name, query_embedding=None, embedding_model=None):
+        """
+        Look up a cached answer.
+
+        Args:
+            query (str): The user's query
+            context (str): Context the answer would be generated from
+            model_name (str): Generation model name
+            query_embedding: Optional query embedding for semantic matching
+            embedding_model (str): Name of the model that produced `query_embedding`
+
+        Returns:
+            str: Cached answer, or None on a miss
+        """
+        context_hash = hash_context(context)
+        key = (model_name, context_hash, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[3], now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+
+            if query_embedding is not None:
+                group = (model_name, context_hash, embedding_model)
+                match = self._semantic_lookup(group, _normalize(query_embedding), now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    return self._entries[match][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, query, context, model_name, answer, query_embedding=None, embedding_model=None):
+        """
+        Cache a generated answer.
+
+        Args:
+            query (str): The user's query
+            context (str): Context the answer was generated from
+            model_name (str): Generation model name
+            answer (str): Generated answer
+            query_embedding: Optional query embedding for semantic matching
+            embedding_model (str): Name of the model that produced `query_embedding`
+        """
+        context_hash = hash_context(context)
+        key = (model_name, context_hash, normalize_query(query))
+        group = (model_name, context_hash, embedding_model)
+        embedding = _normalize(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, embedding, group, time.time())
+            if embedding is not None:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count, hit and miss counters, and hit rate
+        """
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else None,
+            }
+
+
+def _normalize(embedding):
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else embedding
@@ -1,7 +1,112 @@
+import numpy as np
 import pandas as pd
 import tiktoken
+import hashlib
 import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from tqdm import tqdm
+from batch_dispatcher import BatchDispatcher
+from reduction import reduce_stores, load_projection
+from dedup import split_duplicates, save_duplicates, get_duplicates_path
+from embedding_store import (save_embedding_store, load_embedding_store, store_exists, update_store_metadata, write_store_rows,
+                             hash_texts, get_store_paths, CheckpointWriter)
+
+
+# Columns that identify a row across re-scrapes, in key order
+ROW_KEY_COLUMNS = ('url', 'paragraph_number')
+
+# Maximum number of memoized token counts
+TOKEN_COUNT_CACHE_SIZE = 1000000
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+# Embedding cache lookups since the module was loaded, reported per file by process_embedding_file
+_cache_stats = {'hits': 0, 'misses': 0}
+_cache_stats_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    """
+    Get the tiktoken encoder for a model, loading it only once per process.
+    
+    Args:
+        model_name: Name of the model to use for tokenization
+    
+    Returns:
+        tiktoken.Encoding: Encoder for the model
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Fallback to a default model if the specified one is not found
+        return tiktoken.encoding_for_model("text-embedding-3-small")
+
+
+def count_tokens(cleaned_texts, model_name, num_threads=None):
+    """
+    Count tokens for a list of texts, memoizing counts by text hash.
+    
+    Only texts that have not been counted before are encoded, using
+    tiktoken's batch encoder, which runs on a pool of native threads.
+    
+    Args:
+        cleaned_texts: List of cleaned strings
+        model_name: Name of the model to use for tokenization
+        num_threads: Number of tokenizer threads (defaults to the number of cores)
+    
+    Returns:
+        List of token counts
+    """
+    encoder = get_tokenizer(model_name)
+    keys = [(encoder.name, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()) for text in cleaned_texts]
+    
+    with _token_counts_lock:
+        counts = [_token_counts.get(key) for key in keys]
+    missing = [i for i, count in enumerate(counts) if count is None]
+    
+    if missing:
+        encoded = encoder.encode_batch([cleaned_texts[i] for i in missing], num_threads=num_threads or os.cpu_count() or 1)
+        with _token_counts_lock:
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                _token_counts[keys[i]] = counts[i]
+            while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                _token_counts.popitem(last=False)
+    
+    return counts
+
+
+def iter_token_counts(cleaned_texts, model_name, block_size=1000):
+    """
+    Stream token counts so batches can be dispatched before all texts are counted.
+    
+    While one block of counts is being consumed, the next block is counted
+    in a background thread.
+    
+    Args:
+        cleaned_texts: List of cleaned strings
+        model_name: Name of the model to use for tokenization
+        block_size: Number of texts counted at a time
+    
+    Yields:
+        int: Token count for each text, in order
+    """
+    blocks = [cleaned_texts[i:i + block_size] for i in range(0, len(cleaned_texts), block_size)]
+    if not blocks:
+        return
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(count_tokens, blocks[0], model_name)
+        for next_block in blocks[1:] + [None]:
+            counts = future.result()
+            if next_block is not None:
+                future = executor.submit(count_tokens, next_block, model_name)
+            yield from counts
 
 
 def prepare_texts_and_tokens(texts, model_name):
@@ -16,83 +121,165 @@ def prepare_texts_and_tokens(texts, model_name):
         tuple: (cleaned_texts, token_counts)
     """
     # Clean texts
-    cleaned_texts = [text.replace("\n", " ") for text in texts]
-    
-    # Initialize tokenizer
-    try:
-        encoder = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        # Fallback to a default model if the specified one is not found
-        encoder = tiktoken.encoding_for_model("text-embedding-3-small")
+    cleaned_texts = clean_texts(texts)
     
     # Calculate token counts
-    token_counts = [len(encoder.encode(text)) for text in cleaned_texts]
+    token_counts = count_tokens(cleaned_texts, model_name)
     
     return cleaned_texts, token_counts
 
 
-def process_in_batches(texts, process_batch_func, model_name="text-embedding-3-small", max_tokens=300000, max_batch_size=100):
+def clean_texts(texts):
+    """
+    Clean texts before they are sent to an embedding model.
+    
+    Args:
+        texts: List of strings
+    
+    Returns:
+        List of strings with newlines replaced by spaces
+    """
+    return [text.replace("\n", " ") for text in texts]
+
+
+def embed_with_cache(texts, embed_func, model_name, cache):
+    """
+    Embed texts, sending only cache misses to `embed_func`.
+    
+    Hits and misses are added to running totals, which
+    process_embedding_file reports once per file.
+    
+    Args:
+        texts: List of cleaned strings to embed
+        embed_func: Function that embeds a list of strings
+        model_name: Name of the embedding model (part of the cache key)
+        cache: EmbeddingCache instance
+    
+    Returns:
+        List of embeddings in the same order as `texts`
+    """
+    cached = cache.get_many(model_name, texts)
+    missing_indices = [i for i, embedding in enumerate(cached) if embedding is None]
+    with _cache_stats_lock:
+        _cache_stats['hits'] += len(texts) - len(missing_indices)
+        _cache_stats['misses'] += len(missing_indices)
+    
+    embeddings = [embedding.tolist() if embedding is not None else None for embedding in cached]
+    if missing_indices:
+        # Repeated texts within one call are only embedded once
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing_indices))
+        new_embeddings = embed_func(missing_texts)
+        cache.put_many(model_name, missing_texts, new_embeddings)
+        by_text = dict(zip(missing_texts, new_embeddings))
+        for i in missing_indices:
+            embeddings[i] = by_text[texts[i]]
+    
+    return embeddings
+
+
+def build_batches(cleaned_texts, token_counts, max_tokens=300000, max_batch_size=100):
+    """
+    Group texts into batches that respect token and size limits.
+    
+    Args:
+        cleaned_texts: List of cleaned strings
+        token_counts: Token count for each string
+        max_tokens: Maximum tokens per API request
+        max_batch_size: Maximum number of texts per batch
+    
+    Yields:
+        tuple: (batch_texts, batch_token_count)
+    """
+    current_batch = []
+    current_token_count = 0
+    
+    for text, token_count in zip(cleaned_texts, token_counts):
+        if current_batch and (current_token_count + token_count > max_tokens or len(current_batch) >= max_batch_size):
+            yield current_batch, current_token_count
+            # Reset batch
+            current_batch = []
+            current_token_count = 0
+        current_batch.append(text)
+        current_token_count += token_count
+    
+    # Final batch
+    if current_batch:
+        yield current_batch, current_token_count
+
+
+def process_in_batches(texts, process_batch_func, model_name="text-embedding-3-small", max_tokens=300000, max_batch_size=100,
+                       cache=None, max_in_flight=4, requests_per_minute=None, tokens_per_minute=None, max_retries=5):
     """
     Process texts in batches, respecting token limits.
     
+    Batches are sent concurrently through a BatchDispatcher, which limits the
+    number of in-flight requests, applies request and token rate limits,
+    retries 429/5xx errors with jittered backoff and keeps the original order.
+    
     Args:
         texts: List of strings to embed
         process_batch_func: Function to process a batch of texts
         model_name: Name of the model to use for tokenization
         max_tokens: Maximum tokens per API request
         max_batch_size: Maximum number of texts per batch
+        cache: Optional EmbeddingCache; only texts missing from it are sent to the provider
+        max_in_flight: Maximum number of batches being processed at once
+        requests_per_minute: Request rate limit (None for no limit)
+        tokens_per_minute: Input token rate limit (None for no limit)
+        max_retries: Retries per batch for transient errors
     
     Returns:
         List of embeddings
     """
-    # Prepare texts and calculate token counts
-    cleaned_texts, token_counts = prepare_texts_and_tokens(texts, model_name)
+    dispatcher_options = dict(max_in_flight=max_in_flight, requests_per_minute=requests_per_minute,
+                              tokens_per_minute=tokens_per_minute, max_retries=max_retries)
+    if cache is not None:
+        return embed_with_cache(
+            clean_texts(texts),
+            lambda missing: process_in_batches(missing, process_batch_func, model_name, max_tokens, max_batch_size, **dispatcher_options),
+            model_name,
+            cache
+        )
     
-    embeddings = []
-    current_batch = []
-    current_token_count = 0
+    # Token counts are produced lazily, so the first batch goes out before all texts are counted
+    cleaned_texts = clean_texts(texts)
+    token_counts = iter_token_counts(cleaned_texts, model_name)
     
     # Initialize progress bar
     pbar = tqdm(total=len(cleaned_texts), desc="Processing texts")
     
-    for i, (text, token_count) in enumerate(zip(cleaned_texts, token_counts)):
-        if current_token_count + token_count > max_tokens or len(current_batch) >= max_batch_size:
-            # Process current batch
-            batch_embeddings = process_batch_func(current_batch)
-            embeddings.extend(batch_embeddings)
-            # Update progress bar
-            pbar.update(len(current_batch))
-            # Reset batch
-            current_batch = [text]
-            current_token_count = token_count
-        else:
-            current_batch.append(text)
-            current_token_count += token_count
-    
-    # Process final batch
-    if current_batch:
-        batch_embeddings = process_batch_func(current_batch)
-        embeddings.extend(batch_embeddings)
-        # Update progress bar for final batch
-        pbar.update(len(current_batch))
+    dispatcher = BatchDispatcher(process_batch_func, **dispatcher_options)
+    embeddings = dispatcher.run(build_batches(cleaned_texts, token_counts, max_tokens, max_batch_size), on_batch_done=pbar.update)
     
     # Close progress bar
     pbar.close()
     
     return embeddings
-def process_all_at_once(texts, process_func):
+
+
+def process_all_at_once(texts, process_func, model_name=None, cache=None):
     """
     Process all texts at once with models that handle batching internally.
     
-{{ ... }}
+    Args:
         texts: List of strings to embed
         process_func: Function to process all texts at once
+        model_name: Name of the embedding model (required when `cache` is given)
+        cache: Optional EmbeddingCache; only texts missing from it are sent to the model
     
     Returns:
         List of embeddings
     """
     # Clean texts
-    cleaned_texts = [text.replace("\n", " ") for text in texts]
+    cleaned_texts = clean_texts(texts)
+    
+    if cache is not None:
+        return embed_with_cache(
+            cleaned_texts,
+            lambda missing: process_all_at_once(missing, process_func),
+            model_name,
+            cache
+        )
     
     # Initialize progress bar
     pbar = tqdm(total=1, desc="Processing all texts")
@@ -108,24 +295,227 @@ def process_all_at_once(texts, process_func):
 
 def save_embeddings_to_csv(texts, embeddings, output_file):
     """
-    Save texts and their embeddings to a CSV file.
+    Save texts and their embeddings as a binary embedding store.
+    
+    The texts are written to `<base>_meta.csv` and the embeddings to a
+    float32 matrix in `<base>.npy` (see embedding_store.py).
     
     Args:
         texts: List of original texts
         embeddings: List of embeddings
-        output_file: Path to the output CSV file
+        output_file: Base path of the output store
+    """
+    df = pd.DataFrame({'text': texts})
+    save_embedding_store(df, embeddings, output_file)
+
+
+def get_row_keys(df):
     """
-    df = pd.DataFrame({
-        'text': texts,
-        'embedding': embeddings
-    })
-    df.to_csv(output_file, index=False)
+    Get a stable identity for each row that does not depend on its position.
+    
+    Paragraphs are identified by (`url`, `paragraph_number`) and talks by
+    `url`. Rows without a `url` column are identified by their text hash.
+    
+    Args:
+        df: Rows with a `text_hash` column
     
+    Returns:
+        List with one hashable key per row
+    """
+    if 'url' not in df.columns:
+        return df['text_hash'].tolist()
+    columns = [column for column in ROW_KEY_COLUMNS if column in df.columns]
+    return list(zip(*(df[column].astype(str) for column in columns)))
+
 
-def process_csv_files(input_talks_file, input_paragraphs_file, output_dir, process_func, prefix, resume=True, chunk_size=100):
+def match_existing_rows(df, keys, sources):
+    """
+    Find an existing embedding for every row whose key and text are unchanged.
+    
+    Args:
+        df: Input rows with a `text_hash` column
+        keys: Key of each input row (see get_row_keys)
+        sources: Metadata DataFrames of the existing embeddings; later ones take precedence
+    
+    Returns:
+        tuple: (source_ids, row_ids) arrays with the source and row of each
+            input row's embedding, -1 where it has to be embedded
+    """
+    lookup = {}
+    for source_id, source_df in enumerate(sources):
+        if 'text_hash' not in source_df.columns:
+            # Stores written before rows were keyed
+            source_df = source_df.assign(text_hash=hash_texts(source_df['text'].fillna('').tolist()))
+        for row, entry in enumerate(zip(get_row_keys(source_df), source_df['text_hash'])):
+            lookup[entry] = (source_id, row)
+    
+    source_ids = np.full(len(df), -1, dtype=np.int64)
+    row_ids = np.full(len(df), -1, dtype=np.int64)
+    for i, entry in enumerate(zip(keys, df['text_hash'])):
+        source_ids[i], row_ids[i] = lookup.get(entry, (-1, -1))
+    return source_ids, row_ids
+
+
+def upsert_store(df, output_file, checkpoint, keys=None, use_store=True):
+    """
+    Write a store from the existing store's embeddings and a checkpoint of new ones.
+    
+    Every row of `df` takes its embedding from the checkpoint (newly embedded
+    rows, projected like the store if it was reduced) or from the existing
+    store, matched by key and text hash (see match_existing_rows). If every
+    row is unchanged and in place, only the metadata is rewritten. The
+    checkpoint is removed once the store is written.
+    
+    Args:
+        df: Rows of the new store, in order, with a `text_hash` column
+        output_file: Base path of the store
+        checkpoint (CheckpointWriter): Checkpoint holding the newly embedded rows
+        keys: Key of each row (defaults to get_row_keys(df))
+        use_store: Whether embeddings from the existing store are reused
+    
+    Returns:
+        tuple: (embeddings_path, metadata_path, whether the matrix was rewritten)
+    """
+    if keys is None:
+        keys = get_row_keys(df)
+    sources, matrices = [], []
+    has_store = use_store and store_exists(output_file)
+    if has_store:
+        df_existing, existing_embeddings = load_embedding_store(output_file)
+        sources.append(df_existing)
+        matrices.append(existing_embeddings)
+    if checkpoint.row_count:
+        df_checkpoint, checkpoint_embeddings = checkpoint.load()
+        projection = load_projection(output_file) if has_store else None
+        if projection is not None:
+            checkpoint_embeddings = projection.transform(checkpoint_embeddings)
+        sources.append(df_checkpoint)
+        matrices.append(checkpoint_embeddings)
+    
+    source_ids, row_ids = match_existing_rows(df, keys, sources)
+    if np.any(source_ids < 0):
+        raise ValueError(f"{int(np.sum(source_ids < 0))} rows of {output_file} have no embedding")
+    
+    if has_store and checkpoint.row_count == 0 and np.array_equal(row_ids, np.arange(len(existing_embeddings))):
+        update_store_metadata(df, output_file)
+        embeddings_path, metadata_path = get_store_paths(output_file)
+        rewritten = False
+    else:
+        embeddings_path, metadata_path = write_store_rows(df, matrices, source_ids, row_ids, output_file,
+                                                          dtype=matrices[0].dtype)
+        rewritten = True
+    if CheckpointWriter.exists(output_file):
+        shutil.rmtree(checkpoint.shard_dir)
+    return embeddings_path, metadata_path, rewritten
+
+
+def process_embedding_file(input_file, output_file, process_func, label, resume=True, chunk_size=100, dedup_threshold=0):
+    """
+    Generate embeddings for one CSV file, embedding only new or changed rows.
+    
+    Rows are identified by a stable key (see get_row_keys) and a hash of
+    their text, saved as a `text_hash` column. Embeddings of rows whose key
+    and text are unchanged are reused from the existing store, or from the
+    checkpoint of an interrupted run. Only the remaining rows are embedded,
+    and each chunk is appended to a sharded checkpoint (see CheckpointWriter).
+    The store is then rewritten in input order. This drops rows that were
+    removed from the input, and the rewrite copies vectors without embedding
+    them again. If every row is unchanged and in place, only the metadata is
+    rewritten. New embeddings are projected like the rest of the store if
+    it was reduced (see reduction.py).
+    
+    With a dedup threshold, exact and near-duplicate rows (see dedup.py) are
+    not embedded: the store holds one row per distinct text, with a
+    `duplicate_count` column, and the duplicate rows are saved to
+    `<base>_duplicates.csv` with the store row they share (`dup_of`).
+    
+    Args:
+        input_file: Path to the input CSV file with a `text` column
+        output_file: Base path of the output embedding store
+        process_func: Function to process texts and generate embeddings
+        label: Name used in progress messages (e.g. "talks")
+        resume: Whether to reuse embeddings from an existing checkpoint or output store
+        chunk_size: Number of texts to process before saving
+        dedup_threshold: Jaccard similarity at which rows are embedded once (0 to embed every row)
+    """
+    df = pd.read_csv(input_file)
+    if dedup_threshold:
+        df, duplicates = split_duplicates(df, dedup_threshold)
+        save_duplicates(duplicates, output_file)
+        print(f"Deduplicated {label}: {len(df)} distinct rows, {len(duplicates)} duplicates not embedded")
+    elif os.path.exists(get_duplicates_path(output_file)):
+        os.remove(get_duplicates_path(output_file))
+    df['text_hash'] = hash_texts(df['text'].fillna('').tolist())
+    keys = get_row_keys(df)
+    texts = df['text'].tolist()
+    total_count = len(texts)
+    
+    if total_count == 0:
+        print(f"No {label} to process")
+        return
+    
+    if not resume and CheckpointWriter.exists(output_file):
+        shutil.rmtree(CheckpointWriter(output_file).shard_dir)
+    checkpoint = CheckpointWriter(output_file)
+    
+    # Embeddings that can be reused: the existing store, then rows embedded by an interrupted run
+    sources = []
+    has_store = resume and store_exists(output_file)
+    if has_store:
+        df_existing, _ = load_embedding_store(output_file)
+        sources.append(df_existing)
+    if checkpoint.row_count:
+        print(f"Resuming from checkpoint {checkpoint.manifest_path}")
+        df_checkpoint, _ = checkpoint.load()
+        sources.append(df_checkpoint)
+    
+    source_ids, row_ids = match_existing_rows(df, keys, sources)
+    missing = np.flatnonzero(source_ids < 0)
+    if has_store:
+        removed = len(df_existing) - len(np.unique(row_ids[source_ids == 0]))
+        print(f"{label.capitalize()}: {total_count - len(missing)} unchanged, "
+              f"{len(missing)} new or changed, {removed} removed")
+    
+    # Progress bar for the rows that need embeddings
+    pbar = tqdm(total=len(missing), desc=f"Processing {label}")
+    cache_stats_start = dict(_cache_stats)
+    
+    # Process them in chunks
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        chunk_embeddings = process_func([texts[j] for j in chunk])
+        
+        # Save progress incrementally as one new shard
+        checkpoint.append(df.iloc[chunk], chunk_embeddings)
+        
+        # Update progress bar, with the cache hits and misses of this file so far
+        cache_hits, cache_misses = (_cache_stats[name] - cache_stats_start[name] for name in ('hits', 'misses'))
+        if cache_hits or cache_misses:
+            pbar.set_postfix(cache_hits=cache_hits, cache_misses=cache_misses, refresh=False)
+        pbar.update(len(chunk))
+    
+    pbar.close()
+    cache_hits, cache_misses = (_cache_stats[name] - cache_stats_start[name] for name in ('hits', 'misses'))
+    if cache_hits or cache_misses:
+        print(f"Embedding cache: {cache_hits} hits, {cache_misses} misses")
+    
+    embeddings_path, metadata_path, rewritten = upsert_store(df, output_file, checkpoint, keys=keys,
+                                                             use_store=has_store)
+    if rewritten:
+        print(f"Saved {label} embeddings to {embeddings_path} and {metadata_path}")
+    else:
+        print(f"{label.capitalize()} embeddings are up to date ({total_count} records)")
+
+
+def process_csv_files(input_talks_file, input_paragraphs_file, output_dir, process_func, prefix, resume=True, chunk_size=100,
+                      reduction=None, dedup_threshold=0):
     """
     Process CSV files and generate embeddings with incremental saving.
     
+    Outputs are written as embedding stores: `<prefix>_talks.npy` with
+    `<prefix>_talks_meta.csv`, and `<prefix>_paragraphs.npy` with
+    `<prefix>_paragraphs_meta.csv`.
+    
     Args:
         input_talks_file: Path to the talks CSV file
         input_paragraphs_file: Path to the paragraphs CSV file
@@ -134,184 +524,34 @@ def process_csv_files(input_talks_file, input_paragraphs_file, output_dir, proce
         prefix: Prefix for output files
         resume: Whether to resume from existing output files if they exist
         chunk_size: Number of texts to process before saving
+        reduction: Optional (method, dimensions) to reduce the finished stores to
+            ("pca" or "truncate", see reduction.py); an empty method keeps full embeddings
+        dedup_threshold: Jaccard similarity at which duplicate rows are embedded once
+            (see dedup.py); 0 embeds every row
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    files_processed = 0
+    output_files = []
     
-    # Process talks.csv
-    if os.path.exists(input_talks_file):
-        df_talks = pd.read_csv(input_talks_file)
-        output_talks = os.path.join(output_dir, f'{prefix}_talks.csv')
-        
-        # Check if we should resume from existing output
-        if resume and os.path.exists(output_talks):
-            print(f"Resuming from existing {output_talks}")
-            df_output_talks = pd.read_csv(output_talks)
-            processed_count = len(df_output_talks)
-            total_count = len(df_talks)
-            
-            if processed_count < total_count:
-                print(f"Resuming talks processing from record {processed_count}/{total_count}")
-                # Process in chunks with incremental saving
-                texts = df_talks['text'].tolist()
-                all_embeddings = df_output_talks['embedding'].tolist() if 'embedding' in df_output_talks.columns else []
-                
-                # Progress bar for remaining texts
-                pbar = tqdm(total=total_count, desc="Processing talks", initial=processed_count)
-                
-                # Process remaining texts in chunks
-                for i in range(processed_count, total_count, chunk_size):
-                    chunk_end = min(i + chunk_size, total_count)
-                    chunk_texts = texts[i:chunk_end]
-                    chunk_embeddings = process_func(chunk_texts)
-                    all_embeddings.extend(chunk_embeddings)
-                    
-                    # Update progress bar
-                    pbar.update(len(chunk_texts))
-                    
-                    # Save progress incrementally
-                    df_talks_partial = df_talks.copy()
-                    df_talks_partial['embedding'] = all_embeddings + [None] * (len(df_talks_partial) - len(all_embeddings))
-                    # Only keep rows that have embeddings
-                    df_talks_partial = df_talks_partial.iloc[:len(all_embeddings)]
-                    df_talks_partial.to_csv(output_talks, index=False)
-                
-                pbar.close()
-                
-                # Final save with all embeddings
-                df_talks['embedding'] = all_embeddings
-                df_talks.to_csv(output_talks, index=False)
-                print(f"Saved talks embeddings to {output_talks}")
-            else:
-                print(f"Talks processing already complete ({processed_count} records)")
-                df_talks = df_output_talks  # Use existing data
+    for input_file, label in [(input_talks_file, 'talks'), (input_paragraphs_file, 'paragraphs')]:
+        if os.path.exists(input_file):
+            output_file = os.path.join(output_dir, f'{prefix}_{label}')
+            process_embedding_file(input_file, output_file, process_func, label, resume=resume, chunk_size=chunk_size,
+                                   dedup_threshold=dedup_threshold)
+            output_files.append(output_file)
         else:
-            # Process all texts in chunks with incremental saving
-            texts = df_talks['text'].tolist()
-            total_count = len(texts)
-            all_embeddings = []
-            
-            # Progress bar for all texts
-            pbar = tqdm(total=total_count, desc="Processing talks")
-            
-            # Process texts in chunks
-            for i in range(0, total_count, chunk_size):
-                chunk_end = min(i + chunk_size, total_count)
-                chunk_texts = texts[i:chunk_end]
-                chunk_embeddings = process_func(chunk_texts)
-                all_embeddings.extend(chunk_embeddings)
-                
-                # Update progress bar
-                pbar.update(len(chunk_texts))
-                
-                # Save progress incrementally
-                df_talks_partial = df_talks.copy()
-                df_talks_partial['embedding'] = all_embeddings + [None] * (len(df_talks_partial) - len(all_embeddings))
-                # Only keep rows that have embeddings
-                df_talks_partial = df_talks_partial.iloc[:len(all_embeddings)]
-                df_talks_partial.to_csv(output_talks, index=False)
-            
-            pbar.close()
-            
-            # Final save with all embeddings
-            df_talks['embedding'] = all_embeddings
-            df_talks.to_csv(output_talks, index=False)
-            print(f"Saved talks embeddings to {output_talks}")
-        
-        files_processed += 1
-    else:
-        print(f"Warning: {input_talks_file} not found, skipping...")
+            print(f"Warning: {input_file} not found, skipping...")
     
-    # Process paragraphs.csv
-    if os.path.exists(input_paragraphs_file):
-        df_paragraphs = pd.read_csv(input_paragraphs_file)
-        output_paragraphs = os.path.join(output_dir, f'{prefix}_paragraphs.csv')
-        
-        # Check if we should resume from existing output
-        if resume and os.path.exists(output_paragraphs):
-            print(f"Resuming from existing {output_paragraphs}")
-            df_output_paragraphs = pd.read_csv(output_paragraphs)
-            processed_count = len(df_output_paragraphs)
-            total_count = len(df_paragraphs)
-            
-            if processed_count < total_count:
-                print(f"Resuming paragraphs processing from record {processed_count}/{total_count}")
-                # Process in chunks with incremental saving
-                texts = df_paragraphs['text'].tolist()
-                all_embeddings = df_output_paragraphs['embedding'].tolist() if 'embedding' in df_output_paragraphs.columns else []
-                
-                # Progress bar for remaining texts
-                pbar = tqdm(total=total_count, desc="Processing paragraphs", initial=processed_count)
-                
-                # Process remaining texts in chunks
-                for i in range(processed_count, total_count, chunk_size):
-                    chunk_end = min(i + chunk_size, total_count)
-                    chunk_texts = texts[i:chunk_end]
-                    chunk_embeddings = process_func(chunk_texts)
-                    all_embeddings.extend(chunk_embeddings)
-                    
-                    # Update progress bar
-                    pbar.update(len(chunk_texts))
-                    
-                    # Save progress incrementally
-                    df_paragraphs_partial = df_paragraphs.copy()
-                    df_paragraphs_partial['embedding'] = all_embeddings + [None] * (len(df_paragraphs_partial) - len(all_embeddings))
-                    # Only keep rows that have embeddings
-                    df_paragraphs_partial = df_paragraphs_partial.iloc[:len(all_embeddings)]
-                    df_paragraphs_partial.to_csv(output_paragraphs, index=False)
-                
-                pbar.close()
-                
-                # Final save with all embeddings
-                df_paragraphs['embedding'] = all_embeddings
-                df_paragraphs.to_csv(output_paragraphs, index=False)
-                print(f"Saved paragraphs embeddings to {output_paragraphs}")
-            else:
-                print(f"Paragraphs processing already complete ({processed_count} records)")
-                df_paragraphs = df_output_paragraphs  # Use existing data
-        else:
-            # Process all texts in chunks with incremental saving
-            texts = df_paragraphs['text'].tolist()
-            total_count = len(texts)
-            all_embeddings = []
-            
-            # Progress bar for all texts
-            pbar = tqdm(total=total_count, desc="Processing paragraphs")
-            
-            # Process texts in chunks
-            for i in range(0, total_count, chunk_size):
-                chunk_end = min(i + chunk_size, total_count)
-                chunk_texts = texts[i:chunk_end]
-                chunk_embeddings = process_func(chunk_texts)
-                all_embeddings.extend(chunk_embeddings)
-                
-                # Update progress bar
-                pbar.update(len(chunk_texts))
-                
-                # Save progress incrementally
-                df_paragraphs_partial = df_paragraphs.copy()
-                df_paragraphs_partial['embedding'] = all_embeddings + [None] * (len(df_paragraphs_partial) - len(all_embeddings))
-                # Only keep rows that have embeddings
-                df_paragraphs_partial = df_paragraphs_partial.iloc[:len(all_embeddings)]
-                df_paragraphs_partial.to_csv(output_paragraphs, index=False)
-            
-            pbar.close()
-            
-            # Final save with all embeddings
-            df_paragraphs['embedding'] = all_embeddings
-            df_paragraphs.to_csv(output_paragraphs, index=False)
-            print(f"Saved paragraphs embeddings to {output_paragraphs}")
-        
-        files_processed += 1
-    else:
-        print(f"Warning: {input_paragraphs_file} not found, skipping...")
-    
-    if files_processed == 0:
+    if not output_files:
         print("No input files found. Please make sure SCRAPED_TALKS.csv and/or SCRAPED_PARAGRAPHS.csv exist.")
         return
     
+    if reduction and reduction[0]:
+        method, dimensions = reduction
+        # Fit on the paragraphs, the larger corpus, and share the projection with the talks
+        reduce_stores(sorted(output_files, key=lambda path: not path.endswith('_paragraphs')), dimensions, method=method)
+    
     # Delete input files
     # for file_to_delete in [input_talks_file, input_paragraphs_file]:
     #     if os.path.exists(file_to_delete):
@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# HTTP status codes that are worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Exception class names used by the OpenAI and Google SDKs for transient failures
+RETRYABLE_ERROR_NAMES = {
+    'RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+    'TooManyRequests', 'ResourceExhausted', 'ServiceUnavailable',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway',
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously at a per-minute rate.
+
+    Used both for requests per minute (one token per request) and for tokens
+    per minute (one token per input token).
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Args:
+            rate_per_minute (float): Number of tokens added per minute
+            capacity (float): Maximum burst size (defaults to one minute's worth)
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Block until `amount` tokens are available, then take them.
+
+        Requests larger than the bucket capacity are clamped to the capacity so
+        they can still go through once the bucket is full.
+
+        Args:
+            amount (float): Number of tokens to take
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate_per_second)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait_time = (amount - self.available) / self.rate_per_second
+            time.sleep(wait_time)
+
+
+def get_status_code(error):
+    """
+    Extract an HTTP status code from an SDK exception, if it has one.
+
+    Args:
+        error (Exception): Exception raised by a provider SDK
+
+    Returns:
+        int: Status code, or None if none could be found
+    """
+    for attr in ('status_code', 'http_status', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+        # google.api_core exceptions expose an HTTPStatus enum
+        if value is not None and hasattr(value, 'value') and isinstance(value.value, int):
+            return value.value
+    response = getattr(error, 'response', None)
+    if response is not None and isinstance(getattr(response, 'status_code', None), int):
+        return response.status_code
+    return None
+
+
+def is_retryable_error(error):
+    """
+    Decide whether a failed request should be retried (429, 5xx and timeouts).
+
+    Args:
+        error (Exception): Exception raised by a provider SDK
+
+    Returns:
+        bool: True if the request should be retried
+    """
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def call_with_retry(func, *args, max_retries=5, base_delay=1.0, max_delay=60.0, before_attempt=None):
+    """
+    Call `func(*args)`, retrying transient errors with jittered exponential backoff.
+
+    Args:
+        func: Function to call
+        *args: Arguments for `func`
+        max_retries (int): Number of retries after the first attempt
+        base_delay (float): Backoff base in seconds
+        max_delay (float): Upper bound on a single backoff in seconds
+        before_attempt: Optional callable run before every attempt (e.g. rate limiting)
+
+    Returns:
+        Whatever `func` returns
+    """
+    for attempt in range(max_retries + 1):
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            # Full jitter: sleep a random time up to the exponential backoff
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            print(f"Retryable error ({e}); retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+
+class BatchDispatcher:
+    """
+    Run `process_batch_func` on many batches concurrently.
+
+    Keeps at most `max_in_flight` batches in flight, waits on request-per-minute
+    and token-per-minute buckets before every attempt, retries 429/5xx errors
+    with jittered backoff, and returns results in the original batch order.
+    """
+
+    def __init__(self, process_batch_func, max_in_flight=4, requests_per_minute=None, tokens_per_minute=None, max_retries=5):
+        """
+        Args:
+            process_batch_func: Function that embeds a list of texts
+            max_in_flight (int): Maximum number of batches being processed at once
+            requests_per_minute (float): Request rate limit (None for no limit)
+            tokens_per_minute (float): Input token rate limit (None for no limit)
+            max_retries (int): Retries per batch for transient errors
+        """
+        self.process_batch_func = process_batch_func
+        self.max_in_flight = max(1, max_in_flight)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+
+    def _run_batch(self, batch, token_count):
+        def before_attempt():
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(token_count)
+
+        return call_with_retry(self.process_batch_func, batch, max_retries=self.max_retries, before_attempt=before_attempt)
+
+    def run(self, batches, on_batch_done=None):
+        """
+        Process batches and return their results in order.
+
+        Args:
+            batches: Iterable of (texts, token_count) tuples; may be a generator
+            on_batch_done: Optional callback called with the size of each finished batch
+
+        Returns:
+            List of embeddings, concatenated in batch order
+        """
+        results = {}
+        pending = {}
+        batch_index = 0
+
+        def collect(done):
+            for future in done:
+                index, size = pending.pop(future)
+                results[index] = future.result()
+                if on_batch_done is not None:
+                    on_batch_done(size)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            try:
+                for batch, token_count in batches:
+                    if len(pending) >= self.max_in_flight:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future = executor.submit(self._run_batch, batch, token_count)
+                    pending[future] = (batch_index, len(batch))
+                    batch_index += 1
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        embeddings = []
+        for index in range(batch_index):
+            embeddings.extend(results[index])
+        return embeddings
@@ -1,11 +1,13 @@
 import pandas as pd
 import numpy as np
 from sklearn.cluster import KMeans
-import ast
 import logging
 from datetime import datetime
 from sklearn.metrics.pairwise import cosine_similarity
 import os
+from embedding_store import load_embeddings, save_embedding_store, get_store_paths
+from reduction import load_projection, get_projection_path
+from dedup import load_duplicates, expand_duplicates
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,37 +18,37 @@ def cluster_paragraph_embeddings(csv_file, k, prefix):
     within each talk and using cluster centroids as the new embeddings.
     
     Parameters:
-    - csv_file: Path to CSV file containing paragraph embeddings
+    - csv_file: Paragraph embeddings store (or legacy CSV) inside the `prefix` directory
     - k: Number of clusters (default=3)
     
     Returns:
     - DataFrame containing cluster embeddings and metadata
     """
     try:
-        # Load the paragraph embeddings CSV
+        # Load the paragraph metadata and memory-mapped embedding matrix
         open_file = os.path.join(prefix, csv_file)
-        df = pd.read_csv(open_file)
-        logging.info(f"Loaded CSV with {len(df)} paragraphs")
+        df, paragraph_embeddings = load_embeddings(open_file)
+        # A deduplicated store keeps one row per text; restore every talk's own paragraphs
+        df = expand_duplicates(df, load_duplicates(open_file))
+        logging.info(f"Loaded {len(df)} paragraphs")
 
         # Validate required columns
-        required_columns = ['url', 'embedding', 'title', 'speaker', 'calling', 'year', 'season']
+        required_columns = ['url', 'title', 'speaker', 'calling', 'year', 'season']
         if not all(col in df.columns for col in required_columns):
             missing = [col for col in required_columns if col not in df.columns]
             raise ValueError(f"Missing required columns: {missing}")
 
-        # Convert string embeddings to numpy arrays
-        df['embedding'] = df['embedding'].apply(lambda x: np.array(ast.literal_eval(x)))
-        
         # Group paragraphs by talk (using url as unique identifier for talks)
         grouped = df.groupby('url')
         cluster_data = []
+        cluster_embeddings = []
         
         for talk_url, group in grouped:
             # Extract metadata for the talk
             talk_info = group.iloc[0][['title', 'speaker', 'calling', 'year', 'season', 'url']].to_dict()
             
             # Get all embeddings for the talk
-            embeddings = np.stack(group['embedding'].values)
+            embeddings = np.asarray(paragraph_embeddings[group['row'].values])
             paragraph_texts = group['text'].values
             
             # Check if there are enough paragraphs for clustering
@@ -78,9 +80,9 @@ def cluster_paragraph_embeddings(csv_file, k, prefix):
                     'season': talk_info['season'],
                     'url': talk_info['url'],
                     'cluster_id': cluster_idx + 1,
-                    'text': top_paragraphs,
-                    'embedding': cluster_centroid.tolist()
+                    'text': top_paragraphs
                 })
+                cluster_embeddings.append(cluster_centroid)
             
             # logging.info(f"Generated {k} cluster embeddings for talk: {talk_info['title']} ({talk_url})")
         
@@ -90,11 +92,17 @@ def cluster_paragraph_embeddings(csv_file, k, prefix):
         
         cluster_df = pd.DataFrame(cluster_data)
         
-        # Save to CSV
-        output_file = prefix + '_' + str(k) + '_clusters.csv'
-        cluster_df.to_csv(os.path.join(prefix, output_file), index=False)
-        logging.info(f"Cluster embeddings saved to {output_file}")
+        # Save as an embedding store
+        output_file = os.path.join(prefix, prefix + '_' + str(k) + '_clusters')
+        save_embedding_store(cluster_df, cluster_embeddings, output_file)
+        logging.info(f"Cluster embeddings saved to {', '.join(get_store_paths(output_file))}")
+        
+        # Centroids of reduced paragraphs live in the same reduced space
+        projection = load_projection(open_file)
+        if projection is not None:
+            projection.save(get_projection_path(output_file))
         
+        cluster_df['embedding'] = cluster_embeddings
         return cluster_df
     
     except Exception as e:
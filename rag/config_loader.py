@@ -106,3 +106,154 @@ def get_google_ai_key(config):
     if not google_ai_key or google_ai_key == "insert your Google AI API key here":
         raise ValueError("Google AI API key not found in config.json. Please add your API key as 'googleAiKey'.")
     return google_ai_key
+
+def get_embedding_cache_path(config):
+    """
+    Get the embedding cache database path from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        str: Path to the SQLite cache file (empty string disables the cache)
+    """
+    return config.get("embeddingCachePath", "embedding_cache.sqlite")
+
+def get_embedding_cache_max_entries(config):
+    """
+    Get the maximum number of cached embeddings from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        int: Maximum number of entries kept before least recently used ones are evicted
+    """
+    return config.get("embeddingCacheMaxEntries", 1000000)
+
+def get_query_cache_memory_entries(config):
+    """
+    Get the number of query embeddings kept in memory from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        int: Maximum number of query embeddings held in the in-memory cache
+    """
+    return config.get("queryCacheMemoryEntries", 1024)
+
+def get_search_server_address(config):
+    """
+    Get the host and port the search server listens on from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        tuple: (host, port)
+    """
+    return config.get("searchServerHost", "127.0.0.1"), config.get("searchServerPort", 8000)
+
+def get_search_server_batching(config):
+    """
+    Get the search server's query micro-batching limits from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        tuple: (max batch size, max wait in milliseconds for a batch to fill)
+    """
+    return config.get("searchServerMaxBatchSize", 32), config.get("searchServerMaxWaitMs", 5)
+
+def get_generation_max_in_flight(config):
+    """
+    Get the maximum number of concurrent answer generation calls from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        int: Maximum number of generate_content calls in flight at once
+    """
+    return config.get("generationMaxInFlight", 8)
+
+def get_generation_timeout(config):
+    """
+    Get the per-call answer generation timeout from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        float: Timeout in seconds for one generate_content call
+    """
+    return config.get("generationTimeoutSeconds", 60)
+
+def get_answer_cache_settings(config):
+    """
+    Get the answer cache settings from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        tuple: (maximum number of cached answers (0 disables the cache), TTL in seconds,
+            minimum query similarity for a semantic hit)
+    """
+    return (config.get("answerCacheMaxEntries", 1000),
+            config.get("answerCacheTtlSeconds", 86400),
+            config.get("answerCacheSimilarityThreshold", 0.95))
+
+def get_max_context_tokens(config):
+    """
+    Get the token budget for RAG prompt context from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        int: Maximum number of context tokens packed into a generation prompt
+    """
+    return config.get("maxContextTokens", 3000)
+
+def get_embedding_reduction(config):
+    """
+    Get the optional dimension reduction applied to stored embeddings from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        tuple: (method, dimensions); method is "pca", "truncate", or "" for no reduction
+    """
+    return config.get("reductionMethod", ""), config.get("reductionDimensions", 256)
+
+def get_dedup_threshold(config):
+    """
+    Get the near-duplicate threshold used before embedding from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        float: Jaccard similarity at which texts are embedded once (1.0 for exact
+            duplicates only, 0 to embed every row)
+    """
+    return config.get("dedupThreshold", 0)
+
+def get_pipeline_settings(config):
+    """
+    Get the streaming pipeline settings from configuration.
+    
+    Args:
+        config (dict): Configuration data
+    
+    Returns:
+        tuple: (capacity of each queue between stages, number of concurrent page
+            downloads, maximum number of texts per embedding call)
+    """
+    return (config.get("pipelineQueueSize", 64),
+            config.get("pipelineFetchWorkers", 10),
+            config.get("pipelineEmbedBatchSize", 100))
@@ -0,0 +1,143 @@
+import ast
+import re
+from base_embedding import count_tokens
+
+# Tokenizer used to measure prompts; close enough for budgeting other providers' models
+CONTEXT_TOKENIZER_MODEL = "gpt-4o"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def split_passages(row, data_type):
+    """
+    Split one search result into passages at paragraph boundaries.
+
+    Args:
+        row: Result row with a `text` column
+        data_type (str): Type of data (clusters, paragraphs, talks)
+
+    Returns:
+        list: Non-empty passage strings, in their original order
+    """
+    text = row.get('text')
+    if not isinstance(text, str):
+        return []
+    if data_type == "clusters":
+        # For clusters, text is a list of paragraphs
+        try:
+            passages = [str(paragraph) for paragraph in ast.literal_eval(text)]
+        except (ValueError, SyntaxError):
+            passages = [text]
+    elif data_type == "talks":
+        # Talk texts are paragraphs separated by blank lines (see scraper.py)
+        passages = text.split('\n\n')
+    else:
+        passages = [text]
+    return [passage.strip() for passage in passages if passage.strip()]
+
+
+def shingles(text, size=3):
+    """
+    Get the set of word n-grams of a text, for near-duplicate detection.
+
+    Args:
+        text (str): Passage text
+        size (int): Words per shingle
+
+    Returns:
+        set: Word n-gram tuples (the whole text as one shingle if it is shorter)
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def is_near_duplicate(candidate, kept, threshold=0.8):
+    """
+    Check whether most of a passage is already contained in a kept passage.
+
+    Args:
+        candidate (set): Shingles of the new passage
+        kept (list): Shingle sets of passages already in the context
+        threshold (float): Fraction of the candidate's shingles that must appear in one kept passage
+
+    Returns:
+        bool: True if the candidate adds little new text
+    """
+    if not candidate:
+        return True
+    return any(len(candidate & other) >= threshold * len(candidate) for other in kept)
+
+
+def format_header(rank, row):
+    header = f"\nResult {rank} (Similarity: {row['similarity']:.4f})\n"
+    header += f"Title: {row['title']}\n"
+    header += f"Speaker: {row['speaker']}\n"
+    if 'year' in row and 'season' in row:
+        header += f"Year: {row['year']} {row['season']}\n"
+    return header + "Content:\n"
+
+
+def pack_context(result_sets, max_tokens=3000, duplicate_threshold=0.8, model_name=CONTEXT_TOKENIZER_MODEL):
+    """
+    Build a prompt context from search results within a token budget.
+
+    Results from all sets are taken in descending similarity order. Each
+    result contributes its header and as many of its paragraphs, in order,
+    as fit in the remaining budget; text is never cut inside a paragraph.
+    Passages that are near-duplicates of ones already packed (for example
+    the same paragraph returned as a paragraph hit and inside a talk) are
+    skipped. A result with no new passages is left out entirely.
+
+    Args:
+        result_sets: List of (results DataFrame, data type) pairs
+        max_tokens (int): Token budget for the context (None for no limit)
+        duplicate_threshold (float): Shingle containment at which a passage counts as a duplicate
+        model_name (str): Model whose tiktoken encoding is used for counting
+
+    Returns:
+        tuple: (context string, number of tokens used)
+    """
+    rows = []
+    for results, data_type in result_sets:
+        for _, row in results.iterrows():
+            rows.append((row, data_type))
+    rows.sort(key=lambda item: -float(item[0]['similarity']))
+
+    kept_shingles = []
+    parts = []
+    used = 0
+    rank = 0
+    separator = "-" * 40 + "\n"
+    separator_tokens = count_tokens([separator], model_name)[0]
+
+    for row, data_type in rows:
+        passages = [f"  {passage}\n" for passage in split_passages(row, data_type)]
+        if not passages:
+            continue
+        header = format_header(rank + 1, row)
+        header_tokens, *passage_tokens = count_tokens([header] + passages, model_name)
+
+        remaining = None if max_tokens is None else max_tokens - used - header_tokens - separator_tokens
+        packed = []
+        for passage, tokens in zip(passages, passage_tokens):
+            if remaining is not None and tokens > remaining:
+                break
+            passage_shingles = shingles(passage)
+            if is_near_duplicate(passage_shingles, kept_shingles, duplicate_threshold):
+                continue
+            kept_shingles.append(passage_shingles)
+            packed.append(passage)
+            if remaining is not None:
+                remaining -= tokens
+            used += tokens
+
+        if packed:
+            rank += 1
+            parts.append(header + ''.join(packed) + separator)
+            used += header_tokens + separator_tokens
+        if max_tokens is not None and max_tokens - used <= separator_tokens:
+            break
+
+    return ''.join(parts), used
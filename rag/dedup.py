@@ -0,0 +1,305 @@
+import os
+import re
+import hashlib
+import numpy as np
+import pandas as pd
+from embedding_store import get_store_paths
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Mersenne prime used by the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_words(text):
+    """
+    Split a text into lowercase words, ignoring punctuation and whitespace.
+
+    Args:
+        text (str): Text to normalize
+
+    Returns:
+        list: Words of the text
+    """
+    return WORD_PATTERN.findall(str(text).lower())
+
+
+def word_shingles(words, size=3):
+    """
+    Get the set of word n-grams of a text.
+
+    Args:
+        words (list): Normalized words
+        size (int): Words per shingle
+
+    Returns:
+        set: Shingle strings (the whole text as one shingle if it is shorter)
+    """
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Choose the LSH banding for a Jaccard similarity threshold.
+
+    Texts become candidates when all rows of at least one band agree; the
+    probability of that is 1 - (1 - s^r)^b for similarity s. The banding
+    whose curve rises closest to `threshold` is chosen.
+
+    Args:
+        num_perm (int): Number of MinHash permutations
+        threshold (float): Jaccard similarity at which texts count as duplicates
+
+    Returns:
+        tuple: (bands, rows per band)
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # Similarity at which the candidate probability is about one half
+        midpoint = (1 / bands) ** (1 / rows)
+        # Err on the low side: candidates are verified afterwards, misses are not
+        distance = abs(midpoint - threshold) + (0.05 if midpoint > threshold else 0)
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index for finding duplicate texts.
+
+    Texts are added one at a time. Each text is first matched exactly on its
+    normalized words, then by MinHash signatures of its word shingles: LSH
+    bands give candidate texts, and a candidate counts as a duplicate when
+    the estimated Jaccard similarity of the shingle sets is at least
+    `threshold`. Only texts that are not duplicates are indexed, so every
+    duplicate points at the first occurrence of its text.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, shingle_size=3, seed=1):
+        """
+        Args:
+            threshold (float): Jaccard similarity at which texts count as duplicates
+                (1.0 for exact duplicates only)
+            num_perm (int): Number of MinHash permutations
+            shingle_size (int): Words per shingle
+            seed (int): Seed for the permutations, so results are reproducible
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._exact = {}
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self.added = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def __len__(self):
+        """Number of distinct texts in the index."""
+        return len(self._exact)
+
+    def signature(self, shingle_set):
+        """
+        Compute the MinHash signature of a set of shingles.
+
+        Args:
+            shingle_set (set): Shingle strings
+
+        Returns:
+            numpy.ndarray: `num_perm` minimum 32-bit hash values
+        """
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+             for shingle in shingle_set),
+            dtype=np.uint64, count=len(shingle_set))
+        # Universal hashing (a * h + b) mod p; the product wraps at 64 bits like other MinHash implementations
+        permuted = ((hashes[:, None] * self._a + self._b) % np.uint64(MERSENNE_PRIME)) & np.uint64(0xFFFFFFFF)
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key, text):
+        """
+        Add a text, or find the earlier text it duplicates.
+
+        Args:
+            key: Identifier of the text (e.g. its row number)
+            text (str): Text to add
+
+        Returns:
+            The key of the earlier text this one duplicates, or None if it is new
+        """
+        self.added += 1
+        words = normalize_words(text)
+        exact_key = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).digest()
+        if exact_key in self._exact:
+            self.exact_duplicates += 1
+            return self._exact[exact_key]
+        if self.threshold >= 1 or not words:
+            self._exact[exact_key] = key
+            return None
+
+        signature = self.signature(word_shingles(words, self.shingle_size))
+        band_keys = self._band_keys(signature)
+        candidates = dict.fromkeys(candidate for band, band_key in enumerate(band_keys)
+                                   for candidate in self._buckets[band].get(band_key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                self.near_duplicates += 1
+                return candidate
+
+        self._exact[exact_key] = key
+        self._signatures[key] = signature
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return None
+
+    def stats(self):
+        """
+        Returns:
+            dict: Texts added, distinct texts, and exact and near duplicates found
+        """
+        return {
+            'added': self.added,
+            'distinct': len(self),
+            'exact_duplicates': self.exact_duplicates,
+            'near_duplicates': self.near_duplicates,
+        }
+
+
+def find_duplicates(texts, threshold=0.9, **params):
+    """
+    Find the first occurrence that each text duplicates.
+
+    Args:
+        texts: Texts, in order
+        threshold (float): Jaccard similarity at which texts count as duplicates
+        **params: Extra arguments for NearDuplicateIndex
+
+    Returns:
+        numpy.ndarray: For each text, the position of the text it duplicates, or -1
+    """
+    index = NearDuplicateIndex(threshold, **params)
+    dup_of = np.full(len(texts), -1, dtype=np.int64)
+    for i, text in enumerate(texts):
+        canonical = index.add(i, text)
+        if canonical is not None:
+            dup_of[i] = canonical
+    return dup_of
+
+
+def split_duplicates(df, threshold=0.9, **params):
+    """
+    Separate duplicate rows from the rows that need embeddings.
+
+    Args:
+        df (pandas.DataFrame): Rows with a `text` column
+        threshold (float): Jaccard similarity at which texts count as duplicates
+        **params: Extra arguments for NearDuplicateIndex
+
+    Returns:
+        tuple: (distinct rows with a `duplicate_count` column and a fresh index,
+            duplicate rows with a `dup_of` column holding the position of their
+            distinct row)
+    """
+    dup_of = find_duplicates(df['text'].fillna('').tolist(), threshold, **params)
+    is_distinct = dup_of < 0
+    # Position of every distinct row in the deduplicated table
+    positions = np.cumsum(is_distinct) - 1
+
+    distinct = df[is_distinct].reset_index(drop=True)
+    distinct['duplicate_count'] = np.bincount(positions[dup_of[~is_distinct]], minlength=len(distinct))
+    duplicates = df[~is_distinct].reset_index(drop=True)
+    duplicates['dup_of'] = positions[dup_of[~is_distinct]]
+    return distinct, duplicates
+
+
+def get_duplicates_path(path):
+    """
+    Get the file listing the duplicate rows that belong to an embedding store.
+
+    Args:
+        path (str): Base path of the store (or its CSV/.npy path)
+
+    Returns:
+        str: `<base>_duplicates.csv`
+    """
+    return get_store_paths(path)[0][:-len('.npy')] + '_duplicates.csv'
+
+
+def save_duplicates(duplicates, path):
+    """
+    Save the duplicate rows of a store next to it.
+
+    Args:
+        duplicates (pandas.DataFrame): Rows returned by `split_duplicates`
+        path (str): Base path of the store
+    """
+    duplicates_path = get_duplicates_path(path)
+    tmp_file = duplicates_path + '.tmp'
+    duplicates.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, duplicates_path)
+
+
+def load_duplicates(path):
+    """
+    Load the duplicate rows saved next to a store.
+
+    Args:
+        path (str): Base path of the store
+
+    Returns:
+        pandas.DataFrame: Duplicate rows with a `dup_of` column, or None if the store was not deduplicated
+    """
+    duplicates_path = get_duplicates_path(path)
+    if not os.path.exists(duplicates_path):
+        return None
+    return pd.read_csv(duplicates_path)
+
+
+def expand_duplicates(df, duplicates):
+    """
+    Fan a deduplicated store back out to every occurrence of each text.
+
+    Args:
+        df (pandas.DataFrame): Metadata of the deduplicated store
+        duplicates (pandas.DataFrame): Duplicate rows from `load_duplicates`
+
+    Returns:
+        pandas.DataFrame: One row per occurrence, with a `row` column holding
+            the store row whose embedding it shares
+    """
+    distinct = df.drop(columns=['duplicate_count', 'embedding'], errors='ignore').assign(row=np.arange(len(df)))
+    if duplicates is None or len(duplicates) == 0:
+        return distinct
+    fanned_out = duplicates.rename(columns={'dup_of': 'row'})
+    return pd.concat([distinct, fanned_out], ignore_index=True)
+
+
+if __name__ == "__main__":
+    # Report how many scraped rows would be embedded after deduplication
+    from config_loader import load_config, get_dedup_threshold
+    threshold = get_dedup_threshold(load_config()) or 0.9
+    for input_file in ["SCRAPED_TALKS.csv", "SCRAPED_PARAGRAPHS.csv"]:
+        if not os.path.exists(input_file):
+            continue
+        df = pd.read_csv(input_file)
+        distinct, duplicates = split_duplicates(df, threshold)
+        print(f"{input_file}: {len(df)} rows, {len(distinct)} distinct, {len(duplicates)} duplicates "
+              f"({len(duplicates) / max(1, len(df)):.1%} fewer embeddings at threshold {threshold})")
+        if len(duplicates):
+            top = distinct.nlargest(5, 'duplicate_count')
+            for _, row in top.iterrows():
+                text = str(row['text'])
+                print(f"  {row['duplicate_count'] + 1}x {text[:100]}{'...' if len(text) > 100 else ''}")
@@ -0,0 +1,251 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config_loader import get_embedding_cache_path, get_embedding_cache_max_entries
+
+
+def make_cache_key(namespace, model_name, text):
+    """
+    Build a content-addressed cache key.
+
+    Args:
+        namespace (str): Provider name, so identical model names from different providers do not collide
+        model_name (str): Embedding model name
+        text (str): Cleaned text that is sent to the model
+
+    Returns:
+        str: Hex SHA-256 digest of the namespace, model name and text
+    """
+    digest = hashlib.sha256()
+    for part in (namespace or '', model_name or '', text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent on-disk embedding cache backed by SQLite.
+
+    Embeddings are stored as float32 blobs keyed by
+    hash(namespace, model name, cleaned text), so unchanged text is never sent
+    to a provider twice. Every hit refreshes the entry's `last_used` time, and
+    once the cache holds more than `max_entries` rows the least recently used
+    rows are deleted.
+    """
+
+    def __init__(self, path="embedding_cache.sqlite", max_entries=1000000, namespace=""):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            max_entries (int): Maximum number of cached embeddings (None for no limit)
+            namespace (str): Provider name mixed into every key
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, "
+            "embedding BLOB NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model_name, texts):
+        """
+        Look up embeddings for a list of texts.
+
+        Args:
+            model_name (str): Embedding model name
+            texts: List of cleaned texts
+
+        Returns:
+            list: One float32 numpy array per text, or None for a cache miss
+        """
+        keys = [make_cache_key(self.namespace, model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+
+        results = [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return results
+
+    def put_many(self, model_name, texts, embeddings):
+        """
+        Store embeddings for a list of texts and evict old entries if needed.
+
+        Args:
+            model_name (str): Embedding model name
+            texts: List of cleaned texts
+            embeddings: One embedding per text
+        """
+        now = time.time()
+        rows = [
+            (make_cache_key(self.namespace, model_name, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(text):
+    """
+    Normalize a query for cache lookups (case and whitespace are ignored).
+
+    Args:
+        text (str): Query text
+
+    Returns:
+        str: Normalized query text
+    """
+    return ' '.join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Two-level cache for query embeddings.
+
+    A bounded in-memory LRU sits in front of a persistent EmbeddingCache, so
+    repeated queries skip the embedding call within a process and popular
+    queries survive restarts. Keys are (model, normalized query text).
+    """
+
+    def __init__(self, disk_cache=None, memory_entries=1024):
+        """
+        Args:
+            disk_cache (EmbeddingCache): Persistent cache to spill to (None for memory only)
+            memory_entries (int): Maximum number of embeddings held in memory
+        """
+        self.disk_cache = disk_cache
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def embed(self, texts, model_name, embed_func):
+        """
+        Get embeddings for queries, calling `embed_func` only for uncached ones.
+
+        Args:
+            texts: List of query strings
+            model_name (str): Embedding model name (part of the cache key)
+            embed_func: Function that embeds a list of query strings
+
+        Returns:
+            list: One float32 numpy array per query
+        """
+        keys = [normalize_query(text) for text in texts]
+        embeddings = [None] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                embedding = self._memory.get((model_name, key))
+                if embedding is not None:
+                    self._memory.move_to_end((model_name, key))
+                    embeddings[i] = embedding
+                    self.memory_hits += 1
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing and self.disk_cache is not None:
+            found = self.disk_cache.get_many(model_name, [keys[i] for i in missing])
+            with self._lock:
+                for i, embedding in zip(missing, found):
+                    if embedding is not None:
+                        embeddings[i] = embedding
+                        self._remember((model_name, keys[i]), embedding)
+                        self.disk_hits += 1
+            missing = [i for i in missing if embeddings[i] is None]
+
+        if missing:
+            # Embed each distinct normalized query once, using its first spelling
+            first_text = {}
+            for i in missing:
+                first_text.setdefault(keys[i], texts[i])
+            new_keys = list(first_text)
+            new_embeddings = [np.asarray(embedding, dtype=np.float32) for embedding in embed_func([first_text[key] for key in new_keys])]
+            if self.disk_cache is not None:
+                self.disk_cache.put_many(model_name, new_keys, new_embeddings)
+            by_key = dict(zip(new_keys, new_embeddings))
+            with self._lock:
+                for key, embedding in by_key.items():
+                    self._remember((model_name, key), embedding)
+                self.misses += len(missing)
+            for i in missing:
+                embeddings[i] = by_key[keys[i]]
+
+        return embeddings
+
+
+def open_embedding_cache(config, namespace):
+    """
+    Open the embedding cache configured in config.json.
+
+    Args:
+        config (dict): Configuration data
+        namespace (str): Provider name (e.g. "openai", "google_genai", "free")
+
+    Returns:
+        EmbeddingCache: Cache instance, or None if caching is disabled
+    """
+    path = get_embedding_cache_path(config)
+    if not path:
+        return None
+    return EmbeddingCache(path, max_entries=get_embedding_cache_max_entries(config), namespace=namespace)
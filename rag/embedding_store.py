@@ -0,0 +1,471 @@
+import os
+import ast
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def get_store_paths(path):
+    """
+    Get the file paths that make up an embedding store.
+
+    A store is a float32 matrix saved as `<base>.npy` plus a metadata table
+    saved as `<base>_meta.csv`, where row i of the metadata describes row i
+    of the matrix. Any extension on `path` is ignored, so `free/free_talks.csv`
+    and `free/free_talks` refer to the same store.
+
+    Args:
+        path (str): Base path of the store, with or without an extension
+
+    Returns:
+        tuple: (embeddings_path, metadata_path)
+    """
+    base, ext = os.path.splitext(path)
+    if ext not in ('.csv', '.npy'):
+        base = path
+    if base.endswith('_meta'):
+        base = base[:-len('_meta')]
+    return f"{base}.npy", f"{base}_meta.csv"
+
+
+def store_exists(path):
+    """
+    Check whether a complete embedding store exists at `path`.
+
+    Args:
+        path (str): Base path of the store
+
+    Returns:
+        bool: True if both the matrix and the metadata files exist
+    """
+    embeddings_path, metadata_path = get_store_paths(path)
+    return os.path.exists(embeddings_path) and os.path.exists(metadata_path)
+
+
+def _atomic_save_npy(array, output_file):
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_file, output_file)
+
+
+def _atomic_save_csv(df, output_file):
+    tmp_file = output_file + '.tmp'
+    df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+
+
+def save_embedding_store(df, embeddings, path, dtype=np.float32):
+    """
+    Save metadata and embeddings as a binary embedding store.
+
+    Args:
+        df (pandas.DataFrame): Metadata rows, one per embedding. An `embedding`
+            column, if present, is dropped.
+        embeddings: 2-D array or list of equal-length vectors
+        path (str): Base path of the store
+        dtype: Floating point type of the saved matrix
+    """
+    embeddings = np.asarray(embeddings, dtype=dtype)
+    if embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(df), -1)
+    if len(embeddings) != len(df):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(df)} metadata rows")
+
+    embeddings_path, metadata_path = get_store_paths(path)
+    os.makedirs(os.path.dirname(embeddings_path) or '.', exist_ok=True)
+
+    # Write the matrix first so a metadata file never points at a missing matrix
+    _atomic_save_npy(np.ascontiguousarray(embeddings), embeddings_path)
+    _atomic_save_csv(df.drop(columns=['embedding'], errors='ignore'), metadata_path)
+    remove_derived_files(path)
+
+
+def load_embedding_store(path, mmap=True):
+    """
+    Load an embedding store without parsing any vectors.
+
+    Args:
+        path (str): Base path of the store
+        mmap (bool): Memory-map the matrix instead of reading it into RAM
+
+    Returns:
+        tuple: (metadata DataFrame, embeddings matrix)
+    """
+    embeddings_path, metadata_path = get_store_paths(path)
+    embeddings = np.load(embeddings_path, mmap_mode='r' if mmap else None)
+    df = pd.read_csv(metadata_path)
+    if len(df) != len(embeddings):
+        raise ValueError(f"Store {path} is inconsistent: {len(df)} metadata rows, {len(embeddings)} embeddings")
+    return df, embeddings
+
+
+def get_row_count(path):
+    """
+    Get the number of rows in an embedding store by reading only the .npy header.
+
+    Args:
+        path (str): Base path of the store
+
+    Returns:
+        int: Number of embeddings in the store
+    """
+    embeddings_path, _ = get_store_paths(path)
+    return len(np.load(embeddings_path, mmap_mode='r'))
+
+
+# Files built from a store's vectors or texts, which any rewrite of the store makes stale
+DERIVED_SUFFIXES = ('_ivf.npz', '_int8.npz', '_binary.npz', '_bm25.npz')
+
+
+def store_fingerprint(path, sample_rows=64):
+    """
+    Identify the current contents of a store's matrix without reading all of it.
+
+    The fingerprint combines the matrix shape, the file size and modification
+    time, and a hash of a few evenly spaced rows. Index files saved next to a
+    store record it, so they are rebuilt when the store is rewritten, even
+    with the same number of rows.
+
+    Args:
+        path (str): Base path of the store
+        sample_rows (int): Number of rows hashed
+
+    Returns:
+        str: Fingerprint of the matrix
+    """
+    embeddings_path, _ = get_store_paths(path)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    stat = os.stat(embeddings_path)
+    sample = np.ascontiguousarray(embeddings[np.linspace(0, len(embeddings) - 1, min(sample_rows, len(embeddings)), dtype=np.int64)])
+    digest = hashlib.blake2b(sample.tobytes(), digest_size=8).hexdigest()
+    return f"{embeddings.shape[0]}x{embeddings.shape[1]}:{stat.st_size}:{stat.st_mtime_ns}:{digest}"
+
+
+def remove_derived_files(path):
+    """
+    Delete the index files built from a store (see DERIVED_SUFFIXES) after it was rewritten.
+
+    Args:
+        path (str): Base path of the store
+    """
+    base = get_store_paths(path)[0][:-len('.npy')]
+    for suffix in DERIVED_SUFFIXES:
+        if os.path.exists(base + suffix):
+            os.remove(base + suffix)
+
+
+class CheckpointWriter:
+    """
+    Append-only checkpoint for an embedding store that is built chunk by chunk.
+
+    Each call to `append` writes one shard (`shard_NNNNN.npy` and
+    `shard_NNNNN_meta.csv`) into `<base>.shards/` and then records it in
+    `manifest.json`. Nothing already written is rewritten, so the cost of a
+    checkpoint is proportional to the chunk, not to the output so far.
+    `compact` concatenates the shards into the final store and removes the
+    shard directory.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Base path of the store being built
+        """
+        self.path = path
+        embeddings_path, _ = get_store_paths(path)
+        self.shard_dir = embeddings_path[:-len('.npy')] + '.shards'
+        self.manifest_path = os.path.join(self.shard_dir, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'rows': 0, 'dim': None, 'shards': []}
+
+    @staticmethod
+    def exists(path):
+        """
+        Check whether a checkpoint for the store at `path` has been started.
+
+        Args:
+            path (str): Base path of the store being built
+
+        Returns:
+            bool: True if a checkpoint manifest exists
+        """
+        embeddings_path, _ = get_store_paths(path)
+        return os.path.exists(os.path.join(embeddings_path[:-len('.npy')] + '.shards', 'manifest.json'))
+
+    @property
+    def row_count(self):
+        """Number of rows recorded in the manifest."""
+        return self.manifest['rows']
+
+    def _shard_path(self, name):
+        return os.path.join(self.shard_dir, name)
+
+    def _write_manifest(self):
+        tmp_file = self.manifest_path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_file, self.manifest_path)
+
+    def append(self, df, embeddings, dtype=np.float32):
+        """
+        Write one shard and record it in the manifest.
+
+        Args:
+            df (pandas.DataFrame): Metadata rows for this chunk
+            embeddings: Embeddings for this chunk, one per metadata row
+            dtype: Floating point type of the saved shard
+        """
+        embeddings = np.asarray(embeddings, dtype=dtype)
+        if len(embeddings) != len(df):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(df)} metadata rows")
+        if len(df) == 0:
+            return
+        if self.manifest['dim'] is not None and embeddings.shape[1] != self.manifest['dim']:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match checkpoint dimension {self.manifest['dim']}")
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        name = f"shard_{len(self.manifest['shards']):05d}"
+        _atomic_save_npy(np.ascontiguousarray(embeddings), self._shard_path(f"{name}.npy"))
+        _atomic_save_csv(df.drop(columns=['embedding'], errors='ignore'), self._shard_path(f"{name}_meta.csv"))
+
+        # The manifest is only updated once the shard is fully on disk
+        self.manifest['shards'].append({'name': name, 'rows': len(df)})
+        self.manifest['rows'] += len(df)
+        self.manifest['dim'] = int(embeddings.shape[1])
+        self._write_manifest()
+
+    def load(self):
+        """
+        Read every shard written so far.
+
+        Returns:
+            tuple: (metadata DataFrame, embeddings matrix), both empty if there are no shards
+        """
+        shards = self.manifest['shards']
+        if not shards:
+            return pd.DataFrame(), np.empty((0, self.manifest['dim'] or 0), dtype=np.float32)
+        df = pd.concat([pd.read_csv(self._shard_path(f"{shard['name']}_meta.csv")) for shard in shards],
+                       ignore_index=True)
+        embeddings = np.concatenate([np.load(self._shard_path(f"{shard['name']}.npy"), mmap_mode='r')
+                                     for shard in shards])
+        return df, embeddings
+
+    def compact(self):
+        """
+        Concatenate all shards into the final store and delete the shards.
+
+        The final matrix and metadata are written to temporary files and
+        moved into place with `os.replace`, so readers never see a
+        partially written store.
+
+        Returns:
+            tuple: (embeddings_path, metadata_path)
+        """
+        embeddings_path, metadata_path = get_store_paths(self.path)
+        shards = self.manifest['shards']
+        if not shards:
+            raise ValueError(f"No shards to compact for {self.path}")
+
+        first = np.load(self._shard_path(f"{shards[0]['name']}.npy"), mmap_mode='r')
+        tmp_embeddings = embeddings_path + '.tmp'
+        out = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=first.dtype,
+                                        shape=(self.manifest['rows'], self.manifest['dim']))
+        tmp_metadata = metadata_path + '.tmp'
+        offset = 0
+        with open(tmp_metadata, 'w', newline='') as meta_out:
+            for i, shard in enumerate(shards):
+                shard_embeddings = np.load(self._shard_path(f"{shard['name']}.npy"), mmap_mode='r')
+                out[offset:offset + len(shard_embeddings)] = shard_embeddings
+                offset += len(shard_embeddings)
+
+                # Shard metadata files share a header, so they can be concatenated as text
+                with open(self._shard_path(f"{shard['name']}_meta.csv"), 'r', newline='') as meta_in:
+                    header = meta_in.readline()
+                    if i == 0:
+                        meta_out.write(header)
+                    shutil.copyfileobj(meta_in, meta_out)
+        out.flush()
+        del out
+
+        os.replace(tmp_embeddings, embeddings_path)
+        os.replace(tmp_metadata, metadata_path)
+        remove_derived_files(self.path)
+        shutil.rmtree(self.shard_dir)
+        return embeddings_path, metadata_path
+
+
+def update_store_metadata(df, path):
+    """
+    Replace a store's metadata without touching its matrix.
+
+    Args:
+        df (pandas.DataFrame): New metadata, one row per existing embedding
+        path (str): Base path of the store
+    """
+    if len(df) != get_row_count(path):
+        raise ValueError(f"Got {len(df)} metadata rows for {get_row_count(path)} embeddings in {path}")
+    _, metadata_path = get_store_paths(path)
+    _atomic_save_csv(df.drop(columns=['embedding'], errors='ignore'), metadata_path)
+
+
+def hash_texts(texts):
+    """
+    Hash texts so changed rows can be told apart from unchanged ones.
+
+    Args:
+        texts: List of strings
+
+    Returns:
+        list: Hex BLAKE2b digest of each text
+    """
+    return [hashlib.blake2b(str(text).encode('utf-8'), digest_size=16).hexdigest() for text in texts]
+
+
+def write_store_rows(df, matrices, source_ids, row_ids, path, dtype=np.float32, block_rows=65536):
+    """
+    Write a store whose row i is row `row_ids[i]` of `matrices[source_ids[i]]`.
+
+    The matrices may include the memory-mapped matrix of the store being
+    replaced: the new matrix is gathered block by block into a temporary
+    file and moved into place atomically, before the metadata.
+
+    Args:
+        df (pandas.DataFrame): Metadata rows of the new store
+        matrices (list): 2-D arrays the rows are taken from
+        source_ids: For each row, the index of its matrix in `matrices`
+        row_ids: For each row, its row in that matrix
+        path (str): Base path of the store
+        dtype: Floating point type of the saved matrix
+        block_rows (int): Rows gathered at a time
+
+    Returns:
+        tuple: (embeddings_path, metadata_path)
+    """
+    source_ids = np.asarray(source_ids)
+    row_ids = np.asarray(row_ids)
+    if len(source_ids) != len(df) or len(row_ids) != len(df):
+        raise ValueError(f"Got {len(source_ids)} row sources for {len(df)} metadata rows")
+    widths = {matrices[source].shape[1] for source in np.unique(source_ids)}
+    if len(widths) > 1:
+        raise ValueError(f"Cannot combine embeddings with different dimensions {sorted(widths)} in {path}")
+    width = widths.pop() if widths else 0
+
+    embeddings_path, metadata_path = get_store_paths(path)
+    os.makedirs(os.path.dirname(embeddings_path) or '.', exist_ok=True)
+    tmp_embeddings = embeddings_path + '.tmp'
+    out = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=dtype, shape=(len(df), width))
+    for start in range(0, len(df), block_rows):
+        block_sources = source_ids[start:start + block_rows]
+        block_row_ids = row_ids[start:start + block_rows]
+        block = np.empty((len(block_sources), width), dtype=dtype)
+        for source in np.unique(block_sources):
+            mask = block_sources == source
+            block[mask] = matrices[source][block_row_ids[mask]]
+        out[start:start + len(block)] = block
+    out.flush()
+    del out
+
+    os.replace(tmp_embeddings, embeddings_path)
+    _atomic_save_csv(df.drop(columns=['embedding'], errors='ignore'), metadata_path)
+    remove_derived_files(path)
+    return embeddings_path, metadata_path
+
+
+def convert_store_dtype(path, dtype=np.float16, block_rows=65536):
+    """
+    Rewrite a store's matrix with another floating point type, e.g. float16 to halve its size.
+
+    The matrix is converted block by block, so stores larger than RAM can be
+    converted, and replaced atomically.
+
+    Args:
+        path (str): Base path of the store
+        dtype: New floating point type
+        block_rows (int): Rows converted at a time
+
+    Returns:
+        str: Path of the converted matrix
+    """
+    embeddings_path, _ = get_store_paths(path)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    tmp_embeddings = embeddings_path + '.tmp'
+    out = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=dtype, shape=embeddings.shape)
+    for start in range(0, len(embeddings), block_rows):
+        out[start:start + block_rows] = embeddings[start:start + block_rows]
+    out.flush()
+    del out, embeddings
+    os.replace(tmp_embeddings, embeddings_path)
+    remove_derived_files(path)
+    return embeddings_path
+
+
+def load_legacy_csv(csv_file_path):
+    """
+    Load a CSV file that stores each embedding as a stringified list.
+
+    Args:
+        csv_file_path (str): Path to the legacy CSV file
+
+    Returns:
+        tuple: (metadata DataFrame, float32 embeddings matrix)
+    """
+    df = pd.read_csv(csv_file_path)
+    embeddings = np.array([ast.literal_eval(x) for x in df['embedding']], dtype=np.float32)
+    return df.drop(columns=['embedding']), embeddings
+
+
+def load_embeddings(path, mmap=True):
+    """
+    Load metadata and embeddings from a store, falling back to a legacy CSV.
+
+    Args:
+        path (str): Base path of the store or path of a legacy CSV file
+        mmap (bool): Memory-map the matrix when reading from a store
+
+    Returns:
+        tuple: (metadata DataFrame, embeddings matrix)
+    """
+    if store_exists(path):
+        return load_embedding_store(path, mmap=mmap)
+    if os.path.exists(path) and path.endswith('.csv'):
+        return load_legacy_csv(path)
+    raise FileNotFoundError(f"No embedding store or CSV file found at {path}")
+
+
+def convert_csv_to_store(csv_file_path, path=None):
+    """
+    Convert a legacy stringified-list CSV into a binary embedding store.
+
+    Args:
+        csv_file_path (str): Path to the legacy CSV file
+        path (str): Base path of the new store (defaults to the CSV path)
+
+    Returns:
+        tuple: (embeddings_path, metadata_path)
+    """
+    if path is None:
+        path = csv_file_path
+    df, embeddings = load_legacy_csv(csv_file_path)
+    save_embedding_store(df, embeddings, path)
+    return get_store_paths(path)
+
+
+if __name__ == "__main__":
+    # One-off migration of existing CSV outputs
+    for directory in ['free', 'google', 'google_genai', 'openai']:
+        if not os.path.isdir(directory):
+            continue
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.csv') or file_name.endswith('_meta.csv'):
+                continue
+            csv_path = os.path.join(directory, file_name)
+            if 'embedding' not in pd.read_csv(csv_path, nrows=0).columns:
+                continue
+            embeddings_path, metadata_path = convert_csv_to_store(csv_path)
+            print(f"Converted {csv_path} -> {embeddings_path}, {metadata_path}")
@@ -1,11 +1,129 @@
 from sentence_transformers import SentenceTransformer
 import torch
-from config_loader import load_config, get_sentence_transformer_model
+import atexit
+import os
+import time
+import numpy as np
+from config_loader import load_config, get_sentence_transformer_model, get_embedding_reduction, get_dedup_threshold
 from base_embedding import process_csv_files, process_all_at_once
+from embedding_cache import open_embedding_cache
 
 # Load configuration
 config = load_config()
 sentence_transformer_model = get_sentence_transformer_model(config)
+cache = open_embedding_cache(config, "free")
+
+
+class SentenceTransformerEncoder:
+    """
+    Long-lived Sentence Transformer encoder.
+    
+    The model is loaded once. On CPU-only hosts, large inputs are encoded by a
+    pool of worker processes (one per core by default); on a GPU the model is
+    used directly. Texts are sorted by length before encoding so each batch
+    holds texts of similar length and little time is spent on padding.
+    """
+    
+    def __init__(self, model_name, batch_size=32, num_workers=None):
+        """
+        Args:
+            model_name (str): Sentence Transformer model name
+            batch_size (int): Number of texts per forward pass
+            num_workers (int): Number of CPU worker processes (defaults to the number of cores)
+        """
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+        self.pool = None
+        
+        # Move model to GPU if available
+        if torch.cuda.is_available():
+            self.model = self.model.to('cuda')
+            self.num_workers = 1
+            print("Using GPU for encoding")
+        else:
+            self.num_workers = num_workers or os.cpu_count() or 1
+            print(f"Using CPU for encoding ({self.num_workers} worker processes)")
+    
+    def _get_pool(self):
+        if self.pool is None:
+            # Give every worker a single thread so the processes do not oversubscribe the cores
+            previous = os.environ.get('OMP_NUM_THREADS')
+            os.environ['OMP_NUM_THREADS'] = '1'
+            try:
+                self.pool = self.model.start_multi_process_pool(target_devices=['cpu'] * self.num_workers)
+            finally:
+                if previous is None:
+                    del os.environ['OMP_NUM_THREADS']
+                else:
+                    os.environ['OMP_NUM_THREADS'] = previous
+        return self.pool
+    
+    def encode(self, texts):
+        """
+        Encode texts into L2-normalized embeddings.
+        
+        Args:
+            texts: List of strings to embed
+        
+        Returns:
+            numpy.ndarray: One row per text, in the input order
+        """
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        start_time = time.perf_counter()
+        
+        # Sort by length to minimise padding, and remember how to undo it
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        sorted_texts = [texts[i] for i in order]
+        
+        if self.num_workers > 1 and len(texts) >= self.batch_size * 2:
+            sorted_embeddings = self.model.encode_multi_process(
+                sorted_texts,
+                self._get_pool(),
+                batch_size=self.batch_size,
+                chunk_size=max(self.batch_size, len(texts) // (self.num_workers * 4))
+            )
+        else:
+            sorted_embeddings = self.model.encode(
+                sorted_texts,
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+        
+        sorted_embeddings = np.asarray(sorted_embeddings, dtype=np.float32)
+        sorted_embeddings /= np.maximum(np.linalg.norm(sorted_embeddings, axis=1, keepdims=True), 1e-12)
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        
+        elapsed_time = time.perf_counter() - start_time
+        print(f"Encoded {len(texts)} texts in {elapsed_time:.2f}s ({len(texts) / max(elapsed_time, 1e-9):.1f} sentences/sec)")
+        return embeddings
+    
+    def close(self):
+        """Stop the worker processes, if they were started."""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+_encoder = None
+
+
+def get_encoder():
+    """
+    Get the process-wide encoder, loading the model on first use.
+    
+    Returns:
+        SentenceTransformerEncoder: Shared encoder instance
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = SentenceTransformerEncoder(sentence_transformer_model)
+        atexit.register(_encoder.close)
+    return _encoder
+
 
 def get_free_embeddings(texts):
     """
@@ -17,25 +135,7 @@ def get_free_embeddings(texts):
     Returns:
         List of embeddings
     """
-    # Initialize the sentence transformer model
-    model = SentenceTransformer(sentence_transformer_model)
-
-    # Move model to GPU if available
-    if torch.cuda.is_available():
-        model = model.to('cuda')
-        print("Using GPU for encoding")
-    else:
-        print("Using CPU for encoding")
-
-    embeddings = model.encode(
-        texts,
-        batch_size=32,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    ).tolist()
-
-    return embeddings
+    return get_encoder().encode(texts).tolist()
 
 
 def process_free_embeddings(texts):
@@ -48,7 +148,7 @@ def process_free_embeddings(texts):
     Returns:
         List of embeddings
     """
-    return process_all_at_once(texts, get_free_embeddings)
+    return process_all_at_once(texts, get_free_embeddings, sentence_transformer_model, cache=cache)
 
 
 if __name__ == "__main__":
@@ -59,5 +159,7 @@ if __name__ == "__main__":
         process_free_embeddings,
         "free",
         resume=True,
-        chunk_size=100
+        chunk_size=1000,
+        reduction=get_embedding_reduction(config),
+        dedup_threshold=get_dedup_threshold(config)
     )
\ No newline at end of file
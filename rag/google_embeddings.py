@@ -1,7 +1,8 @@
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
-from config_loader import load_config, get_google_project_id, get_google_embedding_model
+from config_loader import load_config, get_google_project_id, get_google_embedding_model, get_embedding_reduction, get_dedup_threshold
 from base_embedding import process_in_batches, process_csv_files
+from embedding_cache import open_embedding_cache
 
 try:
     # Load configuration
@@ -14,6 +15,9 @@ try:
 
     # Initialize the model
     model = TextEmbeddingModel.from_pretrained(google_model)
+
+    # Open the shared embedding cache
+    cache = open_embedding_cache(config, "google")
 except Exception as e:
     print(f"Error initializing Google Vertex AI: {e}")
     print("\nTo resolve this issue:")
@@ -41,7 +45,7 @@ def get_google_embeddings(texts, model_name=None):
         response = model.get_embeddings(batch)
         return [item.values for item in response]
     
-    return process_in_batches(texts, process_batch, model_name)
+    return process_in_batches(texts, process_batch, model_name, cache=cache)
 
 def process_google_embeddings(texts):
     """
@@ -63,5 +67,7 @@ if __name__ == "__main__":
         process_google_embeddings,
         "google",
         resume=True,
-        chunk_size=100
+        chunk_size=100,
+        reduction=get_embedding_reduction(config),
+        dedup_threshold=get_dedup_threshold(config)
     )
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+from batch_dispatcher import call_with_retry
+
+# Maximum number of texts the API accepts in one batch embedding request
+GENAI_MAX_BATCH_SIZE = 100
+
+# Set to False the first time the SDK returns a single embedding for a list of contents
+_batch_supported = True
+
+
+class EmbeddingFailure(Exception):
+    """
+    Raised when some texts could not be embedded even after retries.
+
+    Attributes:
+        failed (dict): Maps the index of each failed text to the exception it raised
+    """
+
+    def __init__(self, failed):
+        self.failed = failed
+        indices = sorted(failed)
+        super().__init__(f"Failed to embed {len(indices)} text(s) at indices {indices[:20]}"
+                         f"{'...' if len(indices) > 20 else ''}: {failed[indices[0]]}")
+
+
+def _embed_one(text, model_name, max_retries):
+    result = call_with_retry(
+        lambda: genai.embed_content(model=f'models/{model_name}', content=text),
+        max_retries=max_retries
+    )
+    return result['embedding']
+
+
+def _embed_batch(texts, model_name, max_retries):
+    """Embed texts in one multi-content request, or return None if the SDK cannot."""
+    global _batch_supported
+    result = call_with_retry(
+        lambda: genai.embed_content(model=f'models/{model_name}', content=texts),
+        max_retries=max_retries
+    )
+    embeddings = result['embedding']
+    if len(embeddings) != len(texts) or (embeddings and not isinstance(embeddings[0], (list, tuple))):
+        _batch_supported = False
+        return None
+    return [list(embedding) for embedding in embeddings]
+
+
+def embed_contents(texts, model_name, max_workers=8, max_retries=3):
+    """
+    Embed a list of texts with Google Generative AI.
+
+    Texts are sent in multi-content requests of up to 100 texts. If a batch
+    request fails, or the installed SDK does not support batches, the texts
+    are embedded one at a time on a bounded thread pool. Every request is
+    retried on 429/5xx errors. Texts that still fail are reported through
+    EmbeddingFailure instead of being replaced with placeholder vectors.
+
+    `genai.configure` must have been called before using this function.
+
+    Args:
+        texts: List of strings to embed
+        model_name: Embedding model name (without the `models/` prefix)
+        max_workers: Maximum number of concurrent single-text requests
+        max_retries: Retries per request for transient errors
+
+    Returns:
+        List of embeddings in the same order as `texts`
+    """
+    embeddings = [None] * len(texts)
+    pending = []
+
+    for start in range(0, len(texts), GENAI_MAX_BATCH_SIZE):
+        chunk = list(texts[start:start + GENAI_MAX_BATCH_SIZE])
+        chunk_embeddings = None
+        if _batch_supported and len(chunk) > 1:
+            try:
+                chunk_embeddings = _embed_batch(chunk, model_name, max_retries)
+            except Exception as e:
+                print(f"Batch embedding request failed ({e}); falling back to single requests")
+        if chunk_embeddings is None:
+            pending.extend(range(start, start + len(chunk)))
+        else:
+            embeddings[start:start + len(chunk)] = chunk_embeddings
+
+    failed = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {i: executor.submit(_embed_one, texts[i], model_name, max_retries) for i in pending}
+            for i, future in futures.items():
+                try:
+                    embeddings[i] = future.result()
+                except Exception as e:
+                    failed[i] = e
+
+    if failed:
+        raise EmbeddingFailure(failed)
+    return embeddings
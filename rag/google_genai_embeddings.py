@@ -1,6 +1,8 @@
 import google.generativeai as genai
-from config_loader import load_config, get_google_embedding_model, get_google_ai_key
+from config_loader import load_config, get_google_embedding_model, get_google_ai_key, get_embedding_reduction, get_dedup_threshold
 from base_embedding import process_in_batches, process_csv_files
+from embedding_cache import open_embedding_cache
+from google_genai_batch import embed_contents
 
 try:
     # Load configuration
@@ -23,6 +25,9 @@ try:
     
     print(f"Using Google Generative AI with model: {google_model}")
     
+    # Open the shared embedding cache
+    cache = open_embedding_cache(config, "google_genai")
+    
 except Exception as e:
     print(f"Error initializing Google Generative AI: {e}")
     print("\nTo resolve this issue:")
@@ -46,23 +51,11 @@ def get_google_genai_embeddings(texts, model_name=None):
         model_name = google_model
     
     def process_batch(batch):
-        # For Google Generative AI, we need to process each text individually
-        # as the API doesn't support batch processing in the same way
-        embeddings = []
-        for text in batch:
-            try:
-                result = genai.embed_content(
-                    model=f'models/{model_name}',
-                    content=text
-                )
-                embeddings.append(result['embedding'])
-            except Exception as e:
-                print(f"Error generating embedding for text: {e}")
-                # Return a zero vector of appropriate size as fallback
-                embeddings.append([0.0] * 768)  # Standard size for many embedding models
-        return embeddings
+        # One multi-content request per batch; failed texts raise EmbeddingFailure
+        # so the run stops at the last checkpoint instead of storing bad vectors
+        return embed_contents(batch, model_name)
     
-    return process_in_batches(texts, process_batch, model_name)
+    return process_in_batches(texts, process_batch, model_name, cache=cache)
 
 def process_google_genai_embeddings(texts):
     """
@@ -84,5 +77,7 @@ if __name__ == "__main__":
         process_google_genai_embeddings,
         "google_genai",
         resume=True,
-        chunk_size=100
+        chunk_size=100,
+        reduction=get_embedding_reduction(config),
+        dedup_threshold=get_dedup_threshold(config)
     )
@@ -0,0 +1,188 @@
+import os
+import re
+from collections import Counter
+import numpy as np
+from vector_index import top_k_indices
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric tokens.
+
+    Scripture references keep their parts, so "Alma 32:21" becomes
+    ["alma", "32", "21"].
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Tokens
+    """
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class BM25Index:
+    """
+    Compact BM25 inverted index over a list of texts.
+
+    Postings are stored in CSR form: for term t, `doc_ids[offsets[t]:offsets[t + 1]]`
+    are the documents containing it and `term_freqs` the matching counts.
+    A query only touches the postings of its own terms.
+    """
+
+    def __init__(self, texts=None, k1=1.5, b=0.75, arrays=None):
+        """
+        Args:
+            texts: Documents to index, one per row
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalization
+            arrays (dict): Previously built index arrays (see `load`)
+        """
+        self.k1 = k1
+        self.b = b
+        if arrays is not None:
+            self.terms = arrays['terms']
+            self.offsets = arrays['offsets']
+            self.doc_ids = arrays['doc_ids']
+            self.term_freqs = arrays['term_freqs']
+            self.doc_lengths = arrays['doc_lengths']
+        else:
+            self._build(texts)
+        self.vocabulary = {term: i for i, term in enumerate(self.terms.tolist())}
+        n_docs = len(self.doc_lengths)
+        doc_freqs = np.diff(self.offsets)
+        self.idf = np.log(1 + (n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if n_docs else 0.0
+
+    def _build(self, texts):
+        vocabulary = {}
+        term_ids, doc_ids, term_freqs, doc_lengths = [], [], [], []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        self.terms = np.array(list(vocabulary), dtype=object)
+        self.offsets = np.searchsorted(term_ids[order], np.arange(len(vocabulary) + 1))
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.term_freqs = np.asarray(term_freqs, dtype=np.float32)[order]
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def scores(self, query):
+        """
+        Compute BM25 scores of a query for every document.
+
+        Args:
+            query (str): Query text
+
+        Returns:
+            numpy.ndarray: One score per document (0 for documents without query terms)
+        """
+        n_docs = len(self.doc_lengths)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:stop]
+            tf = self.term_freqs[start:stop]
+            weights = self.idf[term_id] * tf * (self.k1 + 1) / (tf + length_norm[docs])
+            scores += np.bincount(docs, weights=weights, minlength=n_docs).astype(np.float32)
+        return scores
+
+    def search_indices(self, query, top_k=10, rows=None):
+        """
+        Find the documents with the highest BM25 scores.
+
+        Args:
+            query (str): Query text
+            top_k (int): Number of documents to return
+            rows: Optional row ids to restrict the search to
+
+        Returns:
+            tuple: (row indices, scores), best first; documents with score 0 are dropped
+        """
+        scores = self.scores(query)
+        if rows is not None:
+            candidates = rows
+            scores = scores[rows]
+        else:
+            candidates = np.arange(len(scores))
+        top = top_k_indices(scores, top_k)
+        top = top[scores[top] > 0]
+        return candidates[top], scores[top]
+
+    def save(self, path, fingerprint=""):
+        """
+        Save the index arrays to an `.npz` file.
+
+        Args:
+            path (str): Output `.npz` file
+            fingerprint (str): Fingerprint of the store the texts came from (see store_fingerprint)
+        """
+        tmp_file = path + '.tmp.npz'
+        np.savez(tmp_file, terms=self.terms.astype(str), offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, doc_lengths=self.doc_lengths, params=np.array([self.k1, self.b]),
+                 fingerprint=fingerprint)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Load an index written by `save`.
+
+        Args:
+            path (str): `.npz` file
+            fingerprint (str): The store's current fingerprint (None to skip the check)
+
+        Returns:
+            BM25Index: Loaded index
+
+        Raises:
+            ValueError: If the index was built from a different version of the store
+        """
+        data = np.load(path)
+        saved = str(data['fingerprint']) if 'fingerprint' in data.files else None
+        if fingerprint is not None and saved != fingerprint:
+            raise ValueError(f"Index {path} was built from an earlier version of the store")
+        arrays = {name: data[name] for name in ('terms', 'offsets', 'doc_ids', 'term_freqs', 'doc_lengths')}
+        k1, b = data['params']
+        return cls(k1=float(k1), b=float(b), arrays=arrays)
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """
+    Fuse several rankings with reciprocal-rank fusion.
+
+    Each item scores sum(1 / (rrf_k + rank)) over the rankings it appears in
+    (rank starts at 1).
+
+    Args:
+        rankings: Iterable of sequences of row ids, best first
+        rrf_k (int): Damping constant; larger values flatten the rank weights
+
+    Returns:
+        tuple: (row ids, fused scores), best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rrf_k + rank)
+    if not fused:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    rows = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float64, count=len(fused))
+    order = np.argsort(-scores, kind='stable')
+    return rows[order], scores[order]
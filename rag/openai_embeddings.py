@@ -1,6 +1,7 @@
 from openai import OpenAI
-from config_loader import load_config, get_openai_key, get_openai_embedding_model
+from config_loader import load_config, get_openai_key, get_openai_embedding_model, get_embedding_reduction, get_dedup_threshold
 from base_embedding import process_in_batches, process_csv_files
+from embedding_cache import open_embedding_cache
 
 # Load configuration
 config = load_config()
@@ -8,6 +9,7 @@ openai_key = get_openai_key(config)
 openai_model = get_openai_embedding_model(config)
 
 client = OpenAI(api_key=openai_key)
+cache = open_embedding_cache(config, "openai")
 
 def get_openai_embeddings(texts, model=None):
     """
@@ -27,7 +29,7 @@ def get_openai_embeddings(texts, model=None):
         response = client.embeddings.create(input=batch, model=model)
         return [item.embedding for item in response.data]
     
-    return process_in_batches(texts, process_batch, model)
+    return process_in_batches(texts, process_batch, model, cache=cache)
 
 def process_openai_embeddings(texts):
     """
@@ -50,5 +52,7 @@ if __name__ == "__main__":
         process_openai_embeddings,
         "openai",
         resume=True,
-        chunk_size=100
+        chunk_size=100,
+        reduction=get_embedding_reduction(config),
+        dedup_threshold=get_dedup_threshold(config)
     )
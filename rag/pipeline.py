@@ -0,0 +1,562 @@
+import os
+import sys
+import time
+import queue
+import logging
+import importlib
+import threading
+import numpy as np
+import pandas as pd
+from embedding_store import CheckpointWriter, load_embedding_store, store_exists, hash_texts
+from base_embedding import get_row_keys, upsert_store
+from dedup import NearDuplicateIndex, save_duplicates, get_duplicates_path
+from reduction import reduce_stores
+
+# Embedding functions selectable on the command line: provider -> (module, function)
+PROVIDERS = {
+    'free': ('free_embeddings', 'process_free_embeddings'),
+    'openai': ('openai_embeddings', 'process_openai_embeddings'),
+    'google': ('google_embeddings', 'process_google_embeddings'),
+    'google_genai': ('google_genai_embeddings', 'process_google_genai_embeddings'),
+}
+
+# Marks the end of a stage's input
+DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: worker threads that read items from a bounded
+    input queue and emit results to the next stage's queue.
+
+    `func(item, emit)` may emit any number of results per item. With a
+    `batch_size`, `func(items, emit)` gets up to that many items at once:
+    whatever is queued, waiting at most `max_wait` seconds for more after the
+    first. `flush(emit)` is called once after the last item.
+
+    Each stage counts its items and the time its workers spend working,
+    waiting for input, and blocked on a full output queue (backpressure).
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=None, max_wait=0, flush=None):
+        """
+        Args:
+            name (str): Name shown in throughput reports
+            func: Function called with an item (or a list of items) and `emit`
+            workers (int): Number of worker threads
+            batch_size (int): Maximum number of items per call (None to pass single items)
+            max_wait (float): Seconds a batch waits to fill after its first item
+            flush: Optional function called with `emit` after the last item
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.flush = flush
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.input = None
+        self.output = None
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Item counts, items per second, and the share of worker time
+                spent working and blocked on the next stage
+        """
+        with self._lock:
+            end = self.finished or time.time()
+            elapsed = max(end - (self.started or end), 1e-9)
+            worker_seconds = elapsed * self.workers
+            return {
+                'stage': self.name,
+                'workers': self.workers,
+                'items_in': self.items_in,
+                'items_out': self.items_out,
+                # The source has no input, so its rate is that of its output
+                'items_per_second': round((self.items_in if self.input is not None else self.items_out) / elapsed, 2),
+                'busy': round(min(1.0, self.busy_seconds / worker_seconds), 3),
+                'blocked': round(min(1.0, self.blocked_seconds / worker_seconds), 3),
+                'queued': self.input.qsize() if self.input is not None and self.finished is None else 0,
+            }
+
+
+class Pipeline:
+    """
+    Chain of stages connected by bounded queues.
+
+    The first stage is the source: its function is called once with `emit`
+    and produces the pipeline's items. Every later stage starts working as
+    soon as its first input arrives, and a full queue blocks the stage
+    before it, so a slow stage throttles the ones upstream instead of
+    letting their output pile up in memory. If any stage raises, the whole
+    pipeline stops and `run` re-raises the error.
+    """
+
+    def __init__(self, queue_size=64, report_interval=10):
+        """
+        Args:
+            queue_size (int): Capacity of each queue between stages
+            report_interval (float): Seconds between progress reports (None for none)
+        """
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.stages = []
+        self.error = None
+        self._stop = threading.Event()
+
+    def add_stage(self, name, func, **options):
+        """
+        Append a stage (see Stage for the options).
+
+        Returns:
+            Stage: The new stage
+        """
+        stage = Stage(name, func, **options)
+        if self.stages:
+            stage.input = self.stages[-1].output = queue.Queue(maxsize=self.queue_size)
+        self.stages.append(stage)
+        return stage
+
+    def _put(self, stage, item):
+        """Put an item on the stage's output queue and return the seconds spent blocked."""
+        if stage.output is None:
+            return 0.0
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                stage.output.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        return time.perf_counter() - start
+
+    def _get(self, stage, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return stage.input.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def _put_back_done(self, stage):
+        # Taking DONE freed a slot, so this only fails if the pipeline is stopping
+        try:
+            stage.input.put_nowait(DONE)
+        except queue.Full:
+            pass
+
+    def _next_input(self, stage):
+        first = self._get(stage)
+        if first is DONE or stage.batch_size is None:
+            return first
+        batch = [first]
+        deadline = time.monotonic() + stage.max_wait
+        while len(batch) < stage.batch_size:
+            try:
+                item = stage.input.get_nowait()
+            except queue.Empty:
+                try:
+                    item = self._get(stage, timeout=deadline - time.monotonic())
+                except queue.Empty:
+                    break
+            if item is DONE:
+                # Finish this batch, then stop
+                self._put_back_done(stage)
+                break
+            batch.append(item)
+        return batch
+
+    def _call(self, stage, func, *args):
+        blocked = 0.0
+
+        def emit(item):
+            nonlocal blocked
+            with stage._lock:
+                stage.items_out += 1
+            blocked += self._put(stage, item)
+
+        start = time.perf_counter()
+        func(*args, emit)
+        with stage._lock:
+            # Time spent waiting on a full output queue is not work
+            stage.busy_seconds += time.perf_counter() - start - blocked
+            stage.blocked_seconds += blocked
+
+    def _work(self, stage):
+        try:
+            if stage.input is None:
+                self._call(stage, lambda emit: stage.func(emit))
+            else:
+                while not self._stop.is_set():
+                    item = self._next_input(stage)
+                    if item is DONE:
+                        # Let the other workers of this stage see the end too
+                        self._put_back_done(stage)
+                        break
+                    with stage._lock:
+                        stage.items_in += len(item) if stage.batch_size is not None else 1
+                    self._call(stage, stage.func, item)
+            with stage._lock:
+                stage._running -= 1
+                last = stage._running == 0
+            if last and not self._stop.is_set():
+                if stage.flush is not None:
+                    self._call(stage, lambda emit: stage.flush(emit))
+                stage.finished = time.time()
+                self._put(stage, DONE)
+        except Exception as e:
+            logging.exception(f"Pipeline stage {stage.name} failed")
+            self.error = self.error or e
+            self._stop.set()
+
+    def report(self):
+        """
+        Print one line of throughput statistics per stage.
+
+        The stage with the highest busy share is marked as the slowest. The
+        source is left out: it is busy for as long as it produces items, so
+        it is the bottleneck when every queue after it stays nearly empty.
+        """
+        stats = [stage.stats() for stage in self.stages]
+        slowest = max(stats[1:] or stats, key=lambda s: s['busy'])['stage']
+        print(f"{'stage':<10} {'workers':>7} {'in':>8} {'out':>8} {'items/s':>9} {'busy':>6} {'blocked':>8} {'queued':>7}")
+        for s in stats:
+            marker = '  <- slowest' if s['stage'] == slowest else ''
+            print(f"{s['stage']:<10} {s['workers']:>7} {s['items_in']:>8} {s['items_out']:>8} {s['items_per_second']:>9} "
+                  f"{s['busy']:>6.0%} {s['blocked']:>8.0%} {s['queued']:>7}{marker}")
+
+    def run(self):
+        """
+        Run every stage until the source is exhausted and all items have been processed.
+
+        Returns:
+            list: Final statistics of each stage (see Stage.stats)
+        """
+        threads = []
+        for stage in self.stages:
+            stage.started = time.time()
+            stage._running = stage.workers
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage,), name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        last_report = time.monotonic()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                    self.report()
+                    last_report = time.monotonic()
+        if self.error is not None:
+            raise self.error
+        self.report()
+        return [stage.stats() for stage in self.stages]
+
+
+class StorePersister:
+    """
+    Persist stage of the embedding pipeline.
+
+    Rows arrive in order. Newly embedded rows are appended to one
+    CheckpointWriter per label; rows whose key and text are unchanged (see
+    base_embedding.get_row_keys) keep their embedding from the existing
+    store, or from the checkpoint of an interrupted run, and are not
+    embedded again. When the pipeline finishes, each store is rewritten in
+    row order with `write_store_rows`, with a `text_hash` column, and
+    duplicate rows are saved next to it with a `duplicate_count` column
+    added to the store metadata: the same layout as `process_csv_files`.
+    """
+
+    def __init__(self, output_dir, prefix, deduplicate=False, reduction=None):
+        """
+        Args:
+            output_dir (str): Directory of the embedding stores
+            prefix (str): Prefix of the store names
+            deduplicate (bool): Whether duplicate rows are kept out of the stores
+            reduction: Optional (method, dimensions) applied to the finished stores
+        """
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.deduplicate = deduplicate
+        self.reduction = reduction
+        self.checkpoints = {}
+        self.rows = {}
+        self.duplicates = {}
+        self._existing = {}
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def get_path(self, label):
+        return os.path.join(self.output_dir, f'{self.prefix}_{label}')
+
+    def _checkpoint(self, label):
+        if label not in self.checkpoints:
+            # Shards of an interrupted run are kept and reused
+            self.checkpoints[label] = CheckpointWriter(self.get_path(label))
+        return self.checkpoints[label]
+
+    def _existing_rows(self, label):
+        # (key, text hash) of every row that already has an embedding, from the store and the checkpoint
+        with self._lock:
+            if label not in self._existing:
+                path = self.get_path(label)
+                sources = [load_embedding_store(path)[0]] if store_exists(path) else []
+                if CheckpointWriter.exists(path):
+                    sources.append(CheckpointWriter(path).load()[0])
+                entries = set()
+                for source in sources:
+                    if len(source) == 0:
+                        continue
+                    if 'text_hash' not in source.columns:
+                        # Stores written before rows were keyed
+                        source = source.assign(text_hash=hash_texts(source['text'].fillna('').tolist()))
+                    entries.update(zip(get_row_keys(source), source['text_hash']))
+                self._existing[label] = entries
+            return self._existing[label]
+
+    def embedded(self, label, rows):
+        """
+        Check which rows already have an embedding for their current text.
+
+        Args:
+            label (str): Store label (talks or paragraphs)
+            rows (list): Row dicts with a `text` field
+
+        Returns:
+            numpy.ndarray: True for every row that does not need to be embedded
+        """
+        df = pd.DataFrame(rows)
+        df['text_hash'] = hash_texts(df['text'].fillna('').tolist())
+        existing = self._existing_rows(label)
+        return np.array([entry in existing for entry in zip(get_row_keys(df), df['text_hash'])], dtype=bool)
+
+    def persist(self, items, emit):
+        """
+        Append embedded rows and record duplicates.
+
+        Args:
+            items: ("rows", label, rows, embeddings, reused) and ("duplicate", label, row, dup_of) tuples;
+                `embeddings` holds one embedding per row that is not `reused`
+            emit: Pipeline emit function (unused; this is the last stage)
+        """
+        for item in items:
+            if item[0] == "duplicate":
+                _, label, row, dup_of = item
+                self.duplicates.setdefault(label, []).append(dict(row, dup_of=dup_of))
+                continue
+            _, label, rows, embeddings, reused = item
+            df = pd.DataFrame(rows)
+            df['text_hash'] = hash_texts(df['text'].fillna('').tolist())
+            self.rows.setdefault(label, []).append(df)
+            self._checkpoint(label).append(df[~reused], embeddings)
+
+    def _write_store(self, label):
+        path = self.get_path(label)
+        df = pd.concat(self.rows[label], ignore_index=True)
+        if self.deduplicate:
+            duplicates = pd.DataFrame(self.duplicates.get(label, []), columns=list(df.columns.drop('text_hash')) + ['dup_of'])
+            df.insert(df.columns.get_loc('text_hash'), 'duplicate_count',
+                      np.bincount(duplicates['dup_of'].values.astype(np.int64), minlength=len(df)))
+            save_duplicates(duplicates, path)
+        elif os.path.exists(get_duplicates_path(path)):
+            os.remove(get_duplicates_path(path))
+
+        checkpoint = self._checkpoint(label)
+        new_rows = checkpoint.row_count
+        embeddings_path, metadata_path, _ = upsert_store(df, path, checkpoint)
+        print(f"Saved {len(df)} {label} embeddings ({new_rows} new) to {embeddings_path} and {metadata_path}")
+        return path
+
+    def finish(self, emit):
+        """Write the stores from the existing embeddings and the checkpoints, and save the duplicate rows."""
+        paths = [self._write_store(label) for label in self.rows]
+        if self.reduction and self.reduction[0] and paths:
+            method, dimensions = self.reduction
+            reduce_stores(sorted(paths, key=lambda path: not path.endswith('_paragraphs')), dimensions, method=method)
+
+
+class InOrder:
+    """
+    Reorder buffer for items that finish out of order.
+
+    Items are added with their sequence number (0, 1, 2, ...) and released
+    as soon as every item before them has arrived.
+    """
+
+    def __init__(self):
+        self.next_sequence = 0
+        self.pending = {}
+
+    def add(self, sequence, item):
+        """
+        Add an item and release the ones that are now in order.
+
+        Args:
+            sequence (int): Position of the item
+            item: The item
+
+        Returns:
+            list: Items ready to be processed, in sequence order
+        """
+        self.pending[sequence] = item
+        ready = []
+        while self.next_sequence in self.pending:
+            ready.append(self.pending.pop(self.next_sequence))
+            self.next_sequence += 1
+        return ready
+
+
+def build_embedding_pipeline(conference_urls, process_func, output_dir, prefix, session, dedup_threshold=0,
+                             reduction=None, fetch_workers=10, parse_workers=2, batch_size=100, max_wait=1.0,
+                             queue_size=64, report_interval=10):
+    """
+    Build the scrape-to-store pipeline: crawl -> fetch -> parse -> split -> dedup -> embed -> persist.
+
+    - crawl: finds talk URLs on each conference page
+    - fetch: downloads talk pages (`fetch_workers` threads)
+    - parse: extracts each talk's metadata and text
+    - split: puts the talks back in crawl order and emits each talk row and its paragraph rows
+    - dedup: drops rows whose text duplicates an earlier row (see dedup.py)
+    - embed: embeds whatever rows are queued, up to `batch_size` at a time,
+      except rows whose text is unchanged since the last run
+    - persist: appends new embeddings to the store checkpoints and writes
+      the stores when the crawl ends
+
+    Split puts the talks back in crawl order, and dedup, embed and persist
+    run one worker each, so rows reach the stores in crawl order on every
+    run, however the downloads interleave.
+
+    Args:
+        conference_urls: (url, year, month) tuples from scraper.get_conference_urls
+        process_func: Function that embeds a list of texts (e.g. process_free_embeddings)
+        output_dir (str): Directory of the embedding stores
+        prefix (str): Prefix of the store names
+        session: requests session from scraper.setup_session
+        dedup_threshold (float): Jaccard similarity at which rows are embedded once (0 to embed every row)
+        reduction: Optional (method, dimensions) applied to the finished stores
+        fetch_workers (int): Number of concurrent page downloads
+        parse_workers (int): Number of HTML parsing threads
+        batch_size (int): Maximum number of texts per embedding call
+        max_wait (float): Seconds the embed stage waits for a batch to fill
+        queue_size (int): Capacity of each queue between stages
+        report_interval (float): Seconds between progress reports
+
+    Returns:
+        Pipeline: The pipeline, ready to `run`
+    """
+    from scraper import iter_talk_urls, fetch_talk, parse_talk, split_talks
+
+    indexes = {label: NearDuplicateIndex(dedup_threshold) for label in ('talks', 'paragraphs')} if dedup_threshold else None
+    distinct_counts = {'talks': 0, 'paragraphs': 0}
+    persister = StorePersister(output_dir, prefix, deduplicate=bool(dedup_threshold), reduction=reduction)
+
+    # Talks are numbered in crawl order; fetch and parse always pass the number on, with None for a failed talk
+    talk_order = InOrder()
+
+    def crawl(emit):
+        sequence = 0
+        for conference_url, year, month in conference_urls:
+            count = 0
+            for talk_url, _ in iter_talk_urls(conference_url, session):
+                emit((sequence, talk_url))
+                sequence += 1
+                count += 1
+            logging.info(f"Found {count} talk URLs for {year}-{month}")
+
+    def fetch(item, emit):
+        sequence, talk_url = item
+        html = fetch_talk(talk_url, session)
+        emit((sequence, (talk_url, html) if html is not None else None))
+
+    def parse(item, emit):
+        sequence, page = item
+        emit((sequence, parse_talk(*page) if page is not None else None))
+
+    def split(item, emit):
+        # Downloads finish out of order; put the talks back in crawl order
+        for talk in talk_order.add(*item):
+            if talk is None:
+                continue
+            emit(('talks', talk))
+            for paragraph in split_talks(talk):
+                emit(('paragraphs', paragraph))
+
+    def dedup(item, emit):
+        label, row = item
+        if indexes is not None:
+            dup_of = indexes[label].add(distinct_counts[label], row['text'])
+            if dup_of is not None:
+                emit(('duplicate', label, row, dup_of))
+                return
+        distinct_counts[label] += 1
+        emit(item)
+
+    def embed(items, emit):
+        by_label = {}
+        for item in items:
+            if item[0] == 'duplicate':
+                # Nothing to embed; passed on so the persist stage can record it
+                emit(item)
+            else:
+                by_label.setdefault(item[0], []).append(item[1])
+        for label, rows in by_label.items():
+            # Rows already in the store (or an interrupted run's checkpoint) keep their embedding
+            reused = persister.embedded(label, rows)
+            texts = [row['text'] for row, skip in zip(rows, reused) if not skip]
+            embeddings = process_func(texts) if texts else []
+            emit(('rows', label, rows, embeddings, reused))
+
+    pipeline = Pipeline(queue_size=queue_size, report_interval=report_interval)
+    pipeline.add_stage('crawl', crawl)
+    pipeline.add_stage('fetch', fetch, workers=fetch_workers)
+    pipeline.add_stage('parse', parse, workers=parse_workers)
+    pipeline.add_stage('split', split)
+    pipeline.add_stage('dedup', dedup)
+    pipeline.add_stage('embed', embed, batch_size=batch_size, max_wait=max_wait)
+    pipeline.add_stage('persist', persister.persist, batch_size=queue_size, flush=persister.finish)
+    return pipeline
+
+
+if __name__ == "__main__":
+    # Usage: python pipeline.py [free|openai|google|google_genai]
+    from config_loader import load_config, get_embedding_reduction, get_dedup_threshold, get_pipeline_settings
+    from scraper import years, get_conference_urls, setup_session
+
+    provider = sys.argv[1] if len(sys.argv) > 1 else 'free'
+    if provider not in PROVIDERS:
+        sys.exit(f"Unknown provider {provider!r}; expected one of {sorted(PROVIDERS)}")
+    module_name, function_name = PROVIDERS[provider]
+    process_func = getattr(importlib.import_module(module_name), function_name)
+
+    config = load_config()
+    queue_size, fetch_workers, batch_size = get_pipeline_settings(config)
+    session = setup_session()
+    pipeline = build_embedding_pipeline(
+        get_conference_urls(2025 - years, 2025),
+        process_func,
+        provider,
+        provider,
+        session,
+        dedup_threshold=get_dedup_threshold(config),
+        reduction=get_embedding_reduction(config),
+        fetch_workers=fetch_workers,
+        batch_size=batch_size,
+        queue_size=queue_size
+    )
+    start_time = time.time()
+    pipeline.run()
+    session.close()
+    print(f"Pipeline finished in {time.time() - start_time:.1f}s")
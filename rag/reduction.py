@@ -0,0 +1,277 @@
+import os
+import numpy as np
+from sklearn.decomposition import PCA
+from embedding_store import get_store_paths, load_embeddings, remove_derived_files
+from vector_index import ExactIndex, normalize_rows, sample_queries, recall_at_k
+
+REDUCTION_METHODS = ('pca', 'truncate')
+
+
+class Projection:
+    """
+    Linear map from full embeddings to fewer dimensions.
+
+    - "pca": principal components fitted on the normalized corpus,
+      `(x - mean) @ components.T`
+    - "truncate": the first `dimensions` coordinates, for Matryoshka-style
+      models trained so that prefixes are usable embeddings
+
+    The same projection is applied to stored rows and to queries, and it is
+    saved next to a store as `<base>_projection.npz`.
+    """
+
+    def __init__(self, method, dimensions, input_dimensions, mean=None, components=None):
+        """
+        Args:
+            method (str): "pca" or "truncate"
+            dimensions (int): Number of output dimensions
+            input_dimensions (int): Number of dimensions of the full embeddings
+            mean: PCA mean vector (PCA only)
+            components: PCA components, one row per output dimension (PCA only)
+        """
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Unknown reduction method {method!r}; expected one of {REDUCTION_METHODS}")
+        self.method = method
+        self.dimensions = int(dimensions)
+        self.input_dimensions = int(input_dimensions)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+
+    def transform(self, embeddings):
+        """
+        Project embeddings.
+
+        Rows that already have `dimensions` columns (for example queries
+        sampled from a reduced store) are returned unchanged.
+
+        Args:
+            embeddings: 2-D array with one full embedding per row
+
+        Returns:
+            numpy.ndarray: float32 array with `dimensions` columns
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[-1] == self.dimensions and embeddings.shape[-1] != self.input_dimensions:
+            return embeddings
+        if embeddings.shape[-1] != self.input_dimensions:
+            raise ValueError(f"Projection expects {self.input_dimensions} dimensions, got {embeddings.shape[-1]}")
+        if self.method == "truncate":
+            return np.ascontiguousarray(embeddings[..., :self.dimensions])
+        return (normalize_rows(embeddings.reshape(-1, self.input_dimensions)) - self.mean) @ self.components.T
+
+    def save(self, path):
+        """
+        Save the projection to an `.npz` file.
+
+        Args:
+            path (str): Output `.npz` file
+        """
+        tmp_file = path + '.tmp.npz'
+        arrays = {'method': self.method, 'dimensions': self.dimensions, 'input_dimensions': self.input_dimensions}
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a projection written by `save`.
+
+        Args:
+            path (str): `.npz` file
+
+        Returns:
+            Projection: Loaded projection
+        """
+        data = np.load(path)
+        method = str(data['method'])
+        return cls(method, int(data['dimensions']), int(data['input_dimensions']),
+                   mean=data['mean'] if method == "pca" else None,
+                   components=data['components'] if method == "pca" else None)
+
+
+def fit_projection(embeddings, dimensions, method="pca", sample_size=100000, random_state=42):
+    """
+    Fit a projection on a corpus.
+
+    Args:
+        embeddings: 2-D array of full embeddings (may be memory-mapped)
+        dimensions (int): Number of output dimensions
+        method (str): "pca" or "truncate"
+        sample_size (int): Maximum number of rows used to fit PCA
+        random_state (int): Seed for sampling and PCA
+
+    Returns:
+        Projection: Fitted projection
+    """
+    n_rows, input_dimensions = embeddings.shape
+    dimensions = min(int(dimensions), input_dimensions)
+    if method == "truncate":
+        return Projection(method, dimensions, input_dimensions)
+
+    sample = embeddings
+    if n_rows > sample_size:
+        rng = np.random.default_rng(random_state)
+        sample = embeddings[np.sort(rng.choice(n_rows, sample_size, replace=False))]
+    sample = normalize_rows(sample)
+    pca = PCA(n_components=min(dimensions, len(sample)), random_state=random_state)
+    pca.fit(sample)
+    return Projection(method, pca.n_components_, input_dimensions, mean=pca.mean_, components=pca.components_)
+
+
+def get_projection_path(path):
+    """
+    Get the projection file that belongs to an embedding store.
+
+    Args:
+        path (str): Base path of the store (or its CSV/.npy path)
+
+    Returns:
+        str: `<base>_projection.npz`
+    """
+    return get_store_paths(path)[0][:-len('.npy')] + '_projection.npz'
+
+
+def load_projection(path):
+    """
+    Load the projection saved next to a store, if there is one.
+
+    Args:
+        path (str): Base path of the store
+
+    Returns:
+        Projection: The store's projection, or None for stores with full embeddings
+    """
+    projection_path = get_projection_path(path)
+    if not os.path.exists(projection_path):
+        return None
+    projection = Projection.load(projection_path)
+    # A projection next to a full-width matrix is left over from an interrupted reduction
+    if np.load(get_store_paths(path)[0], mmap_mode='r').shape[1] != projection.dimensions:
+        return None
+    return projection
+
+
+def reduce_store(path, projection, block_rows=65536):
+    """
+    Replace a store's matrix with its projection and save the projection next to it.
+
+    The matrix is projected block by block and replaced atomically; the
+    metadata file is left untouched.
+
+    Args:
+        path (str): Base path of the store
+        projection (Projection): Projection to apply
+        block_rows (int): Rows projected at a time
+
+    Returns:
+        str: Path of the saved projection
+    """
+    if load_projection(path) is not None:
+        raise ValueError(f"Store {path} is already reduced")
+    embeddings_path, _ = get_store_paths(path)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    tmp_embeddings = embeddings_path + '.tmp'
+    out = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=embeddings.dtype,
+                                    shape=(len(embeddings), projection.dimensions))
+    for start in range(0, len(embeddings), block_rows):
+        out[start:start + block_rows] = projection.transform(embeddings[start:start + block_rows])
+    out.flush()
+    del out, embeddings
+
+    # Save the projection first, so a reduced matrix is never left without it
+    projection_path = get_projection_path(path)
+    projection.save(projection_path)
+    os.replace(tmp_embeddings, embeddings_path)
+    remove_derived_files(path)
+    return projection_path
+
+
+def reduce_stores(paths, dimensions, method="pca"):
+    """
+    Reduce several stores of the same embedding model with one shared projection.
+
+    The projection is fitted on the first store (normally the paragraphs,
+    the largest corpus) and applied to all of them, so they stay comparable.
+    Stores that are already reduced are skipped; if any of them is, its
+    projection is reused for the others.
+
+    Args:
+        paths (list): Base paths of the stores
+        dimensions (int): Number of output dimensions
+        method (str): "pca" or "truncate"
+
+    Returns:
+        Projection: The projection that was applied, or None if nothing was reduced
+    """
+    projections = [load_projection(path) for path in paths]
+    existing = [projection for projection in projections if projection is not None]
+    paths = [path for path, projection in zip(paths, projections) if projection is None]
+    if not paths:
+        return None
+    if existing:
+        projection = existing[0]
+    else:
+        _, embeddings = load_embeddings(paths[0])
+        projection = fit_projection(embeddings, dimensions, method=method)
+        del embeddings
+    for path in paths:
+        reduce_store(path, projection)
+        print(f"Reduced {path} to {projection.dimensions} dimensions ({projection.method})")
+    return projection
+
+
+def report_dimension_recall(path, dimensions=(32, 64, 128, 256), method="pca", top_k=10, n_queries=100):
+    """
+    Print recall@k of reduced embeddings against full-dimension exact search.
+
+    Queries are sampled from the store's rows and projected the same way as
+    the rows.
+
+    Args:
+        path (str): Base path of a store with full embeddings
+        dimensions: Output dimensions to try
+        method (str): "pca" or "truncate"
+        top_k (int): Number of results compared per query
+        n_queries (int): Number of sampled queries
+
+    Returns:
+        list: (dimensions, recall, fraction of the full size) for each setting
+    """
+    df, embeddings = load_embeddings(path)
+    full_index = ExactIndex(df, embeddings)
+    queries = sample_queries(full_index, n_queries)
+    report = []
+    for dimension in dimensions:
+        projection = fit_projection(embeddings, dimension, method=method)
+        reduced_index = ExactIndex(df, projection.transform(embeddings))
+        reduced_index.projection = projection
+        recall = recall_at_k(reduced_index, queries, top_k, exact_index=full_index)
+        size = projection.dimensions / embeddings.shape[1]
+        print(f"{method} {projection.dimensions}/{embeddings.shape[1]} dimensions: "
+              f"recall@{top_k}={recall:.3f}, {size:.0%} of the full size")
+        report.append((projection.dimensions, recall, size))
+    return report
+
+
+if __name__ == "__main__":
+    # One-off migration of existing stores, using the reduction configured in config.json
+    from config_loader import load_config, get_embedding_reduction
+    method, dimensions = get_embedding_reduction(load_config())
+    if not method:
+        print("Set reductionMethod and reductionDimensions in config.json to reduce existing stores.")
+    for directory in ['free', 'google', 'google_genai', 'openai']:
+        if not os.path.isdir(directory):
+            continue
+        # Paragraphs first: the projection is fitted on them
+        labels = ['paragraphs', 'talks'] + sorted(name[len(directory) + 1:-len('.npy')] for name in os.listdir(directory)
+                                                  if name.endswith('_clusters.npy'))
+        paths = [os.path.join(directory, f'{directory}_{label}') for label in labels]
+        paths = [path for path in paths if os.path.exists(get_store_paths(path)[0])]
+        if not paths:
+            continue
+        if method:
+            reduce_stores(paths, dimensions, method=method)
+        else:
+            report_dimension_recall(paths[0])
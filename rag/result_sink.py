@@ -0,0 +1,117 @@
+import json
+import threading
+
+
+def to_json_value(value):
+    """
+    Convert values `json` cannot serialize, such as numpy scalars from DataFrame rows.
+
+    Args:
+        value: Value that is not JSON serializable
+
+    Returns:
+        A JSON serializable equivalent
+    """
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class ResultSink:
+    """
+    Streaming output for semantic search runs.
+
+    Analytics records are appended to a JSON Lines file, one record per
+    line, as soon as they are complete, so the file never has to be held in
+    memory and is usable even if a run stops early. An optional
+    human-readable report is written to a second file, and can be echoed to
+    the console. Each file is opened once with a large write buffer, and
+    writes from several threads are serialized.
+
+    Use as a context manager, or call `close()` when done.
+    """
+
+    def __init__(self, records_file, report_file=None, console=True, buffer_size=1 << 20):
+        """
+        Args:
+            records_file (str): Path to the JSON Lines analytics file (overwritten)
+            report_file (str): Path to the human-readable report (None to skip it)
+            console (bool): Whether `echo` also prints to the console
+            buffer_size (int): Write buffer size in bytes for each file
+        """
+        self.records_file = records_file
+        self.report_file = report_file
+        self.console = console
+        self.record_count = 0
+        self._records = open(records_file, 'w', encoding='utf-8', buffering=buffer_size)
+        self._report = open(report_file, 'w', encoding='utf-8', buffering=buffer_size) if report_file else None
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        """
+        Append one analytics record as a JSON line.
+
+        Args:
+            record (dict): JSON serializable record (numpy scalars are converted)
+        """
+        line = json.dumps(record, default=to_json_value) + "\n"
+        with self._lock:
+            self._records.write(line)
+            self.record_count += 1
+
+    def report(self, text):
+        """
+        Append text to the human-readable report only.
+
+        Args:
+            text (str): Text to write
+        """
+        if self._report is not None:
+            with self._lock:
+                self._report.write(text)
+
+    def echo(self, text, report_text=None):
+        """
+        Print text to the console and append it to the report.
+
+        Args:
+            text (str): Text for the console
+            report_text (str): Text for the report, if it differs from `text`
+        """
+        if self.console:
+            print(text, end='', flush=True)
+        self.report(text if report_text is None else report_text)
+
+    def flush(self):
+        with self._lock:
+            self._records.flush()
+            if self._report is not None:
+                self._report.flush()
+
+    def close(self):
+        with self._lock:
+            self._records.close()
+            if self._report is not None:
+                self._report.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_records(records_file):
+    """
+    Iterate over the records of a JSON Lines analytics file.
+
+    Args:
+        records_file (str): Path written by ResultSink
+
+    Yields:
+        dict: One record per line
+    """
+    with open(records_file, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
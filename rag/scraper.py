@@ -35,18 +35,17 @@ def get_conference_urls(start_year, end_year):
             for year in range(start_year, end_year + 1)
             for month in ['04', '10']]
 
-def get_talk_urls(conference_url, year, month, session):
-    """Fetch talk URLs from a conference page, excluding session videos."""
+def iter_talk_urls(conference_url, session):
+    """Yield talk URLs from a conference page as they are found, excluding session videos."""
     try:
         response = session.get(conference_url, timeout=10)
         response.raise_for_status()
         response.encoding = 'utf-8'
     except requests.RequestException as e:
         logging.error(f"Error accessing {conference_url}: {e}")
-        return []
+        return
 
     soup = BeautifulSoup(response.text, 'html.parser')
-    talk_urls = []
     seen_urls = set()
     talk_counter = 1
     session_slugs = [
@@ -82,25 +81,29 @@ def get_talk_urls(conference_url, year, month, session):
         except requests.RequestException:
             continue
 
-        talk_urls.append((canonical_url, str(talk_counter).zfill(2)))
+        yield canonical_url, str(talk_counter).zfill(2)
         talk_counter += 1
 
+def get_talk_urls(conference_url, year, month, session):
+    """Fetch talk URLs from a conference page, excluding session videos."""
+    talk_urls = list(iter_talk_urls(conference_url, session))
     logging.info(f"Found {len(talk_urls)} talk URLs for {year}-{month}")
     return talk_urls
 
-def scrape_talk(args):
-    """Scrape metadata and transcript for a single talk."""
-    talk_url, year, talk_number, session = args
-    start_time = time.time()
+def fetch_talk(talk_url, session):
+    """Download the HTML of a talk page, or return None if it cannot be fetched."""
     try:
         response = session.get(talk_url, timeout=10)
         response.raise_for_status()
         response.encoding = 'utf-8'
     except requests.RequestException as e:
         logging.error(f"Error accessing {talk_url}: {e}")
-        return None, talk_number
+        return None
+    return response.text
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+def parse_talk(talk_url, html):
+    """Extract metadata and transcript from a talk page, or return None if it has neither."""
+    soup = BeautifulSoup(html, 'html.parser')
 
     def clean_text(text):
         if not text:
@@ -122,14 +125,11 @@ def scrape_talk(args):
     content = "\n\n".join(clean_text(p.text) for p in content_array.find_all("p")) if content_array else "No Content Found"
 
     if speaker == "No Speaker Found" and content == "No Content Found":
-        return None, talk_number
+        return None
 
     year = re.search(r'/(\d{4})/', talk_url).group(1)
     season = "April" if "/04/" in talk_url else "October"
 
-    elapsed_time = time.time() - start_time
-    logging.debug(f"Processed {talk_url} in {elapsed_time:.2f} seconds")
-
     return {
         "title": title,
         "speaker": speaker,
@@ -138,7 +138,22 @@ def scrape_talk(args):
         "season": season,
         "url": talk_url,
         "text": content,
-    }, talk_number
+    }
+
+def scrape_talk(args):
+    """Scrape metadata and transcript for a single talk."""
+    talk_url, year, talk_number, session = args
+    start_time = time.time()
+    html = fetch_talk(talk_url, session)
+    if html is None:
+        return None, talk_number
+
+    talk = parse_talk(talk_url, html)
+
+    elapsed_time = time.time() - start_time
+    logging.debug(f"Processed {talk_url} in {elapsed_time:.2f} seconds")
+
+    return talk, talk_number
 
 def split_talks(talk):
     """Split the talk content into paragraphs."""
@@ -0,0 +1,510 @@
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+import numpy as np
+from config_loader import get_search_server_address, get_search_server_batching, get_generation_timeout
+from semantic_search import (
+    config, queries, answer_cache, SEARCH_MODES, load_all_indexes, load_all_lexical_indexes, get_sentence_transformer, get_sentence_transformer_embeddings,
+    get_google_genai_embeddings, format_results_for_ai_generation, generate_answer_with_context, create_json_output
+)
+from semantic_search_generic import search_embeddings_batch, hybrid_search
+from result_sink import to_json_value
+
+# Query embedder and model label for the vectors of each source
+EMBEDDERS = {
+    'free': (get_sentence_transformer_embeddings, "SentenceTransformer"),
+    'google_genai': (get_google_genai_embeddings, "Google GenAI"),
+}
+
+
+def filters_key(filters):
+    """
+    Get a hashable key that is equal for equal metadata filters.
+
+    Sets and ranges (see MetadataIndex) are not JSON values; they are keyed
+    by their type and sorted members.
+
+    Args:
+        filters (dict): Metadata filters, or None
+
+    Returns:
+        str: JSON text of the filters
+    """
+    def encode(value):
+        if isinstance(value, (set, frozenset)):
+            return f"{type(value).__name__}:{sorted(map(repr, value))}"
+        return repr(value)
+
+    return json.dumps(filters, sort_keys=True, default=encode)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent requests into micro-batches.
+
+    Requests are queued and a single worker thread takes up to `max_batch_size`
+    of them at a time, waiting at most `max_wait_ms` after the first one for
+    the batch to fill. `process_batch` gets the list of items and must return
+    one result per item. An Exception instance in place of a result is raised
+    from that item's future only, so one bad item does not fail its batch.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5):
+        """
+        Args:
+            process_batch: Function mapping a list of items to a list of results
+            max_batch_size (int): Maximum number of items processed together
+            max_wait_ms (float): Maximum time the first item waits for others to join its batch
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch.
+
+        Args:
+            item: Item passed to `process_batch`
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def close(self):
+        """Stop the worker after the queued items are processed."""
+        self._queue.put(None)
+        self._worker.join()
+
+
+def latency_percentiles(latencies):
+    """
+    Summarize latencies in milliseconds.
+
+    Args:
+        latencies: Latencies in seconds
+
+    Returns:
+        dict: p50, p95, p99 and max latency in milliseconds
+    """
+    if len(latencies) == 0:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2), 'max_ms': round(float(max(latencies)) * 1000, 2)}
+
+
+class LatencyTracker:
+    """
+    Record request latencies and report sustained QPS and tail latency.
+
+    Only the most recent `window` requests are kept.
+    """
+
+    def __init__(self, window=10000):
+        self.started = time.time()
+        self.count = 0
+        self.errors = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.count += 1
+            self.errors += int(error)
+            self._recent.append((time.time(), latency))
+
+    def summary(self):
+        """
+        Returns:
+            dict: Request counts, QPS over the last minute, and latency percentiles
+        """
+        with self._lock:
+            recent = list(self._recent)
+            count, errors = self.count, self.errors
+        now = time.time()
+        last_minute = [latency for finished, latency in recent if finished >= now - 60]
+        elapsed = min(60, max(now - self.started, 1e-9))
+        summary = {'requests': count, 'errors': errors,
+                   'qps_last_minute': round(len(last_minute) / elapsed, 2)}
+        summary.update(latency_percentiles([latency for _, latency in recent]))
+        return summary
+
+
+class SearchService:
+    """
+    Resident semantic search over every loaded index.
+
+    Indexes and embedding models are loaded once. Concurrent queries against
+    the same source are embedded together and scored with one matrix-matrix
+    product per (data type, top_k, filters) group. Hybrid queries are fused
+    with BM25 one at a time.
+    """
+
+    def __init__(self, loaded_data, max_batch_size=32, max_wait_ms=5, lexical_data=None):
+        """
+        Args:
+            loaded_data (dict): Indexes by source and data type, as returned by load_all_indexes
+            max_batch_size (int): Maximum number of queries embedded and scored together
+            max_wait_ms (float): Maximum time a query waits for others to join its batch
+            lexical_data (dict): BM25 indexes by source and data type for hybrid search,
+                as returned by load_all_lexical_indexes
+        """
+        self.loaded_data = loaded_data
+        self.lexical_data = lexical_data or {}
+        self.search_stats = LatencyTracker()
+        self.rag_stats = LatencyTracker()
+        self.batchers = {
+            source: MicroBatcher(lambda items, source=source: self._search_batch(source, items),
+                                 max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+            for source in loaded_data if source in EMBEDDERS
+        }
+
+    def _search_batch(self, source, items):
+        embed, _ = EMBEDDERS[source]
+        query_embeddings = np.asarray(embed([item['query'] for item in items]))
+
+        results = [None] * len(items)
+        groups = {}
+        for i, item in enumerate(items):
+            try:
+                key = (item['data_type'], item['top_k'], filters_key(item['filters']), item['mode'])
+            except Exception as e:
+                results[i] = e
+                continue
+            groups.setdefault(key, []).append(i)
+
+        for (data_type, top_k, _, mode), positions in groups.items():
+            index = self.loaded_data[source][data_type]
+            filters = items[positions[0]]['filters']
+            try:
+                if mode == 'hybrid':
+                    lexical_index = self.lexical_data[source][data_type]
+                    group_results = [hybrid_search(items[i]['query'], query_embeddings[i], index, lexical_index,
+                                                   top_k=top_k, filters=filters) for i in positions]
+                else:
+                    group_results = search_embeddings_batch(query_embeddings[positions], index, top_k=top_k,
+                                                            filters=filters)
+            except Exception as e:
+                # Only the requests of this group fail
+                group_results = [e] * len(positions)
+            for i, group_result in zip(positions, group_results):
+                results[i] = group_result if isinstance(group_result, Exception) else (group_result, query_embeddings[i])
+        return results
+
+    def _check(self, source, data_type, mode, filters):
+        if source not in self.batchers:
+            raise ValueError(f"Unknown source '{source}'. Available: {sorted(self.batchers)}")
+        index = self.loaded_data[source].get(data_type)
+        if index is None:
+            available = [name for name, index in self.loaded_data[source].items() if index is not None]
+            raise ValueError(f"No '{data_type}' index loaded for '{source}'. Available: {available}")
+        if filters is not None:
+            if not isinstance(filters, dict):
+                raise ValueError(f"Filters must be an object mapping column names to conditions, got {filters!r}")
+            unknown = sorted(set(filters) - set(index.metadata.columns))
+            if unknown:
+                raise ValueError(f"Cannot filter {data_type} on {unknown}; indexed columns are {sorted(index.metadata.columns)}")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'. Available: {list(SEARCH_MODES)}")
+        if mode == 'hybrid' and self.lexical_data.get(source, {}).get(data_type) is None:
+            raise ValueError(f"No BM25 index loaded for '{source}' {data_type}; hybrid search is unavailable")
+
+    def search(self, query, source='free', data_type='paragraphs', top_k=3, filters=None, mode='vector'):
+        """
+        Search one index; concurrent calls are micro-batched.
+
+        Args:
+            query (str): Query text
+            source (str): Embedding source (free or google_genai)
+            data_type (str): Type of data (clusters, paragraphs, talks)
+            top_k (int): Number of results to return
+            filters (dict): Optional metadata filters (see search_embeddings)
+            mode (str): "vector", or "hybrid" to fuse the ranking with BM25 (see hybrid_search)
+
+        Returns:
+            pandas.DataFrame: Search results
+        """
+        return self._search(query, source, data_type, top_k, filters, mode)[0]
+
+    def _search(self, query, source, data_type, top_k, filters, mode):
+        self._check(source, data_type, mode, filters)
+        item = {'query': query, 'data_type': data_type, 'top_k': int(top_k), 'filters': filters, 'mode': mode}
+        return self.batchers[source].submit(item).result()
+
+    def rag(self, query, source='free', data_type='paragraphs', top_k=3, filters=None, mode='vector'):
+        """
+        Search one index and generate an answer from the results.
+
+        Answers for repeated or paraphrased questions over the same results
+        come from the answer cache.
+
+        Returns:
+            tuple: (results DataFrame, generated answer)
+        """
+        results, query_embedding = self._search(query, source, data_type, top_k, filters, mode)
+        if results.empty:
+            return results, "No results found."
+        context = format_results_for_ai_generation(results, data_type)
+        answer = generate_answer_with_context(query, context, timeout=get_generation_timeout(config),
+                                              query_embedding=query_embedding, embedding_model=EMBEDDERS[source][1])
+        return results, answer
+
+    def stats(self):
+        """
+        Returns:
+            dict: Request statistics per endpoint, micro-batch sizes per source and answer cache hits
+        """
+        batching = {
+            source: {'batches': batcher.batches, 'queries': batcher.items,
+                     'avg_batch_size': round(batcher.items / batcher.batches, 2) if batcher.batches else None}
+            for source, batcher in self.batchers.items()
+        }
+        return {'search': self.search_stats.summary(), 'rag': self.rag_stats.summary(), 'batching': batching,
+                'answer_cache': answer_cache.stats() if answer_cache is not None else None}
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints:
+
+        GET  /health
+        GET  /stats
+        POST /search  {"query", "source", "data_type", "top_k", "filters", "mode"}
+        POST /rag     same fields; the response also holds "ai_answer"
+    """
+
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=to_json_value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ('/search', '/rag'):
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        tracker = self.service.search_stats if self.path == '/search' else self.service.rag_stats
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+            query = params['query']
+            source = params.get('source', 'free')
+            data_type = params.get('data_type', 'paragraphs')
+            args = (query, source, data_type, params.get('top_k', 3), params.get('filters'),
+                    params.get('mode', 'vector'))
+            if self.path == '/search':
+                results, ai_answer = self.service.search(*args), None
+            else:
+                results, ai_answer = self.service.rag(*args)
+        except (KeyError, ValueError, TypeError) as e:
+            tracker.record(time.perf_counter() - start, error=True)
+            self._send_json(400, {'error': f"Bad request: {e}"})
+            return
+        except Exception as e:
+            tracker.record(time.perf_counter() - start, error=True)
+            self._send_json(500, {'error': str(e)})
+            return
+        latency = time.perf_counter() - start
+        tracker.record(latency)
+        payload = create_json_output(query, results, data_type, source, EMBEDDERS[source][1], ai_answer)
+        payload['latency_ms'] = round(latency * 1000, 2)
+        self._send_json(200, payload)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the latency being measured
+        pass
+
+
+class SearchHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under concurrent load
+    request_queue_size = 128
+
+
+def serve(host=None, port=None, max_batch_size=None, max_wait_ms=None, **index_params):
+    """
+    Load every index and model once and serve search requests until interrupted.
+
+    Settings not given are read from config.json.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on
+        max_batch_size (int): Maximum number of queries per micro-batch
+        max_wait_ms (float): Maximum time a query waits for its batch to fill
+        **index_params: Passed to load_vector_index (e.g. kind="ivf")
+    """
+    config_host, config_port = get_search_server_address(config)
+    config_batch_size, config_wait_ms = get_search_server_batching(config)
+    host = host or config_host
+    port = port or config_port
+
+    print("Loading all embedding data...")
+    loaded_data = load_all_indexes(**index_params)
+    print("Loading BM25 indexes for hybrid search...")
+    lexical_data = load_all_lexical_indexes()
+    print("Loading Sentence Transformer model...")
+    get_sentence_transformer()
+
+    service = SearchService(loaded_data, max_batch_size=max_batch_size or config_batch_size,
+                            max_wait_ms=config_wait_ms if max_wait_ms is None else max_wait_ms,
+                            lexical_data=lexical_data)
+    SearchRequestHandler.service = service
+    server = SearchHTTPServer((host, port), SearchRequestHandler)
+    print(f"Search server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(json.dumps(service.stats(), indent=2))
+
+
+def run_load_test(base_url, test_queries=None, endpoint='/search', concurrency=16, duration=30,
+                  source='free', data_type='paragraphs', top_k=3, mode='vector'):
+    """
+    Send requests from concurrent clients for a fixed time and report throughput and tail latency.
+
+    Args:
+        base_url (str): Server URL, e.g. "http://127.0.0.1:8000"
+        test_queries: Queries to cycle through (defaults to the semantic_search queries)
+        endpoint (str): "/search" or "/rag"
+        concurrency (int): Number of clients sending requests back to back
+        duration (float): Test length in seconds
+        source (str): Embedding source
+        data_type (str): Type of data searched
+        top_k (int): Number of results per query
+        mode (str): Search mode sent with each request ("vector" or "hybrid")
+
+    Returns:
+        dict: Request counts, sustained QPS and latency percentiles
+    """
+    test_queries = test_queries or queries
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        i = offset
+        while time.perf_counter() < stop_at:
+            body = json.dumps({'query': test_queries[i % len(test_queries)], 'source': source,
+                               'data_type': data_type, 'top_k': top_k, 'mode': mode}).encode('utf-8')
+            req = urlrequest.Request(base_url + endpoint, data=body, headers={'Content-Type': 'application/json'})
+            start = time.perf_counter()
+            try:
+                with urlrequest.urlopen(req) as response:
+                    response.read()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except (HTTPError, OSError) as e:
+                with lock:
+                    errors.append(e)
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {'requests': len(latencies), 'errors': len(errors), 'concurrency': concurrency,
+              'qps': round(len(latencies) / elapsed, 2)}
+    report.update(latency_percentiles(latencies))
+    print(f"{endpoint}: {report['requests']} requests in {elapsed:.1f}s with {concurrency} clients "
+          f"({report['errors']} errors)")
+    print(f"Sustained QPS: {report['qps']}")
+    print(f"Latency p50/p95/p99/max: {report['p50_ms']} / {report['p95_ms']} / {report['p99_ms']} / {report['max_ms']} ms")
+    if errors:
+        print(f"First error: {errors[0]}")
+    return report
+
+
+if __name__ == "__main__":
+    # python search_server.py                               -> serve
+    # python search_server.py bench [concurrency] [seconds] -> load test a running server
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        host, port = get_search_server_address(config)
+        concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+        duration = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+        run_load_test(f"http://{host}:{port}", concurrency=concurrency, duration=duration)
+    else:
+        serve()
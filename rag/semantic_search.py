@@ -1,62 +1,56 @@
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
-from config_loader import load_config, get_sentence_transformer_model, get_google_ai_key, get_google_embedding_model
+from config_loader import load_config, get_sentence_transformer_model, get_google_ai_key, get_google_embedding_model, get_query_cache_memory_entries, get_generation_max_in_flight, get_generation_timeout, get_answer_cache_settings, get_max_context_tokens
 import ast
-import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from google_genai_batch import embed_contents
+from embedding_cache import open_embedding_cache, QueryEmbeddingCache
+from answer_cache import AnswerCache
+from context_packer import pack_context
+from result_sink import ResultSink
 
-# TODO: make results easy to feed into AI
-# then have AI answers the question
-# then display the semantic search results with the AI generation (Retrieval w/ Generation)
-
-def format_results_for_ai_generation(results, data_type):
+def format_results_for_ai_generation(results, data_type, max_tokens=None):
     """
     Format search results specifically for AI generation.
     
+    The context is packed in similarity order into a token budget, trimmed at
+    paragraph boundaries and without near-duplicate passages (see context_packer).
+    
     Args:
         results (pandas.DataFrame): Search results
         data_type (str): Type of data (clusters, paragraphs, talks)
+        max_tokens (int): Token budget for the context (defaults to maxContextTokens in config.json)
     
     Returns:
         str: Formatted context string for AI generation
-    """    
-    context = ""
-    
-    for idx, row in results.iterrows():
-        context += f"\nResult {idx + 1} (Similarity: {row['similarity']:.4f})\n"
-        context += f"Title: {row['title']}\n"
-        context += f"Speaker: {row['speaker']}\n"
-        
-        if 'year' in row and 'season' in row:
-            context += f"Year: {row['year']} {row['season']}\n"
-        
-        # Add text content
-        if data_type == "clusters" and 'text' in row:
-            # For clusters, text is a list of paragraphs
-            try:
-                paragraphs = ast.literal_eval(row['text'])
-                context += "Content:\n"
-                for i, paragraph in enumerate(paragraphs[:3]):  # Show top 3 paragraphs
-                    context += f"  {paragraph}\n"
-            except:
-                context += f"Content: {row['text']}\n"
-        elif 'text' in row:
-            # For talks and paragraphs, text is a single string
-            context += f"Content: {row['text']}\n"
-        
-        context += "-" * 40 + "\n"
-    
+    """
+    if max_tokens is None:
+        max_tokens = get_max_context_tokens(config)
+    context, _ = pack_context([(results, data_type)], max_tokens=max_tokens)
     return context
 
-def generate_answer_with_context(query, context, model=None):
+def generate_answer_with_context(query, context, model=None, on_chunk=None, timeout=None,
+                                 query_embedding=None, embedding_model=None):
     """
     Generate an answer to a query using provided context.
     
+    Answers are looked up in the answer cache first: by exact query and
+    context, then, when `query_embedding` is given, by query similarity for
+    the same context. Successful answers are added to the cache.
+    
     Args:
         query (str): The user's query
         context (str): Context information from semantic search results
         model: Google Generative AI model (if None, uses the global generation_model)
+        on_chunk: Optional function called with each piece of text as it is generated;
+            the answer is streamed when given
+        timeout (float): Optional timeout in seconds for the generation request
+        query_embedding: Optional query embedding for semantic answer cache hits
+        embedding_model (str): Name of the model that produced `query_embedding`
     
     Returns:
         str: Generated answer
@@ -65,7 +59,10 @@ def generate_answer_with_context(query, context, model=None):
         model = generation_model
     
     if model is None:
-        return "Error: Google Generative AI model not configured for text generation."
+        message = "Error: Google Generative AI model not configured for text generation."
+        if on_chunk is not None:
+            on_chunk(message)
+        return message
     
     # Create the prompt
     prompt = f"""
@@ -79,12 +76,36 @@ Question: {query}
 Please provide a comprehensive answer based on the context above. If the context doesn't contain relevant information to answer the question, please state that clearly.
 """
     
+    model_name = getattr(model, 'model_name', str(model))
+    if answer_cache is not None:
+        answer = answer_cache.get(query, context, model_name, query_embedding, embedding_model)
+        if answer is not None:
+            if on_chunk is not None:
+                on_chunk(answer)
+            return answer
+    
+    request_options = {'timeout': timeout} if timeout is not None else None
+    parts = []
     try:
-        # Generate the response
-        response = model.generate_content(prompt)
-        return response.text
+        if on_chunk is None:
+            # Generate the response
+            response = model.generate_content(prompt, request_options=request_options)
+            answer = response.text
+        else:
+            for chunk in model.generate_content(prompt, stream=True, request_options=request_options):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    on_chunk(chunk.text)
+            answer = ''.join(parts)
+        if answer_cache is not None:
+            answer_cache.put(query, context, model_name, answer, query_embedding, embedding_model)
+        return answer
     except Exception as e:
-        return f"Error generating answer: {e}"
+        message = f"Error generating answer: {e}"
+        if on_chunk is not None:
+            message = ("\n" if parts else "") + message
+            on_chunk(message)
+        return ''.join(parts) + message
 
 def create_json_output(query, results, data_type, source, model_name, ai_answer):
     """
@@ -150,20 +171,29 @@ def create_json_output(query, results, data_type, source, model_name, ai_answer)
     return json_output
 
 # Load the semantic search functions from our module
-from semantic_search_generic import load_embedding_data, search_embeddings, display_results
+from semantic_search_generic import (
+    load_vector_index, load_lexical_index, search_embeddings_batch, hybrid_search, measure_cascade_recall, display_results
+)
+from vector_index import BlockwiseIndex, QuantizedIndex, report_throughput, report_quantization
 
 # Load configuration
 config = load_config()
 
-# Configure Google Generative AI for text generation
-try:
-    google_ai_key = get_google_ai_key(config)
-    genai.configure(api_key=google_ai_key)
-    # Initialize the model for text generation
-    generation_model = genai.GenerativeModel('gemini-2.5-flash')
-except Exception as e:
-    print(f"Warning: Could not configure Google Generative AI for text generation: {e}")
-    generation_model = None
+# Query embeddings are cached in memory and spilled to the shared embedding cache
+query_cache = QueryEmbeddingCache(
+    open_embedding_cache(config, "query"),
+    memory_entries=get_query_cache_memory_entries(config)
+)
+
+# Generated answers are reused for repeated and paraphrased questions over the same context
+answer_cache_entries, answer_cache_ttl, answer_cache_threshold = get_answer_cache_settings(config)
+answer_cache = AnswerCache(answer_cache_entries, answer_cache_ttl, answer_cache_threshold) if answer_cache_entries else None
+
+# Number of candidate talks whose paragraphs are scored in cascade search
+CASCADE_CANDIDATES = 10
+
+# "vector" ranks by embedding similarity only; "hybrid" fuses it with BM25 (see hybrid_search)
+SEARCH_MODES = ('vector', 'hybrid')
 
 queries = [
     "How can I gain a testimony of Jesus Christ?",
@@ -173,45 +203,128 @@ queries = [
     "How can I prepare for the second coming of Jesus Christ?",
 ]
 
+_sentence_transformer = None
+_genai_configured = False
+
+def get_sentence_transformer():
+    """
+    Get the process-wide Sentence Transformer, loading it on first use.
+    """
+    global _sentence_transformer
+    if _sentence_transformer is None:
+        _sentence_transformer = SentenceTransformer(get_sentence_transformer_model(config))
+    return _sentence_transformer
+
+def configure_genai():
+    """
+    Configure the Google Generative AI SDK once per process.
+    """
+    global _genai_configured
+    if not _genai_configured:
+        genai.configure(api_key=get_google_ai_key(config))
+        _genai_configured = True
+
+# Configure Google Generative AI for text generation
+try:
+    configure_genai()
+    # Initialize the model for text generation
+    generation_model = genai.GenerativeModel('gemini-2.5-flash')
+except Exception as e:
+    print(f"Warning: Could not configure Google Generative AI for text generation: {e}")
+    generation_model = None
+
 def get_sentence_transformer_embeddings(texts):
     """
     Generate embeddings using Sentence Transformer model.
+    
+    Queries found in the query embedding cache are not re-encoded.
     """
-    sentence_transformer_model = get_sentence_transformer_model(config)
-    model = SentenceTransformer(sentence_transformer_model)
-    embeddings = model.encode(texts)
-    return embeddings
+    model_name = f"sentence_transformer/{get_sentence_transformer_model(config)}"
+    embeddings = query_cache.embed(texts, model_name, lambda missing: get_sentence_transformer().encode(missing))
+    return np.array(embeddings)
 
 def get_google_genai_embeddings(texts, model_name=None):
     """
     Generate embeddings using Google Generative AI.
-    """
-    # Get Google AI API key
-    google_ai_key = get_google_ai_key(config)
-    
-    # Configure the SDK
-    genai.configure(api_key=google_ai_key)
     
+    Queries found in the query embedding cache are not sent to the API.
+    """
     # Get model name
     if model_name is None:
         model_name = get_google_embedding_model(config)
     
-    # Generate embeddings
-    embeddings = []
-    for text in texts:
-        try:
-            result = genai.embed_content(
-                model=f'models/{model_name}',
-                content=text
-            )
-            embeddings.append(result['embedding'])
-        except Exception as e:
-            print(f"Error generating embedding for text: {e}")
-            # Return a zero vector of appropriate size as fallback
-            embeddings.append([0.0] * 768)  # Standard size for many embedding models
+    def embed_missing(missing):
+        configure_genai()
+        # Generate embeddings in one batched request
+        return embed_contents(missing, model_name)
     
+    embeddings = query_cache.embed(texts, f"google_genai/{model_name}", embed_missing)
     return np.array(embeddings)
 
+# Embedding files for both free and google_genai
+DATA_FILES = {
+    'free': {
+        'clusters': 'free/free_3_clusters.csv',
+        'paragraphs': 'free/free_paragraphs.csv',
+        'talks': 'free/free_talks.csv'
+    },
+    'google_genai': {
+        'clusters': 'google_genai/google_genai_3_clusters.csv',
+        'paragraphs': 'google_genai/google_genai_paragraphs.csv',
+        'talks': 'google_genai/google_genai_talks.csv'
+    }
+}
+
+def load_all_indexes(data_files=None, log=print, **index_params):
+    """
+    Load a search index for every embedding file.
+    
+    Args:
+        data_files (dict): File paths by source and data type (defaults to DATA_FILES)
+        log: Function called with each progress or error message
+        **index_params: Passed to load_vector_index (e.g. kind="ivf")
+    
+    Returns:
+        dict: Indexes by source and data type (None for files that failed to load)
+    """
+    if data_files is None:
+        data_files = DATA_FILES
+    loaded_data = {}
+    for source, files in data_files.items():
+        loaded_data[source] = {}
+        for data_type, file_path in files.items():
+            try:
+                loaded_data[source][data_type] = load_vector_index(file_path, **index_params)
+                log(f"Loaded {len(loaded_data[source][data_type])} {data_type} embeddings from {source}")
+            except Exception as e:
+                log(f"Error loading {file_path}: {e}")
+                loaded_data[source][data_type] = None
+    return loaded_data
+
+def load_all_lexical_indexes(data_files=None, log=print):
+    """
+    Load a BM25 index for every embedding file, for hybrid search.
+    
+    Args:
+        data_files (dict): File paths by source and data type (defaults to DATA_FILES)
+        log: Function called with each error message
+    
+    Returns:
+        dict: BM25 indexes by source and data type (None for files that failed to load)
+    """
+    if data_files is None:
+        data_files = DATA_FILES
+    lexical_data = {}
+    for source, files in data_files.items():
+        lexical_data[source] = {}
+        for data_type, file_path in files.items():
+            try:
+                lexical_data[source][data_type] = load_lexical_index(file_path)
+            except Exception as e:
+                log(f"Error loading BM25 index for {file_path}: {e}")
+                lexical_data[source][data_type] = None
+    return lexical_data
+
 def format_results_for_file(results, data_type, source, model_name, query):
     """
     Format results for writing to a file.
@@ -226,229 +339,354 @@ def format_results_for_file(results, data_type, source, model_name, query):
     Returns:
         str: Formatted results string
     """
-    output = f"\nQUERY: {query}\n"
-    output += f"MODEL: {model_name}\n"
-    output += f"SOURCE: {source}\n"
-    output += f"DATA TYPE: {data_type}\n"
-    output += f"FOUND {len(results)} RESULTS:\n"
-    output += "=" * 80 + "\n"
+    lines = [
+        f"\nQUERY: {query}",
+        f"MODEL: {model_name}",
+        f"SOURCE: {source}",
+        f"DATA TYPE: {data_type}",
+        f"FOUND {len(results)} RESULTS:",
+        "=" * 80,
+    ]
     
     for idx, row in results.iterrows():
-        output += f"\nResult {idx + 1} (Similarity: {row['similarity']:.4f})\n"
-        output += f"Title: {row['title']}\n"
-        output += f"Speaker: {row['speaker']}\n"
+        lines.append(f"\nResult {idx + 1} (Similarity: {row['similarity']:.4f})")
+        lines.append(f"Title: {row['title']}")
+        lines.append(f"Speaker: {row['speaker']}")
         
         if 'calling' in row:
-            output += f"Calling: {row['calling']}\n"
+            lines.append(f"Calling: {row['calling']}")
         
         if 'year' in row and 'season' in row:
-            output += f"Year: {row['year']} {row['season']}\n"
+            lines.append(f"Year: {row['year']} {row['season']}")
         
         if 'cluster_id' in row:
-            output += f"Cluster ID: {row['cluster_id']}\n"
+            lines.append(f"Cluster ID: {row['cluster_id']}")
         
         if 'paragraph_number' in row:
-            output += f"Paragraph #: {row['paragraph_number']}\n"
+            lines.append(f"Paragraph #: {row['paragraph_number']}")
+        
+        if row.get('duplicate_count', 0) > 0:
+            lines.append(f"Other occurrences: {row['duplicate_count']}")
         
-        output += f"URL: {row['url']}\n"
+        lines.append(f"URL: {row['url']}")
         
         # Add text content
         if data_type == "clusters" and 'text' in row:
             # For clusters, text is a list of paragraphs
             try:
                 paragraphs = ast.literal_eval(row['text'])
-                output += "Top paragraphs from cluster:\n"
+                lines.append("Top paragraphs from cluster:")
                 for i, paragraph in enumerate(paragraphs[:3]):  # Show top 3 paragraphs
-                    output += f"  {i+1}. {paragraph[:200]}...\n" if len(paragraph) > 200 else f"  {i+1}. {paragraph}\n"
+                    lines.append(f"  {i+1}. {paragraph[:200]}..." if len(paragraph) > 200 else f"  {i+1}. {paragraph}")
             except:
-                output += f"Text: {row['text'][:200]}...\n" if len(row['text']) > 200 else f"Text: {row['text']}\n"
+                lines.append(f"Text: {row['text'][:200]}..." if len(row['text']) > 200 else f"Text: {row['text']}")
         elif 'text' in row:
             # For talks and paragraphs, text is a single string
-            output += f"Text: {row['text'][:200]}...\n" if len(row['text']) > 200 else f"Text: {row['text']}\n"
+            lines.append(f"Text: {row['text'][:200]}..." if len(row['text']) > 200 else f"Text: {row['text']}")
         
-        output += "-" * 80 + "\n"
+        lines.append("-" * 80)
     
-    return output
+    return "\n".join(lines) + "\n"
 
-def semantic_search(output_file="semantic_search_results.txt", json_output_file="semantic_search_results.json"):
+def search_all_indexes(query_embeddings, loaded_data, top_k=3, query_texts=None, lexical_data=None):
     """
-    Example of how to perform semantic search on all embedding data using both SentenceTransformer and Google GenAI.
+    Search every loaded index for all queries at once.
+    
+    Each index scores the whole query batch with one matrix-matrix product.
+    With `lexical_data`, indexes that have a BM25 index are searched with
+    hybrid_search instead, one query at a time.
     
     Args:
-        output_file (str): Path to output file for results
-        json_output_file (str): Path to JSON output file for analytics
-    """
-    # Open output file
-    with open(output_file, 'w') as f:
-        f.write("SEMANTIC SEARCH RESULTS\n")
-        f.write("=" * 50 + "\n\n")
-    
-    # Initialize JSON output file
-    json_outputs = []
-    with open(json_output_file, 'w') as f:
-        json.dump([], f)
-    
-    # Define file paths for both free and google_genai
-    data_files = {
-        'free': {
-            'clusters': 'free/free_3_clusters.csv',
-            'paragraphs': 'free/free_paragraphs.csv',
-            'talks': 'free/free_talks.csv'
-        },
-        'google_genai': {
-            'clusters': 'google_genai/google_genai_3_clusters.csv',
-            'paragraphs': 'google_genai/google_genai_paragraphs.csv',
-            'talks': 'google_genai/google_genai_talks.csv'
-        }
-    }
+        query_embeddings (numpy.ndarray): 2-D array with one query embedding per row
+        loaded_data (dict): Indexes by source and data type (None for files that failed to load)
+        top_k (int): Number of results per query
+        query_texts (list): Query strings, required with `lexical_data`
+        lexical_data (dict): Optional BM25 indexes by source and data type, from load_all_lexical_indexes
     
-    # Load all data
-    print("Loading all embedding data...")
-    with open(output_file, 'a') as f:
-        f.write("Loading all embedding data...\n")
+    Returns:
+        dict: Lists of per-query results DataFrames by source and data type
+    """
+    all_results = {}
+    for source, data_dict in loaded_data.items():
+        all_results[source] = {}
+        for data_type, index in data_dict.items():
+            if index is None:
+                continue
+            lexical_index = (lexical_data or {}).get(source, {}).get(data_type)
+            if lexical_index is not None:
+                all_results[source][data_type] = [
+                    hybrid_search(query_text, query_embedding, index, lexical_index, top_k=top_k)
+                    for query_text, query_embedding in zip(query_texts, query_embeddings)
+                ]
+            else:
+                all_results[source][data_type] = search_embeddings_batch(query_embeddings, index, top_k=top_k)
+    return all_results
+
+def report_cascade_recall(query_embeddings, loaded_data, top_k=3):
+    """
+    Measure how much recall cascade search (talks/clusters -> paragraphs) loses versus a full scan.
     
-    loaded_data = {}
+    Args:
+        query_embeddings (numpy.ndarray): 2-D array with one query embedding per row
+        loaded_data (dict): Indexes by source and data type
+        top_k (int): Number of paragraphs compared per query
     
-    for source, files in data_files.items():
-        loaded_data[source] = {}
-        for data_type, file_path in files.items():
-            try:
-                loaded_data[source][data_type] = load_embedding_data(file_path)
-                print(f"Loaded {len(loaded_data[source][data_type])} {data_type} embeddings from {source}")
-                with open(output_file, 'a') as f:
-                    f.write(f"Loaded {len(loaded_data[source][data_type])} {data_type} embeddings from {source}\n")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-                with open(output_file, 'a') as f:
-                    f.write(f"Error loading {file_path}: {e}\n")
-                loaded_data[source][data_type] = None
+    Returns:
+        list: One report line per source and coarse index
+    """
+    lines = []
+    for source, data_dict in loaded_data.items():
+        paragraph_index = data_dict.get('paragraphs')
+        if paragraph_index is None:
+            continue
+        for coarse_type in ['talks', 'clusters']:
+            coarse_index = data_dict.get(coarse_type)
+            if coarse_index is None or coarse_index.dim != paragraph_index.dim:
+                continue
+            report = measure_cascade_recall(query_embeddings, coarse_index, paragraph_index,
+                                            top_k=top_k, n_candidates=CASCADE_CANDIDATES)
+            lines.append(f"CASCADE {source} {coarse_type} -> paragraphs (top {CASCADE_CANDIDATES} talks): "
+                         f"recall@{top_k} {report['recall']:.3f}, scanned {report['scanned_fraction']:.1%} of paragraphs, "
+                         f"{report['cascade_ms']:.2f} ms vs {report['full_ms']:.2f} ms per query")
+    return lines
+
+def report_scan_throughput(loaded_data, top_k=3):
+    """
+    Measure how fast every blockwise index scans its matrix (see report_throughput).
+    
+    Sample queries are drawn from each index's own rows, so every index is
+    measured with queries of its own dimension.
     
-    print("\nRUNNING QUERIES WITH SENTENCE TRANSFORMER MODEL")
-    print("="*60)
-    with open(output_file, 'a') as f:
-        f.write("\nRUNNING QUERIES WITH SENTENCE TRANSFORMER MODEL\n")
-        f.write("="*60 + "\n")
-    
-    for query in queries:
-        print(f"\n{'='*100}")
-        print(f"SEARCHING FOR: '{query}'")
-        print(f"{'='*100}")
-        with open(output_file, 'a') as f:
-            f.write(f"\n{'='*100}\n")
-            f.write(f"SEARCHING FOR: '{query}'\n")
-            f.write(f"{'='*100}\n")
+    Args:
+        loaded_data (dict): Indexes by source and data type
+        top_k (int): Number of results per query
+    
+    Returns:
+        list: One report line per blockwise index
+    """
+    lines = []
+    for source, data_dict in loaded_data.items():
+        for data_type, index in data_dict.items():
+            # Quantized indexes score their codes and keep no scan statistics
+            if not isinstance(index, BlockwiseIndex) or isinstance(index, QuantizedIndex):
+                continue
+            report_throughput(index, top_k=top_k,
+                              log=lambda message, source=source, data_type=data_type:
+                                  lines.append(f"THROUGHPUT {source} {data_type}: {message}"))
+    return lines
+
+def report_index_quantization(loaded_data, top_k=3):
+    """
+    Measure the memory saved and recall@k lost by every quantized index (see report_quantization).
+    
+    Args:
+        loaded_data (dict): Indexes by source and data type
+        top_k (int): Number of results compared per query
+    
+    Returns:
+        list: Report lines for each quantized index
+    """
+    lines = []
+    for source, data_dict in loaded_data.items():
+        for data_type, index in data_dict.items():
+            if isinstance(index, QuantizedIndex):
+                report_quantization(index, top_k=top_k,
+                                    log=lambda message, source=source, data_type=data_type:
+                                        lines.append(f"QUANTIZATION {source} {data_type}: {message}"))
+    return lines
+
+class OrderedOutput:
+    """
+    Write output from concurrent jobs in a fixed order while it streams in.
+    
+    Output is split into numbered sections. Writes to the earliest unfinished
+    section run immediately; writes to later sections are buffered and run
+    once every section before them has finished. Concurrent answers therefore
+    stream live without interleaving.
+    """
+    
+    def __init__(self):
+        self._sections = 0
+        self._current = 0
+        self._pending = {}
+        self._finished = set()
+        self._lock = threading.Lock()
+    
+    def section(self):
+        """
+        Returns:
+            int: Number of a new section, after all existing ones
+        """
+        with self._lock:
+            self._sections += 1
+            return self._sections - 1
+    
+    def write(self, section, func):
+        """
+        Run `func` (which writes some output) in section order.
+        
+        Args:
+            section (int): Section number from `section()`
+            func: Function with no arguments
+        """
+        with self._lock:
+            if section == self._current:
+                func()
+            else:
+                self._pending.setdefault(section, []).append(func)
+    
+    def finish(self, section):
+        """
+        Mark a section as complete and flush the sections that were waiting on it.
         
-        # Generate embedding using Sentence Transformer
-        query_embedding = get_sentence_transformer_embeddings([query])[0]
+        Args:
+            section (int): Section number from `section()`
+        """
+        with self._lock:
+            self._finished.add(section)
+            while self._current in self._finished:
+                self._current += 1
+                for func in self._pending.pop(self._current, []):
+                    func()
+    
+    def add(self, func):
+        """Add a complete section whose output is written by `func`."""
+        section = self.section()
+        self.write(section, func)
+        self.finish(section)
+
+def run_queries(queries, runs, loaded_data, sink, max_in_flight=None, timeout=None, lexical_data=None):
+    """
+    Search, generate answers for and report on a batch of queries.
+    
+    All searches run first. Answers for every (query, source, data type) are
+    then generated concurrently and streamed to the console and the report
+    as they arrive, in the same order as a sequential run. Each
+    (query, source, data type) is written to the sink as one analytics
+    record as soon as its answer is complete. If reporting one answer
+    fails, the error is written in its place and listed at the end; the
+    other answers are still reported.
+    
+    Args:
+        queries (list): Query strings
+        runs (list): (model name, model label, query embeddings) per embedding model;
+            the model name is used in the reports and the label as a heading
+        loaded_data (dict): Indexes by source and data type
+        sink (ResultSink): Output for the report and analytics records
+        max_in_flight (int): Maximum number of concurrent generation calls (defaults to config.json)
+        timeout (float): Timeout in seconds per generation call (defaults to config.json)
+        lexical_data (dict): Optional BM25 indexes by source and data type, for hybrid search
+    """
+    if max_in_flight is None:
+        max_in_flight = get_generation_max_in_flight(config)
+    if timeout is None:
+        timeout = get_generation_timeout(config)
+    
+    output = OrderedOutput()
+    jobs = []
+    for model_name, model_label, query_embeddings in runs:
+        all_results = search_all_indexes(query_embeddings, loaded_data, top_k=3,
+                                         query_texts=queries, lexical_data=lexical_data)
+        cascade_lines = report_cascade_recall(query_embeddings, loaded_data, top_k=3)
+        output.add(lambda model_label=model_label, cascade_lines=cascade_lines: sink.echo(
+            f"\nRUNNING QUERIES WITH {model_label} MODEL\n" + "="*60 + "\n" +
+            ''.join(line + "\n" for line in cascade_lines)))
         
-        # Perform semantic search on all data types for both sources
-        for source, data_dict in loaded_data.items():
-            print(f"\n--- Results from {source.upper()} ---")
-            with open(output_file, 'a') as f:
-                f.write(f"\n--- Results from {source.upper()} ---\n")
+        for query_idx, query in enumerate(queries):
+            output.add(lambda query=query: sink.echo(f"\n{'='*100}\nSEARCHING FOR: '{query}'\n{'='*100}\n"))
+            
+            # Report results on all data types for both sources
+            for source, results_by_type in all_results.items():
+                output.add(lambda source=source: sink.echo(f"\n--- Results from {source.upper()} ---\n"))
+                
+                for data_type, results_per_query in results_by_type.items():
+                    results = results_per_query[query_idx]
+                    if results.empty:
+                        sink.record(create_json_output(query, results, data_type, source, model_name, None))
+                        output.add(lambda data_type=data_type: sink.echo(f"\n{data_type.upper()}:\n  No results found.\n",
+                                                                          "  No results found.\n"))
+                        continue
+                    
+                    def write_results(results=results, data_type=data_type, source=source, model_name=model_name, query=query):
+                        if sink.console:
+                            print(f"\n{data_type.upper()}:")
+                            display_results(results, data_type)
+                        sink.report(format_results_for_file(results, data_type, source, model_name, query))
+                        sink.echo("\nAI GENERATED ANSWER:\n" + "=" * 40 + "\n")
+                    
+                    section = output.section()
+                    output.write(section, write_results)
+                    jobs.append((section, query, query_embeddings[query_idx], results, data_type, source, model_name))
+    
+    errors = []
+    
+    def generate(job):
+        section, query, query_embedding, results, data_type, source, model_name = job
+        try:
+            # Generate AI answer using the context, streaming it as it arrives
+            context = format_results_for_ai_generation(results, data_type)
+            ai_answer = generate_answer_with_context(
+                query, context, timeout=timeout,
+                on_chunk=lambda text: output.write(section, lambda: sink.echo(text)),
+                query_embedding=query_embedding, embedding_model=model_name
+            )
             
-            for data_type, df in data_dict.items():
-                if df is not None:
-                    print(f"\n{data_type.upper()}:")
-                    results = search_embeddings(query_embedding, df, top_k=3)
-                    if not results.empty:
-                        display_results(results, data_type)
-                        
-                        # Generate AI answer using the context
-                        context = format_results_for_ai_generation(results, data_type)
-                        ai_answer = generate_answer_with_context(query, context)
-                        
-                        # Display AI answer
-                        print(f"\nAI GENERATED ANSWER:")
-                        print("=" * 40)
-                        print(ai_answer)
-                        print("=" * 40)
-                        
-                        # Create JSON output for analytics
-                        json_output = create_json_output(query, results, data_type, source, "SentenceTransformer", ai_answer)
-                        
-                        # Write results to file
-                        formatted_results = format_results_for_file(results, data_type, source, "SentenceTransformer", query)
-                        with open(output_file, 'a') as f:
-                            f.write(formatted_results)
-                            f.write(f"\nAI GENERATED ANSWER:\n")
-                            f.write("=" * 40 + "\n")
-                            f.write(f"{ai_answer}\n")
-                            f.write("=" * 40 + "\n\n")
-                            # Write JSON output
-                            f.write(f"\nJSON OUTPUT:\n")
-                            f.write(json.dumps(json_output, indent=2) + "\n\n")
-                    else:
-                        print("  No results found.")
-                        with open(output_file, 'a') as f:
-                            f.write("  No results found.\n")
-    
-    print("\nRUNNING QUERIES WITH GOOGLE GENAI MODEL")
-    print("="*60)
-    with open(output_file, 'a') as f:
-        f.write("\nRUNNING QUERIES WITH GOOGLE GENAI MODEL\n")
-        f.write("="*60 + "\n")
-    
-    for query in queries:
-        print(f"\n{'='*100}")
-        print(f"SEARCHING FOR: '{query}'")
-        print(f"{'='*100}")
-        with open(output_file, 'a') as f:
-            f.write(f"\n{'='*100}\n")
-            f.write(f"SEARCHING FOR: '{query}'\n")
-            f.write(f"{'='*100}\n")
+            # Record JSON output for analytics
+            sink.record(create_json_output(query, results, data_type, source, model_name, ai_answer))
+            output.write(section, lambda: sink.echo("\n" + "=" * 40 + "\n", "\n" + "=" * 40 + "\n\n"))
+        except Exception as e:
+            errors.append((query, source, data_type, e))
+            output.write(section, lambda: sink.echo(f"\nError reporting the answer: {e}\n" + "=" * 40 + "\n"))
+        finally:
+            # Later sections are held back until this one finishes
+            output.finish(section)
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for future in [executor.submit(generate, job) for job in jobs]:
+            future.result()
+    if errors:
+        print(f"\n{len(errors)} of {len(jobs)} answers could not be reported:")
+        for query, source, data_type, e in errors:
+            print(f"  '{query}' ({source} {data_type}): {e}")
+
+def semantic_search(output_file="semantic_search_results.txt", json_output_file="semantic_search_results.jsonl",
+                    mode="vector", **index_params):
+    """
+    Example of how to perform semantic search on all embedding data using both SentenceTransformer and Google GenAI.
+    
+    Args:
+        output_file (str): Path to the human-readable results report (None to skip it)
+        json_output_file (str): Path to the JSON Lines analytics file, one record per query, source and data type
+        mode (str): "vector" for embedding search, or "hybrid" to fuse it with BM25 keyword search
+        **index_params: Passed to load_vector_index (e.g. kind="blockwise")
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'. Available: {list(SEARCH_MODES)}")
+    with ResultSink(json_output_file, output_file) as sink:
+        sink.report("SEMANTIC SEARCH RESULTS\n" + "=" * 50 + "\n\n")
         
-        # Generate embedding using Google GenAI
-        query_embedding = get_google_genai_embeddings([query])[0]
+        # Load all data
+        sink.echo("Loading all embedding data...\n")
+        loaded_data = load_all_indexes(log=lambda message: sink.echo(message + "\n"), **index_params)
+        for line in report_scan_throughput(loaded_data) + report_index_quantization(loaded_data):
+            sink.echo(line + "\n")
+        lexical_data = load_all_lexical_indexes(log=lambda message: sink.echo(message + "\n")) if mode == "hybrid" else None
         
-        # Perform semantic search on all data types for both sources
-        for source, data_dict in loaded_data.items():
-            print(f"\n--- Results from {source.upper()} ---")
-            with open(output_file, 'a') as f:
-                f.write(f"\n--- Results from {source.upper()} ---\n")
-            
-            for data_type, df in data_dict.items():
-                if df is not None:
-                    print(f"\n{data_type.upper()}:")
-                    results = search_embeddings(query_embedding, df, top_k=3)
-                    if not results.empty:
-                        display_results(results, data_type)
-                        
-                        # Generate AI answer using the context
-                        context = format_results_for_ai_generation(results, data_type)
-                        ai_answer = generate_answer_with_context(query, context)
-                        
-                        # Display AI answer
-                        print(f"\nAI GENERATED ANSWER:")
-                        print("=" * 40)
-                        print(ai_answer)
-                        print("=" * 40)
-                        
-                        # Create JSON output for analytics
-                        json_output = create_json_output(query, results, data_type, source, "Google GenAI", ai_answer)
-                        
-                        # Write results to file
-                        formatted_results = format_results_for_file(results, data_type, source, "Google GenAI", query)
-                        with open(output_file, 'a') as f:
-                            f.write(formatted_results)
-                            f.write(f"\nAI GENERATED ANSWER:\n")
-                            f.write("=" * 40 + "\n")
-                            f.write(f"{ai_answer}\n")
-                            f.write("=" * 40 + "\n\n")
-                            # Write JSON output
-                            f.write(f"\nJSON OUTPUT:\n")
-                            f.write(json.dumps(json_output, indent=2) + "\n\n")
-                    else:
-                        print("  No results found.")
-                        with open(output_file, 'a') as f:
-                            f.write("  No results found.\n")
-    
-    # Write all JSON outputs to separate file
-    with open(json_output_file, 'w') as f:
-        json.dump(json_outputs, f, indent=2)
-    
-    print(f"\nResults have been saved to {output_file}")
-    print(f"JSON analytics data has been saved to {json_output_file}")
+        # Embed all queries with one model call per model
+        runs = [
+            ("SentenceTransformer", "SENTENCE TRANSFORMER", get_sentence_transformer_embeddings(queries)),
+            ("Google GenAI", "GOOGLE GENAI", get_google_genai_embeddings(queries)),
+        ]
+        run_queries(queries, runs, loaded_data, sink, lexical_data=lexical_data)
+    
+    if answer_cache is not None:
+        print(f"\nAnswer cache: {answer_cache.stats()}")
+    
+    if output_file:
+        print(f"\nResults have been saved to {output_file}")
+    print(f"JSON analytics data ({sink.record_count} records) has been saved to {json_output_file}")
 
 if __name__ == "__main__":
-    semantic_search()
+    # python semantic_search.py [vector|hybrid] [exact|ivf|blockwise|quantized]
+    semantic_search(mode=sys.argv[1] if len(sys.argv) > 1 else "vector",
+                    kind=sys.argv[2] if len(sys.argv) > 2 else "exact")
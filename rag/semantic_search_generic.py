@@ -1,59 +1,345 @@
 import pandas as pd
 import numpy as np
 import ast
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import time
+from embedding_store import load_embeddings, get_store_paths, store_exists, store_fingerprint
+from vector_index import ExactIndex, IVFIndex, BlockwiseIndex, QuantizedIndex, MetadataIndex
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from reduction import load_projection
+from dedup import load_duplicates, expand_duplicates
+
+# Index kinds selectable with build_index / load_vector_index
+INDEX_TYPES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+    'blockwise': BlockwiseIndex,
+    'quantized': QuantizedIndex,
+}
 
 
 def load_embedding_data(csv_file_path):
     """
-    Load embedding data from CSV file (works with clusters, paragraphs, and talks).
+    Load embedding data (works with clusters, paragraphs, and talks).
+    
+    Reads the binary embedding store next to `csv_file_path` when one exists
+    (`<base>.npy` + `<base>_meta.csv`) and memory-maps the matrix, so no
+    vectors are parsed. Falls back to a legacy CSV with stringified lists.
     
     Args:
-        csv_file_path (str): Path to the CSV file
+        csv_file_path (str): Path to the CSV file or base path of the store
     
     Returns:
         pandas.DataFrame: DataFrame with embedding data
     """
-    df = pd.read_csv(csv_file_path)
+    df, embeddings = load_embeddings(csv_file_path)
     
-    # Convert string embeddings to numpy arrays
-    # Handle different embedding formats
-    if 'embedding' in df.columns:
-        df['embedding'] = df['embedding'].apply(lambda x: np.array(ast.literal_eval(x)))
+    # Each row holds a view into the (memory-mapped) matrix, not a copy
+    df['embedding'] = list(embeddings)
     
     return df
 
 
-def search_embeddings(query_embedding, df, top_k=5):
+def build_index(df, embeddings, kind="exact", **params):
+    """
+    Build a search index of the given kind.
+    
+    Args:
+        df (pandas.DataFrame): Metadata rows, one per embedding
+        embeddings: 2-D array of embeddings
+        kind (str): "exact" for brute force, "ivf" for an approximate
+            inverted-file index tuned with `nlist` and `nprobe`, or "blockwise"
+            for brute force over a memory-mapped matrix streamed in blocks
+            of at most `max_memory_mb`, or "quantized" for int8 or binary
+            codes (`mode`) with exact rescoring of a shortlist (`rescore`)
+        **params: Extra arguments for the index class
+    
+    Returns:
+        ExactIndex: The index (IVFIndex is a subclass)
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index kind {kind!r}; expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](df, embeddings, **params)
+
+
+def load_vector_index(csv_file_path, kind="exact", **params):
+    """
+    Load embedding data straight into a search index.
+    
+    Unlike load_embedding_data, no per-row embedding objects are created:
+    the stored matrix is normalized once into the index. A "blockwise"
+    index keeps the matrix memory-mapped and streams it instead. A trained
+    IVF quantizer is saved next to the store as `<base>_ivf.npz`, and
+    quantized codes as `<base>_int8.npz` or `<base>_binary.npz`; both are
+    reused on later loads while the store's fingerprint is unchanged. If
+    the store was reduced (see reduction.py), its `<base>_projection.npz` is
+    attached so queries are projected too. If it was deduplicated (see
+    dedup.py), metadata filters match every occurrence of a text.
+    
+    Args:
+        csv_file_path (str): Path to the CSV file or base path of the store
+        kind (str): Index kind (see build_index)
+        **params: Extra arguments for the index class
+    
+    Returns:
+        ExactIndex: Index over the file's rows
+    """
+    df, embeddings = load_embeddings(csv_file_path)
+    base_path = get_store_paths(csv_file_path)[0][:-len('.npy')]
+    fingerprint = store_fingerprint(csv_file_path) if store_exists(csv_file_path) else None
+    if kind == "ivf":
+        ivf_path = base_path + '_ivf.npz'
+        index = None
+        if os.path.exists(ivf_path):
+            try:
+                index = IVFIndex.load(ivf_path, df, embeddings, nprobe=params.get('nprobe'), fingerprint=fingerprint)
+            except ValueError as e:
+                print(f"Rebuilding IVF index: {e}")
+        if index is None:
+            index = IVFIndex(df, embeddings, **params)
+            index.save(ivf_path, fingerprint=fingerprint or "")
+    elif kind == "quantized":
+        mode = params.pop('mode', 'int8')
+        codes_path = base_path + f'_{mode}.npz'
+        index = None
+        if os.path.exists(codes_path):
+            try:
+                index = QuantizedIndex.load(codes_path, df, embeddings, fingerprint=fingerprint, **params)
+            except ValueError as e:
+                print(f"Rebuilding quantized index: {e}")
+        if index is None:
+            index = QuantizedIndex(df, embeddings, mode=mode, **params)
+            index.save(codes_path, fingerprint=fingerprint or "")
+    else:
+        index = build_index(df, embeddings, kind=kind, **params)
+    # Stores with reduced dimensions project queries the same way
+    index.projection = load_projection(csv_file_path)
+    duplicates = load_duplicates(csv_file_path)
+    if duplicates is not None and len(duplicates):
+        # Filter on the metadata of every occurrence, e.g. the speakers who quoted a shared paragraph
+        occurrences = expand_duplicates(df, duplicates)
+        index.metadata = MetadataIndex(occurrences, row_ids=occurrences['row'].values)
+    return index
+
+
+def search_embeddings(query_embedding, df, top_k=5, filters=None):
     """
     Perform semantic search on embedding data using a pre-computed query embedding.
     
     Args:
         query_embedding (numpy.ndarray): Pre-computed query embedding
-        df (pandas.DataFrame): Data with embeddings
+        df (pandas.DataFrame or ExactIndex): Data with embeddings, or an index built
+            once with load_vector_index / ExactIndex.from_dataframe. Passing an index
+            avoids rebuilding the normalized matrix on every query.
         top_k (int): Number of top results to return
+        filters (dict): Optional metadata filters on year, season, speaker, calling
+            or url, applied before scoring, e.g.
+            {'year': {'min': 2015, 'max': 2020}, 'season': 'October'}
     
     Returns:
         pandas.DataFrame: Top matching results
     """
+    if isinstance(df, ExactIndex):
+        return df.search(query_embedding, top_k=top_k, filters=filters)
+    
     # Check if embedding column exists
     if 'embedding' not in df.columns:
         return pd.DataFrame()
     
-    # Calculate cosine similarities
-    embeddings = np.stack(df['embedding'].values)
-    similarities = cosine_similarity([query_embedding], embeddings)[0]
+    return ExactIndex.from_dataframe(df).search(query_embedding, top_k=top_k, filters=filters)
+
+
+def search_embeddings_batch(query_embeddings, df, top_k=5, filters=None):
+    """
+    Perform semantic search for many queries at once.
+    
+    With an exact index all queries are scored with one matrix-matrix
+    product, instead of one pass over the data per query.
+    
+    Args:
+        query_embeddings (numpy.ndarray): 2-D array with one query embedding per row
+        df (pandas.DataFrame or ExactIndex): Data with embeddings, or an index
+        top_k (int): Number of top results to return per query
+        filters (dict): Optional metadata filters applied before scoring (see search_embeddings)
+    
+    Returns:
+        list: One results DataFrame per query, in query order
+    """
+    if not isinstance(df, ExactIndex):
+        if 'embedding' not in df.columns:
+            return [pd.DataFrame() for _ in query_embeddings]
+        df = ExactIndex.from_dataframe(df)
+    return df.search_batch(query_embeddings, top_k=top_k, filters=filters)
+
+
+def load_lexical_index(csv_file_path):
+    """
+    Load the BM25 index for a file's `text` column, building it on first use.
+    
+    The index is saved next to the store as `<base>_bm25.npz` and reused on
+    later loads while the store's fingerprint is unchanged (for a legacy CSV
+    file, while it is newer than the file).
+    
+    Args:
+        csv_file_path (str): Path to the CSV file or base path of the store
+    
+    Returns:
+        BM25Index: Lexical index with one document per row
+    """
+    embeddings_path, metadata_path = get_store_paths(csv_file_path)
+    bm25_path = embeddings_path[:-len('.npy')] + '_bm25.npz'
+    fingerprint = store_fingerprint(csv_file_path) if store_exists(csv_file_path) else None
+    if os.path.exists(bm25_path) and (fingerprint is not None
+                                      or os.path.getmtime(bm25_path) >= os.path.getmtime(metadata_path)):
+        try:
+            return BM25Index.load(bm25_path, fingerprint=fingerprint)
+        except ValueError as e:
+            print(f"Rebuilding BM25 index: {e}")
+    texts = pd.read_csv(metadata_path, usecols=['text'])['text'].fillna('')
+    index = BM25Index(texts)
+    index.save(bm25_path, fingerprint=fingerprint or "")
+    return index
+
+
+def hybrid_search(query_text, query_embedding, index, lexical_index, top_k=5, candidates=50, rrf_k=60, filters=None):
+    """
+    Combine BM25 and vector search with reciprocal-rank fusion.
+    
+    The top `candidates` rows from each ranking are fused, so exact phrases
+    and rare names that embeddings miss can still reach the top results.
     
-    # Get top k indices
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    Args:
+        query_text (str): Query text for the lexical side
+        query_embedding (numpy.ndarray): Query embedding for the vector side
+        index (ExactIndex): Vector index over the same rows as `lexical_index`
+        lexical_index (BM25Index): Lexical index from load_lexical_index
+        top_k (int): Number of results to return
+        candidates (int): Number of rows taken from each ranking before fusion
+        rrf_k (int): Reciprocal-rank fusion constant
+        filters (dict): Optional metadata filters applied to both sides
     
-    # Return top results
-    results = df.iloc[top_indices].copy()
-    results['similarity'] = similarities[top_indices]
+    Returns:
+        pandas.DataFrame: Top results with `similarity`, `bm25` and `rrf_score` columns
+    """
+    rows = index.select_rows(filters)
+    vector_rows, _ = index.search_indices(query_embedding, candidates, rows=rows)
+    lexical_rows, _ = lexical_index.search_indices(query_text, candidates, rows=rows)
+    fused_rows, fused_scores = reciprocal_rank_fusion([vector_rows, lexical_rows], rrf_k=rrf_k)
+    fused_rows, fused_scores = fused_rows[:top_k], fused_scores[:top_k]
     
+    results = index.results_frame(fused_rows, index.score_rows(query_embedding, fused_rows))
+    results['bm25'] = lexical_index.scores(query_text)[fused_rows]
+    results['rrf_score'] = fused_scores
     return results
 
 
+def cascade_candidate_urls(query_embedding, coarse_index, n_candidates=10, rows=None):
+    """
+    Rank talks (or talk clusters) and return the URLs of the best `n_candidates` talks.
+    
+    Args:
+        query_embedding (numpy.ndarray): Query embedding
+        coarse_index (ExactIndex): Index over talks or k-means cluster centroids
+        n_candidates (int): Number of distinct talks to keep
+        rows: Optional row ids of `coarse_index` to restrict the ranking to
+    
+    Returns:
+        list: Talk URLs, best first
+    """
+    urls = coarse_index.df['url'].values
+    n_rows = len(coarse_index) if rows is None else len(rows)
+    # Clusters have several rows per talk, so widen the search until enough talks are found
+    search_size = n_candidates
+    while True:
+        top_rows, _ = coarse_index.search_indices(query_embedding, search_size, rows=rows)
+        candidate_urls = list(dict.fromkeys(urls[top_rows]))
+        if len(candidate_urls) >= n_candidates or search_size >= n_rows:
+            return candidate_urls[:n_candidates]
+        search_size *= 2
+
+
+def cascade_search(query_embedding, coarse_index, paragraph_index, top_k=5, n_candidates=10, filters=None):
+    """
+    Coarse-to-fine search: rank talks or clusters first, then score only their paragraphs.
+    
+    Paragraphs are joined to the candidate talks by `url`, so only a small
+    fraction of the paragraph matrix is scored. A larger `n_candidates`
+    gives better recall at a higher cost (see measure_cascade_recall).
+    
+    Args:
+        query_embedding (numpy.ndarray): Query embedding
+        coarse_index (ExactIndex): Index over talks or k-means cluster centroids
+        paragraph_index (ExactIndex): Index over paragraphs
+        top_k (int): Number of paragraphs to return
+        n_candidates (int): Number of talks whose paragraphs are scored
+        filters (dict): Optional metadata filters applied to both stages
+    
+    Returns:
+        pandas.DataFrame: Top matching paragraphs with a `similarity` column
+    """
+    rows = cascade_rows(query_embedding, coarse_index, paragraph_index, n_candidates, filters)
+    return paragraph_index.results_frame(*paragraph_index.search_indices(query_embedding, top_k, rows=rows))
+
+
+def cascade_rows(query_embedding, coarse_index, paragraph_index, n_candidates=10, filters=None):
+    """
+    Get the paragraph rows a cascade search would score.
+    
+    Args:
+        query_embedding (numpy.ndarray): Query embedding
+        coarse_index (ExactIndex): Index over talks or k-means cluster centroids
+        paragraph_index (ExactIndex): Index over paragraphs
+        n_candidates (int): Number of talks whose paragraphs are scored
+        filters (dict): Optional metadata filters applied to both stages
+    
+    Returns:
+        numpy.ndarray: Sorted paragraph row ids
+    """
+    urls = cascade_candidate_urls(query_embedding, coarse_index, n_candidates, rows=coarse_index.select_rows(filters))
+    return paragraph_index.metadata.rows(dict(filters or {}, url=urls))
+
+
+def measure_cascade_recall(query_embeddings, coarse_index, paragraph_index, top_k=5, n_candidates=10):
+    """
+    Measure the recall lost by cascade search compared with a full paragraph scan.
+    
+    Args:
+        query_embeddings (numpy.ndarray): 2-D array with one query embedding per row
+        coarse_index (ExactIndex): Index over talks or k-means cluster centroids
+        paragraph_index (ExactIndex): Index over paragraphs
+        top_k (int): Number of paragraphs compared per query
+        n_candidates (int): Number of talks whose paragraphs are scored
+    
+    Returns:
+        dict: `recall` (fraction of the full-scan top-k found), `scanned_fraction`
+            (average share of paragraphs scored), `cascade_ms` and `full_ms` per query
+    """
+    hits = 0
+    scanned = 0
+    cascade_time = 0.0
+    full_time = 0.0
+    for query_embedding in query_embeddings:
+        start_time = time.perf_counter()
+        rows = cascade_rows(query_embedding, coarse_index, paragraph_index, n_candidates)
+        cascade_top, _ = paragraph_index.search_indices(query_embedding, top_k, rows=rows)
+        cascade_time += time.perf_counter() - start_time
+        
+        start_time = time.perf_counter()
+        full_top, _ = paragraph_index.search_indices(query_embedding, top_k)
+        full_time += time.perf_counter() - start_time
+        
+        hits += len(np.intersect1d(cascade_top, full_top))
+        scanned += len(rows)
+    
+    n_queries = max(1, len(query_embeddings))
+    return {
+        'recall': hits / max(1, n_queries * min(top_k, len(paragraph_index))),
+        'scanned_fraction': scanned / (n_queries * max(1, len(paragraph_index))),
+        'cascade_ms': cascade_time * 1000 / n_queries,
+        'full_ms': full_time * 1000 / n_queries,
+    }
+
+
 def display_results(results, data_type="generic"):
     """
     Display search results in a readable format.
@@ -82,6 +368,9 @@ def display_results(results, data_type="generic"):
         if 'paragraph_number' in row:
             print(f"Paragraph #: {row['paragraph_number']}")
         
+        if row.get('duplicate_count', 0) > 0:
+            print(f"Other occurrences: {row['duplicate_count']}")
+        
         print(f"URL: {row['url']}")
         
         # Display text content
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from answer_cache import AnswerCache
+
+RESULTS = pd.DataFrame({'title': ["Faith", "Hope"], 'speaker': ["A", "B"],
+                        'text': ["Faith is a principle of action.", "Hope is an anchor."]})
+
+
+def context_for(similarities):
+    # Same layout as context_packer.format_header
+    return ''.join(f"\nResult {rank} (Similarity: {similarity:.4f})\nTitle: {row['title']}\n"
+                   f"Speaker: {row['speaker']}\nContent:\n{row['text']}\n"
+                   for rank, (similarity, (_, row)) in enumerate(zip(similarities, RESULTS.iterrows()), 1))
+
+
+def test_paraphrase_over_same_results_is_a_semantic_hit():
+    cache = AnswerCache(similarity_threshold=0.9)
+    query_embedding = np.array([1.0, 0.2, 0.0])
+    cache.put("How do I gain faith?", context_for([0.8123, 0.7011]), "model", "answer", query_embedding, "embedder")
+
+    # A paraphrase retrieves the same passages with slightly different scores
+    answer = cache.get("How can I get faith?", context_for([0.8087, 0.6954]), "model",
+                       query_embedding + np.array([0.0, 0.05, 0.05]), "embedder")
+    assert answer == "answer"
+    assert cache.stats()['semantic_hits'] == 1
+
+
+def test_different_passages_miss():
+    cache = AnswerCache(similarity_threshold=0.9)
+    query_embedding = np.array([1.0, 0.2, 0.0])
+    cache.put("How do I gain faith?", context_for([0.8123, 0.7011]), "model", "answer", query_embedding, "embedder")
+    other_context = context_for([0.8123, 0.7011]).replace("Hope is an anchor.", "Charity never faileth.")
+    assert cache.get("How can I get faith?", other_context, "model", query_embedding, "embedder") is None
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from embedding_store import save_embedding_store, load_embeddings
+from dedup import split_duplicates, save_duplicates
+from semantic_search_generic import load_vector_index, cascade_rows
+from clusters import cluster_paragraph_embeddings
+
+SHARED = "Behold, I stand at the door and knock."
+
+
+def make_paragraphs(path, n_talks=4, per_talk=3, dim=16, seed=0):
+    rows = []
+    for talk in range(n_talks):
+        for paragraph in range(per_talk):
+            # Every talk ends with the same quotation
+            text = SHARED if paragraph == per_talk - 1 else f"talk {talk} paragraph {paragraph} text"
+            rows.append({'title': f"Talk {talk}", 'speaker': f"Speaker {talk}", 'calling': "", 'year': 2020 + talk,
+                         'season': "April", 'url': f"u{talk}", 'text': text})
+    distinct, duplicates = split_duplicates(pd.DataFrame(rows), threshold=1.0)
+    embeddings = np.random.default_rng(seed).normal(size=(len(distinct), dim)).astype(np.float32)
+    save_embedding_store(distinct, embeddings, path)
+    save_duplicates(duplicates, path)
+    return distinct, duplicates
+
+
+def test_filters_match_every_occurrence(tmp_path):
+    path = str(tmp_path / "paragraphs")
+    distinct, duplicates = make_paragraphs(path)
+    shared_row = int(np.flatnonzero(distinct['text'] == SHARED)[0])
+    index = load_vector_index(path)
+
+    assert shared_row in index.select_rows({'speaker': "Speaker 3"})
+    assert shared_row in index.select_rows({'url': ["u2"]})
+    # Two talks with two paragraphs of their own each, plus the shared one
+    assert len(index.select_rows({'year': {'min': 2022}})) == 5
+    results = index.search(index.matrix[shared_row], top_k=1, filters={'speaker': "Speaker 2"})
+    assert results['text'].tolist() == [SHARED]
+
+    # The cascade url join finds the shared paragraph under every talk
+    talks = load_vector_index(path)
+    rows = cascade_rows(index.matrix[shared_row], talks, index, n_candidates=1, filters={'url': ["u3"]})
+    assert shared_row in rows
+
+
+def test_clusters_keep_duplicate_paragraphs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "free").mkdir()
+    make_paragraphs(str(tmp_path / "free" / "free_paragraphs"))
+    clusters = cluster_paragraph_embeddings("free_paragraphs", 3, "free")
+    # Talks 1-3 lost their last paragraph to deduplication but are still clustered
+    assert sorted(clusters['url'].unique()) == ["u0", "u1", "u2", "u3"]
+    assert all(SHARED in texts for texts in clusters['text'])
+    df, _ = load_embeddings(str(tmp_path / "free" / "free_3_clusters"))
+    assert len(df) == 12
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from vector_index import ExactIndex, IVFIndex
+
+
+def make_indexes(n_rows=4000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n_rows, dim)).astype(np.float32)
+    df = pd.DataFrame({'speaker': rng.choice([f"s{i}" for i in range(40)], n_rows), 'year': rng.integers(2000, 2025, n_rows)})
+    return ExactIndex(df, embeddings), IVFIndex(df, embeddings, nlist=64, nprobe=2), rng
+
+
+def test_filtered_ivf_returns_top_k(tmp_path):
+    exact, ivf, rng = make_indexes()
+    queries = rng.normal(size=(20, 32)).astype(np.float32)
+    for filters in [{'speaker': 's3'}, {'year': 2010}, {'speaker': ['s1', 's2', 's3', 's4', 's5']}]:
+        rows = ivf.select_rows(filters)
+        assert len(rows) >= 5
+        batch = ivf.search_batch_indices(queries, top_k=5, rows=rows)
+        for query, (batch_rows, _) in zip(queries, batch):
+            single_rows, _ = ivf.search_indices(query, top_k=5, rows=rows)
+            assert len(single_rows) == 5
+            assert len(batch_rows) == 5
+            assert set(single_rows) <= set(rows)
+
+
+def test_selective_filter_matches_exact_search():
+    exact, ivf, rng = make_indexes()
+    rows = exact.select_rows({'speaker': 's7'})
+    for query in rng.normal(size=(10, 32)).astype(np.float32):
+        expected, _ = exact.search_indices(query, top_k=5, rows=rows)
+        found, _ = ivf.search_indices(query, top_k=5, rows=rows)
+        assert list(found) == list(expected)
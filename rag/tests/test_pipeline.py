@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import types
+import numpy as np
+import pandas as pd
+from embedding_store import load_embedding_store, CheckpointWriter
+from base_embedding import process_embedding_file
+from pipeline import StorePersister, build_embedding_pipeline
+
+
+def make_rows(n=6, changed=None):
+    return [{'title': f"Talk {i // 3}", 'url': f"u{i // 3}", 'paragraph_number': i % 3,
+             'text': f"paragraph {i}" + (" (edited)" if i == changed else "")} for i in range(n)]
+
+
+class Embedder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [np.full(4, len(text), dtype=np.float32) + np.arange(4) for text in texts]
+
+
+def run_persister(output_dir, rows, embed, finish=True):
+    persister = StorePersister(str(output_dir), "free")
+    reused = persister.embedded('paragraphs', rows)
+    embeddings = embed([row['text'] for row, skip in zip(rows, reused) if not skip])
+    persister.persist([('rows', 'paragraphs', rows, embeddings, reused)], None)
+    if finish:
+        persister.finish(None)
+    return persister
+
+
+def test_pipeline_store_matches_batch_store(tmp_path):
+    rows = make_rows()
+    run_persister(tmp_path / "pipeline", rows, Embedder())
+    pd.DataFrame(rows).to_csv(tmp_path / "rows.csv", index=False)
+    process_embedding_file(str(tmp_path / "rows.csv"), str(tmp_path / "batch" / "free_paragraphs"), Embedder(), "paragraphs")
+
+    pipeline_df, pipeline_embeddings = load_embedding_store(str(tmp_path / "pipeline" / "free_paragraphs"))
+    batch_df, batch_embeddings = load_embedding_store(str(tmp_path / "batch" / "free_paragraphs"))
+    pd.testing.assert_frame_equal(pipeline_df, batch_df)
+    np.testing.assert_array_equal(pipeline_embeddings, batch_embeddings)
+
+
+def test_pipeline_embeds_only_changed_rows(tmp_path):
+    run_persister(tmp_path, make_rows(), Embedder())
+    embed = Embedder()
+    run_persister(tmp_path, make_rows(changed=4), embed)
+    assert embed.texts == ["paragraph 4 (edited)"]
+
+    df, embeddings = load_embedding_store(str(tmp_path / "free_paragraphs"))
+    expected = Embedder()([row['text'] for row in make_rows(changed=4)])
+    np.testing.assert_array_equal(embeddings, np.stack(expected))
+    assert df['text_hash'].notna().all()
+
+
+def test_pipeline_resumes_interrupted_checkpoint(tmp_path):
+    run_persister(tmp_path, make_rows(), Embedder(), finish=False)
+    assert CheckpointWriter.exists(str(tmp_path / "free_paragraphs"))
+    embed = Embedder()
+    run_persister(tmp_path, make_rows(), embed)
+    assert embed.texts == []
+    df, _ = load_embedding_store(str(tmp_path / "free_paragraphs"))
+    assert len(df) == 6
+    assert not CheckpointWriter.exists(str(tmp_path / "free_paragraphs"))
+
+
+def fake_scraper(n_talks=12, seed=0):
+    rng = np.random.default_rng(seed)
+    delays = rng.uniform(0, 0.02, n_talks)
+    urls = [f"https://example.org/2024/04/talk-{i}" for i in range(n_talks)]
+
+    def fetch_talk(talk_url, session):
+        i = urls.index(talk_url)
+        time.sleep(delays[i])
+        return None if i == 5 else f"talk {i}"
+
+    def parse_talk(talk_url, html):
+        return {'title': html, 'speaker': "S", 'calling': "", 'year': "2024", 'season': "April", 'url': talk_url,
+                'text': f"{html} opening\n\n{html} closing\n\nA shared testimony."}
+
+    def split_talks(talk):
+        return [dict(talk, paragraph_number=i, text=text) for i, text in enumerate(talk['text'].split('\n\n'), 1)]
+
+    return types.SimpleNamespace(iter_talk_urls=lambda conference_url, session: ((url, None) for url in urls),
+                                 fetch_talk=fetch_talk, parse_talk=parse_talk, split_talks=split_talks)
+
+
+def test_pipeline_writes_rows_in_crawl_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "free_paragraphs")
+    stores = []
+    for seed in range(2):
+        # Downloads finish in a different order on each run
+        monkeypatch.setitem(sys.modules, 'scraper', fake_scraper(seed=seed))
+        pipeline = build_embedding_pipeline([("conference", 2024, 4)], Embedder(), str(tmp_path), "free", None,
+                                            dedup_threshold=1.0, fetch_workers=6, report_interval=None)
+        pipeline.run()
+        stores.append((load_embedding_store(path)[0], os.path.getmtime(path + '.npy')))
+
+    (first, first_mtime), (second, second_mtime) = stores
+    expected = [f"https://example.org/2024/04/talk-{i}" for i in range(12) if i != 5]
+    assert list(dict.fromkeys(first['url'])) == expected
+    pd.testing.assert_frame_equal(first, second)
+    # The unchanged second run only rewrites the metadata
+    assert second_mtime == first_mtime
@@ -0,0 +1,47 @@
+import os
+import shutil
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+from vector_index import ExactIndex
+from result_sink import ResultSink, read_records
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def semantic_search(tmp_path, monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("google.generativeai")
+    # semantic_search reads config.json from the working directory on import
+    shutil.copy(os.path.join(RAG_DIR, "config_template.json"), tmp_path / "config.json")
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("semantic_search")
+
+
+def test_failed_answer_does_not_hold_back_later_ones(semantic_search, tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'title': [f"t{i}" for i in range(20)], 'speaker': "S", 'url': [f"u{i}" for i in range(20)],
+                       'text': [f"text {i}" for i in range(20)]})
+    loaded_data = {'free': {'paragraphs': ExactIndex(df, rng.normal(size=(20, 8)).astype(np.float32))}}
+    queries = ["first", "second", "third"]
+
+    def generate_answer(query, context, on_chunk=None, **options):
+        if query == "first":
+            raise RuntimeError("generation failed")
+        on_chunk(f"answer to {query}")
+        return f"answer to {query}"
+
+    monkeypatch.setattr(semantic_search, "format_results_for_ai_generation", lambda results, data_type: "context")
+    monkeypatch.setattr(semantic_search, "generate_answer_with_context", generate_answer)
+    records_file, report_file = str(tmp_path / "records.jsonl"), str(tmp_path / "report.txt")
+    with ResultSink(records_file, report_file, console=False) as sink:
+        semantic_search.run_queries(queries, [("model", "MODEL", rng.normal(size=(3, 8)))], loaded_data, sink,
+                                    max_in_flight=3)
+
+    assert [record['ai_answer'] for record in read_records(records_file)] == ["answer to second", "answer to third"]
+    with open(report_file) as f:
+        report = f.read()
+    assert "generation failed" in report
+    assert report.index("answer to second") < report.index("answer to third")
@@ -0,0 +1,79 @@
+import os
+import shutil
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+from concurrent.futures import wait
+from vector_index import ExactIndex
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def search_server(tmp_path, monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("google.generativeai")
+    # semantic_search reads config.json from the working directory on import
+    shutil.copy(os.path.join(RAG_DIR, "config_template.json"), tmp_path / "config.json")
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("search_server")
+
+
+def embed(texts):
+    return np.stack([np.random.default_rng(len(text)).normal(size=8) for text in texts]).astype(np.float32)
+
+
+def test_micro_batcher_fails_only_the_bad_item(search_server):
+    def process_batch(items):
+        return [ValueError(item) if item < 0 else item * 2 for item in items]
+
+    batcher = search_server.MicroBatcher(process_batch, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(item) for item in [1, -1, 3]]
+    wait(futures)
+    batcher.close()
+    assert futures[0].result() == 2 and futures[2].result() == 6
+    with pytest.raises(ValueError):
+        futures[1].result()
+
+
+def test_bad_filter_does_not_fail_other_searches(search_server, monkeypatch):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'title': [f"t{i}" for i in range(50)], 'speaker': rng.choice(['a', 'b'], 50),
+                       'url': [f"u{i}" for i in range(50)], 'text': [f"text {i}" for i in range(50)]})
+    index = ExactIndex(df, rng.normal(size=(50, 8)).astype(np.float32))
+    monkeypatch.setitem(search_server.EMBEDDERS, 'free', (embed, "test"))
+    service = search_server.SearchService({'free': {'paragraphs': index}}, max_batch_size=8, max_wait_ms=50)
+    try:
+        with pytest.raises(ValueError):
+            service.search("query", filters={'no_such_column': 1})
+        # A filter that passes validation but fails while scoring only fails its own group
+        futures = [service.batchers['free'].submit({'query': query, 'data_type': 'paragraphs', 'top_k': 3,
+                                                     'filters': filters, 'mode': 'vector'})
+                   for query, filters in [("first", None), ("second", {'speaker': {'min': 1}}), ("third", None)]]
+        wait(futures)
+        assert len(futures[0].result()[0]) == 3 and len(futures[2].result()[0]) == 3
+        with pytest.raises(TypeError):
+            futures[1].result()
+    finally:
+        service.close()
+
+
+def test_set_and_range_filters_are_batched(search_server, monkeypatch):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'title': [f"t{i}" for i in range(50)], 'year': rng.integers(2010, 2020, 50),
+                       'url': [f"u{i}" for i in range(50)], 'text': [f"text {i}" for i in range(50)]})
+    index = ExactIndex(df, rng.normal(size=(50, 8)).astype(np.float32))
+    monkeypatch.setitem(search_server.EMBEDDERS, 'free', (embed, "test"))
+    service = search_server.SearchService({'free': {'paragraphs': index}}, max_batch_size=8, max_wait_ms=50)
+    try:
+        futures = [service.batchers['free'].submit({'query': query, 'data_type': 'paragraphs', 'top_k': 3,
+                                                     'filters': filters, 'mode': 'vector'})
+                   for query, filters in [("first", {'year': {2012, 2015}}), ("second", {'year': range(2010, 2013)}),
+                                          ("third", None)]]
+        wait(futures)
+        assert set(futures[0].result()[0]['year']) <= {2012, 2015}
+        assert set(futures[1].result()[0]['year']) <= {2010, 2011, 2012}
+        assert len(futures[2].result()[0]) == 3
+    finally:
+        service.close()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from embedding_store import save_embedding_store, write_store_rows, load_embedding_store
+from reduction import reduce_stores
+from semantic_search_generic import load_vector_index, load_lexical_index
+
+
+def make_store(path, n_rows=600, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n_rows, dim)).astype(np.float32)
+    df = pd.DataFrame({'url': [f"u{i}" for i in range(n_rows)], 'text': [f"text {i}" for i in range(n_rows)]})
+    save_embedding_store(df, embeddings, path)
+    return df, embeddings
+
+
+def permute_store(path, seed=1):
+    df, embeddings = load_embedding_store(path)
+    order = np.random.default_rng(seed).permutation(len(df))
+    write_store_rows(df.iloc[order].reset_index(drop=True), [np.array(embeddings)], np.zeros(len(df), dtype=np.int64),
+                     order, path)
+    return order
+
+
+def test_ivf_rebuilt_after_same_size_rewrite(tmp_path):
+    path = str(tmp_path / "store")
+    make_store(path)
+    load_vector_index(path, kind="ivf", nprobe=64)
+    saved = path + '_ivf.npz'
+    shutil.copy(saved, str(tmp_path / "old_ivf.npz"))
+
+    order = permute_store(path)
+    # Rewriting the store deletes the index built from it
+    assert not os.path.exists(saved)
+
+    # Even a stale file put back by hand is not reused
+    shutil.copy(str(tmp_path / "old_ivf.npz"), saved)
+    index = load_vector_index(path, kind="ivf", nprobe=64)
+    _, embeddings = load_embedding_store(path)
+    target = int(np.where(order == 511)[0][0])
+    rows, _ = index.search_indices(np.array(embeddings[target]), top_k=1)
+    assert rows[0] == target
+
+
+def test_quantized_rebuilt_after_same_size_rewrite(tmp_path):
+    path = str(tmp_path / "store")
+    make_store(path)
+    load_vector_index(path, kind="quantized", mode="int8")
+    shutil.copy(path + '_int8.npz', str(tmp_path / "old_int8.npz"))
+
+    order = permute_store(path)
+    shutil.copy(str(tmp_path / "old_int8.npz"), path + '_int8.npz')
+    index = load_vector_index(path, kind="quantized", mode="int8")
+    _, embeddings = load_embedding_store(path)
+    target = int(np.where(order == 511)[0][0])
+    rows, _ = index.search_indices(np.array(embeddings[target]), top_k=1)
+    assert rows[0] == target
+
+
+def test_indexes_rebuilt_after_reduction(tmp_path):
+    path = str(tmp_path / "store")
+    _, embeddings = make_store(path)
+    load_vector_index(path, kind="ivf")
+    load_vector_index(path, kind="quantized", mode="binary")
+    reduce_stores([path], 16, method="pca")
+
+    for kind, params in [("ivf", {'nprobe': 64}), ("quantized", {'mode': 'binary', 'rescore': 50})]:
+        index = load_vector_index(path, kind=kind, **params)
+        rows, _ = index.search_indices(embeddings[511], top_k=1)
+        assert rows[0] == 511
+
+
+def test_bm25_rebuilt_after_same_size_rewrite(tmp_path):
+    path = str(tmp_path / "store")
+    make_store(path)
+    load_lexical_index(path)
+    shutil.copy(path + '_bm25.npz', str(tmp_path / "old_bm25.npz"))
+
+    order = permute_store(path)
+    # A stale copy with a newer modification time is not reused
+    shutil.copy(str(tmp_path / "old_bm25.npz"), path + '_bm25.npz')
+    index = load_lexical_index(path)
+    rows, _ = index.search_indices("text 511", top_k=1)
+    assert order[rows[0]] == 511
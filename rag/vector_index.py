@@ -0,0 +1,981 @@
+import heapq
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+
+
+def normalize_rows(matrix):
+    """
+    L2-normalize the rows of a matrix into a contiguous float32 array.
+
+    Args:
+        matrix: 2-D array-like of embeddings
+
+    Returns:
+        numpy.ndarray: Normalized float32 copy; all-zero rows stay zero
+    """
+    matrix = np.array(matrix, dtype=np.float32, copy=True, order='C')
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    matrix /= np.maximum(norms, 1e-12)
+    return matrix
+
+
+def top_k_indices(scores, top_k):
+    """
+    Get the indices of the `top_k` highest scores, best first.
+
+    Uses `argpartition`, so only the selected scores are sorted.
+
+    Args:
+        scores (numpy.ndarray): 1-D array of scores
+        top_k (int): Number of indices to return
+
+    Returns:
+        numpy.ndarray: Indices sorted by descending score
+    """
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+# Metadata columns that get an inverted index for filtering
+FILTER_COLUMNS = ('year', 'season', 'speaker', 'calling', 'url')
+
+
+class MetadataIndex:
+    """
+    Inverted indexes over metadata columns, used to filter rows before scoring.
+
+    For each column, the rows are grouped by value once, so selecting all
+    rows with a given value is a slice. Filters are given as a dict from
+    column name to condition:
+
+    - a single value: `{'season': 'October'}`
+    - a list, set, tuple or range of values: `{'year': range(2015, 2021)}`
+    - a dict with `min` and/or `max` (inclusive): `{'year': {'min': 2015, 'max': 2020}}`
+
+    Conditions on different columns are combined with AND. When several
+    metadata rows share one embedding (duplicate texts, see dedup.py), a row
+    matches if any of its occurrences does.
+    """
+
+    def __init__(self, df, columns=FILTER_COLUMNS, row_ids=None):
+        """
+        Args:
+            df (pandas.DataFrame): Metadata rows
+            columns: Columns to index (columns missing from `df` are skipped)
+            row_ids: Optional index row of each metadata row, for metadata with one
+                row per occurrence (see dedup.expand_duplicates); by default row i is row i
+        """
+        self.row_ids = None if row_ids is None else np.asarray(row_ids, dtype=np.int64)
+        self.n_rows = len(df) if row_ids is None else int(self.row_ids.max(initial=-1)) + 1
+        self.columns = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, values = pd.factorize(df[column], sort=True)
+            # Rows with a missing value get code -1 and sort before every posting list
+            order = np.argsort(codes, kind='stable')
+            offsets = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            self.columns[column] = (values, codes, order, offsets)
+
+    def _matching_codes(self, column, condition):
+        values = self.columns[column][0]
+        if isinstance(condition, dict):
+            selected = np.ones(len(values), dtype=bool)
+            if 'min' in condition:
+                selected &= np.asarray(values >= condition['min'])
+            if 'max' in condition:
+                selected &= np.asarray(values <= condition['max'])
+            return np.flatnonzero(selected)
+        if isinstance(condition, (list, tuple, set, frozenset, range)):
+            condition = list(condition)
+        else:
+            condition = [condition]
+        codes = values.get_indexer(condition)
+        return np.unique(codes[codes >= 0])
+
+    def rows(self, filters):
+        """
+        Get the row ids that match a set of filters.
+
+        The posting lists of the most selective condition are gathered first;
+        the other conditions are then checked only on those rows.
+
+        Args:
+            filters (dict): Conditions by column name
+
+        Returns:
+            numpy.ndarray: Sorted row ids
+        """
+        if not filters:
+            return np.arange(self.n_rows)
+        conditions = []
+        for column, condition in filters.items():
+            if column not in self.columns:
+                raise KeyError(f"Cannot filter on {column!r}; indexed columns are {sorted(self.columns)}")
+            _, codes, order, offsets = self.columns[column]
+            matching = self._matching_codes(column, condition)
+            size = int(np.sum(offsets[matching + 1] - offsets[matching]))
+            conditions.append((size, column, matching))
+        conditions.sort(key=lambda item: item[0])
+
+        _, column, matching = conditions[0]
+        _, _, order, offsets = self.columns[column]
+        postings = [order[offsets[code]:offsets[code + 1]] for code in matching]
+        rows = np.sort(np.concatenate(postings)) if postings else np.empty(0, dtype=np.int64)
+        for _, column, matching in conditions[1:]:
+            codes = self.columns[column][1]
+            rows = rows[np.isin(codes[rows], matching)]
+        if self.row_ids is not None:
+            rows = np.unique(self.row_ids[rows])
+        return rows
+
+    def mask(self, filters):
+        """
+        Build a boolean row mask for a set of filters.
+
+        Args:
+            filters (dict): Conditions by column name
+
+        Returns:
+            numpy.ndarray: True for every row that matches all conditions
+        """
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows(filters)] = True
+        return mask
+
+
+class ExactIndex:
+    """
+    Exact cosine-similarity index over a fixed set of embeddings.
+
+    The embeddings are copied once into a contiguous, L2-normalized float32
+    matrix, so a query costs one matrix-vector product plus an
+    `argpartition` over the scores.
+    """
+
+    def __init__(self, df, embeddings):
+        """
+        Args:
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings (e.g. a memory-mapped store)
+        """
+        if len(df) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(df)} metadata rows")
+        self.df = df
+        self.matrix = normalize_rows(embeddings)
+        self.metadata = MetadataIndex(df)
+        # Set for stores with reduced dimensions; queries are projected the same way
+        self.projection = None
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Build an index from a DataFrame with an `embedding` column.
+
+        Args:
+            df (pandas.DataFrame): Data with embeddings
+
+        Returns:
+            ExactIndex: Index over the DataFrame's rows
+        """
+        return cls(df, np.stack(df['embedding'].values))
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def dim(self):
+        """Embedding dimension."""
+        return self.matrix.shape[1]
+
+    def prepare_queries(self, query_embeddings):
+        """
+        Project (if the index has a projection) and normalize query embeddings.
+
+        Args:
+            query_embeddings: 2-D array with one query per row
+
+        Returns:
+            numpy.ndarray: Normalized float32 query vectors
+        """
+        queries = np.asarray(query_embeddings).reshape(len(query_embeddings), -1)
+        if self.projection is not None:
+            queries = self.projection.transform(queries)
+        return normalize_rows(queries)
+
+    def prepare_query(self, query_embedding):
+        """
+        Project and normalize a query embedding for this index.
+
+        Args:
+            query_embedding: 1-D query embedding
+
+        Returns:
+            numpy.ndarray: Normalized float32 query vector
+        """
+        return self.prepare_queries(np.asarray(query_embedding).reshape(1, -1))[0]
+
+    def scores(self, query_embedding):
+        """
+        Compute the cosine similarity of a query against every row.
+
+        Args:
+            query_embedding: 1-D query embedding
+
+        Returns:
+            numpy.ndarray: One similarity per row
+        """
+        return self.matrix @ self.prepare_query(query_embedding)
+
+    def score_rows(self, query_embedding, rows):
+        """
+        Compute the cosine similarity of a query against selected rows.
+
+        Args:
+            query_embedding: 1-D query embedding
+            rows: Row ids to score
+
+        Returns:
+            numpy.ndarray: One similarity per row id
+        """
+        return self.matrix[rows] @ self.prepare_query(query_embedding)
+
+    def select_rows(self, filters):
+        """
+        Get the row ids matching metadata filters (see MetadataIndex).
+
+        Args:
+            filters (dict): Conditions by column name, or None for all rows
+
+        Returns:
+            numpy.ndarray: Sorted row ids, or None when there are no filters
+        """
+        if not filters:
+            return None
+        return self.metadata.rows(filters)
+
+    def search_indices(self, query_embedding, top_k=5, rows=None):
+        """
+        Find the rows most similar to a query.
+
+        Args:
+            query_embedding: 1-D query embedding
+            top_k (int): Number of rows to return
+            rows: Optional row ids to restrict the search to; only these rows are scored
+
+        Returns:
+            tuple: (row indices, similarities), best first
+        """
+        if rows is not None:
+            similarities = self.score_rows(query_embedding, rows)
+            top = top_k_indices(similarities, top_k)
+            return rows[top], similarities[top]
+        similarities = self.scores(query_embedding)
+        top_indices = top_k_indices(similarities, top_k)
+        return top_indices, similarities[top_indices]
+
+    def search_batch_indices(self, query_embeddings, top_k=5, rows=None):
+        """
+        Find the rows most similar to each of several queries.
+
+        All queries are scored with a single matrix-matrix product.
+
+        Args:
+            query_embeddings: 2-D array with one query per row
+            top_k (int): Number of rows to return per query
+            rows: Optional row ids to restrict the search to; only these rows are scored
+
+        Returns:
+            list: One (row indices, similarities) tuple per query, best first
+        """
+        queries = self.prepare_queries(query_embeddings)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        similarities = queries @ matrix.T
+        top_k = min(top_k, similarities.shape[1])
+        if top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        if top_k < similarities.shape[1]:
+            candidates = np.argpartition(similarities, -top_k, axis=1)[:, -top_k:]
+        else:
+            candidates = np.tile(np.arange(similarities.shape[1]), (len(queries), 1))
+        candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        top_indices = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        if rows is not None:
+            top_indices = rows[top_indices]
+        return list(zip(top_indices, top_scores))
+
+    def results_frame(self, indices, similarities):
+        """
+        Build a ranked results DataFrame from row indices and similarities.
+
+        Args:
+            indices: Row indices, best first
+            similarities: Similarity for each row
+
+        Returns:
+            pandas.DataFrame: Selected metadata rows with a `similarity` column
+        """
+        results = self.df.iloc[indices].copy()
+        results['similarity'] = similarities
+        return results
+
+    def search(self, query_embedding, top_k=5, filters=None):
+        """
+        Perform semantic search with a pre-computed query embedding.
+
+        Args:
+            query_embedding: 1-D query embedding
+            top_k (int): Number of top results to return
+            filters (dict): Optional metadata filters applied before scoring (see MetadataIndex)
+
+        Returns:
+            pandas.DataFrame: Top matching rows with a `similarity` column
+        """
+        return self.results_frame(*self.search_indices(query_embedding, top_k, rows=self.select_rows(filters)))
+
+    def search_batch(self, query_embeddings, top_k=5, filters=None):
+        """
+        Perform semantic search for several pre-computed query embeddings at once.
+
+        Args:
+            query_embeddings: 2-D array with one query per row
+            top_k (int): Number of top results to return per query
+            filters (dict): Optional metadata filters applied before scoring (see MetadataIndex)
+
+        Returns:
+            list: One results DataFrame per query, in query order
+        """
+        rows = self.select_rows(filters)
+        return [self.results_frame(indices, similarities)
+                for indices, similarities in self.search_batch_indices(query_embeddings, top_k, rows=rows)]
+
+
+def check_saved_index(path, data, embeddings, fingerprint=None):
+    """
+    Check that an index file still matches the store it is loaded for.
+
+    Args:
+        path (str): Index file, for the error message
+        data: Loaded `.npz` contents with `rows` and `fingerprint`
+        embeddings: The store's current embeddings
+        fingerprint (str): The store's current fingerprint (None to check the row count only)
+
+    Raises:
+        ValueError: If the index was built from a different store
+    """
+    if int(data['rows']) != len(embeddings):
+        raise ValueError(f"Index {path} was built for {int(data['rows'])} rows, store has {len(embeddings)}")
+    saved = str(data['fingerprint']) if 'fingerprint' in data.files else None
+    if fingerprint is not None and saved != fingerprint:
+        raise ValueError(f"Index {path} was built from an earlier version of the store")
+
+
+class IVFIndex(ExactIndex):
+    """
+    Approximate index using an inverted file (IVF) with a k-means coarse quantizer.
+
+    The corpus is partitioned into `nlist` clusters. A query is compared with
+    the cluster centroids first and then scored exactly against the rows of
+    the `nprobe` closest clusters only. Raising `nprobe` improves recall at
+    the cost of latency; `nprobe == nlist` is an exact search.
+    """
+
+    def __init__(self, df, embeddings, nlist=None, nprobe=8, train_size=None, random_state=42, quantizer=None):
+        """
+        Args:
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings
+            nlist (int): Number of clusters (defaults to about 4 * sqrt(rows))
+            nprobe (int): Number of clusters scored per query
+            train_size (int): Number of rows sampled to train k-means (defaults to 64 per cluster)
+            random_state (int): Seed for sampling and k-means
+            quantizer (dict): Previously trained `centroids`, `order` and `offsets` (see `load`)
+        """
+        super().__init__(df, embeddings)
+        self.nprobe = nprobe
+        if quantizer is not None:
+            self.centroids = quantizer['centroids']
+            self.order = quantizer['order']
+            self.offsets = quantizer['offsets']
+        else:
+            self._train(nlist, train_size, random_state)
+
+    @property
+    def nlist(self):
+        """Number of clusters."""
+        return len(self.centroids)
+
+    def _train(self, nlist, train_size, random_state):
+        n_rows = len(self.matrix)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n_rows))
+        nlist = max(1, min(nlist, n_rows))
+        if train_size is None:
+            train_size = nlist * 64
+
+        rng = np.random.default_rng(random_state)
+        sample = self.matrix
+        if n_rows > train_size:
+            sample = self.matrix[rng.choice(n_rows, train_size, replace=False)]
+
+        kmeans = KMeans(n_clusters=nlist, n_init=1, random_state=random_state)
+        kmeans.fit(sample)
+        # Spherical k-means: compare by cosine, like the rows themselves
+        self.centroids = normalize_rows(kmeans.cluster_centers_)
+
+        # Assign every row to its closest centroid, in blocks to bound memory
+        assignments = np.empty(n_rows, dtype=np.int64)
+        for start in range(0, n_rows, 65536):
+            block = self.matrix[start:start + 65536]
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+
+        # Group row ids by cluster so each inverted list is a slice of `order`
+        self.order = np.argsort(assignments, kind='stable')
+        self.offsets = np.searchsorted(assignments[self.order], np.arange(nlist + 1))
+
+    def candidate_rows(self, query):
+        """
+        Get the row ids in the `nprobe` clusters closest to a normalized query.
+
+        Args:
+            query (numpy.ndarray): Normalized query vector
+
+        Returns:
+            numpy.ndarray: Candidate row ids
+        """
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+
+    def search_indices(self, query_embedding, top_k=5, rows=None):
+        """
+        Find the rows most similar to a query among the probed clusters.
+
+        With a filter, the probed rows that pass it are scored. If the filter
+        passes no more rows than the probed clusters hold, or too few of them
+        fall in those clusters to fill `top_k`, every row that passes the
+        filter is scored exactly instead, so filtering never loses results.
+
+        Args:
+            query_embedding: 1-D query embedding
+            top_k (int): Number of rows to return
+            rows: Optional row ids to restrict the search to
+
+        Returns:
+            tuple: (row indices, similarities), best first
+        """
+        query = self.prepare_query(query_embedding)
+        candidates = self.candidate_rows(query)
+        if rows is not None:
+            if len(rows) <= len(candidates):
+                return super().search_indices(query_embedding, top_k, rows=rows)
+            # Keep only the probed rows that pass the filter
+            candidates = candidates[np.isin(candidates, rows, assume_unique=True)]
+            if len(candidates) < min(top_k, len(rows)):
+                return super().search_indices(query_embedding, top_k, rows=rows)
+        rows = candidates
+        similarities = self.matrix[rows] @ query
+        top = top_k_indices(similarities, top_k)
+        return rows[top], similarities[top]
+
+    def search_batch_indices(self, query_embeddings, top_k=5, rows=None):
+        query_embeddings = np.asarray(query_embeddings)
+        if rows is not None and len(rows) <= self.nprobe * len(self.matrix) / max(1, self.nlist):
+            # A selective filter is scored exactly for all queries at once
+            return super().search_batch_indices(query_embeddings, top_k, rows=rows)
+        # Each query probes different inverted lists, so they are searched one at a time
+        return [self.search_indices(query, top_k, rows=rows) for query in query_embeddings]
+
+    def save(self, path, fingerprint=""):
+        """
+        Save the trained quantizer and inverted lists (the vectors stay in the store).
+
+        Args:
+            path (str): Output `.npz` file
+            fingerprint (str): Fingerprint of the store the index was built from (see store_fingerprint)
+        """
+        tmp_file = path + '.tmp.npz'
+        np.savez(tmp_file, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 nprobe=self.nprobe, rows=len(self.matrix), fingerprint=fingerprint)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path, df, embeddings, nprobe=None, fingerprint=None):
+        """
+        Load a quantizer saved with `save` and attach it to the store's vectors.
+
+        Args:
+            path (str): `.npz` file written by `save`
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings the quantizer was trained on
+            nprobe (int): Override the saved `nprobe`
+            fingerprint (str): Current fingerprint of the store; a different saved one raises ValueError
+
+        Returns:
+            IVFIndex: Loaded index
+        """
+        data = np.load(path)
+        check_saved_index(path, data, embeddings, fingerprint)
+        quantizer = {'centroids': data['centroids'], 'order': data['order'], 'offsets': data['offsets']}
+        return cls(df, embeddings, nprobe=int(data['nprobe']) if nprobe is None else nprobe, quantizer=quantizer)
+
+
+class BlockwiseIndex(ExactIndex):
+    """
+    Exact index that streams a memory-mapped matrix in fixed-size blocks.
+
+    Unlike ExactIndex, the embeddings are never copied into memory; only one
+    inverse norm per row is kept. Each search reads the matrix (float32 or
+    float16) block by block, converts the block to float32, scores it, and
+    merges the block's best rows into a running top-k heap per query. Block
+    sizes are chosen so that a block plus its scores fit in `max_memory_mb`,
+    which makes corpora larger than RAM searchable at disk or page-cache
+    speed. Statistics of the last scan are kept in `last_scan`.
+    """
+
+    def __init__(self, df, embeddings, max_memory_mb=256):
+        """
+        Args:
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings, normally a memory-mapped store
+            max_memory_mb (float): Memory bound for one block and its scores
+        """
+        if len(df) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(df)} metadata rows")
+        self.df = df
+        self.matrix = embeddings
+        self.metadata = MetadataIndex(df)
+        # Set for stores with reduced dimensions; queries are projected the same way
+        self.projection = None
+        self.max_memory_mb = max_memory_mb
+        self.last_scan = None
+        self.inv_norms = np.empty(len(embeddings), dtype=np.float32)
+        for start, stop in self._blocks(len(embeddings), self.block_rows()):
+            block = np.asarray(embeddings[start:stop], dtype=np.float32)
+            self.inv_norms[start:stop] = 1 / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+
+    def block_rows(self, n_queries=1):
+        """
+        Get the number of rows scanned per block for a number of queries.
+
+        Args:
+            n_queries (int): Number of queries scored together
+
+        Returns:
+            int: Rows per block that keep the block within `max_memory_mb`
+        """
+        # Raw block, its float32 copy, and one score per query and row
+        row_bytes = self.dim * (self.matrix.dtype.itemsize + 4) + 4 * n_queries
+        return max(1, int(self.max_memory_mb * 2 ** 20 // row_bytes))
+
+    @staticmethod
+    def _blocks(n_rows, block_rows):
+        for start in range(0, n_rows, block_rows):
+            yield start, min(start + block_rows, n_rows)
+
+    def scores(self, query_embedding):
+        query = self.prepare_query(query_embedding)
+        scores = np.empty(len(self.matrix), dtype=np.float32)
+        for start, stop in self._blocks(len(self.matrix), self.block_rows()):
+            block = np.asarray(self.matrix[start:stop], dtype=np.float32)
+            scores[start:stop] = (block @ query) * self.inv_norms[start:stop]
+        return scores
+
+    def score_rows(self, query_embedding, rows):
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        return (block @ self.prepare_query(query_embedding)) * self.inv_norms[rows]
+
+    def scan(self, queries, top_k=5, rows=None):
+        """
+        Stream the matrix block by block and keep the best rows per query.
+
+        Args:
+            queries: 2-D array of normalized float32 query vectors
+            top_k (int): Number of rows to keep per query
+            rows: Optional sorted row ids; only these rows are read and scored
+
+        Returns:
+            list: One (row indices, similarities) tuple per query, best first
+        """
+        heaps = [[] for _ in queries]
+        n_rows = len(self.matrix) if rows is None else len(rows)
+        block_rows = self.block_rows(len(queries))
+        start_time = time.perf_counter()
+
+        for start, stop in self._blocks(n_rows, block_rows):
+            if rows is None:
+                ids = np.arange(start, stop)
+                block = self.matrix[start:stop]
+            else:
+                ids = rows[start:stop]
+                block = self.matrix[ids]
+            block_scores = (queries @ np.asarray(block, dtype=np.float32).T) * self.inv_norms[ids]
+            for heap, query_scores in zip(heaps, block_scores):
+                for j in top_k_indices(query_scores, top_k):
+                    item = (float(query_scores[j]), int(ids[j]))
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+                    else:
+                        # The block's candidates come best first
+                        break
+
+        seconds = time.perf_counter() - start_time
+        scanned_bytes = n_rows * self.dim * self.matrix.dtype.itemsize
+        self.last_scan = {'rows': n_rows, 'queries': len(queries), 'block_rows': block_rows,
+                          'bytes': scanned_bytes, 'seconds': seconds,
+                          'gb_per_second': scanned_bytes / 1e9 / max(seconds, 1e-9)}
+
+        results = []
+        for heap in heaps:
+            best = sorted(heap, reverse=True)
+            results.append((np.array([row for _, row in best], dtype=np.int64),
+                            np.array([score for score, _ in best], dtype=np.float32)))
+        return results
+
+    def search_indices(self, query_embedding, top_k=5, rows=None):
+        return self.scan(self.prepare_query(query_embedding).reshape(1, -1), top_k, rows)[0]
+
+    def search_batch_indices(self, query_embeddings, top_k=5, rows=None):
+        queries = self.prepare_queries(query_embeddings)
+        return self.scan(queries, top_k, rows)
+
+
+# Number of set bits in every byte value, for numpy versions without bitwise_count
+_POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def popcount(bits):
+    """
+    Count the set bits in each byte of a uint8 array.
+
+    Args:
+        bits (numpy.ndarray): uint8 array
+
+    Returns:
+        numpy.ndarray: Bit counts with the same shape
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits)
+    return _POPCOUNT_TABLE[bits]
+
+
+class QuantizedIndex(BlockwiseIndex):
+    """
+    Two-stage index over compressed codes with exact rescoring.
+
+    The normalized embeddings are compressed in memory in one of two modes:
+
+    - "int8": per-dimension scalar quantization; each dimension's range is
+      mapped to 256 levels (4x smaller than float32)
+    - "binary": one sign bit per dimension, compared by Hamming distance
+      with popcount (32x smaller than float32)
+
+    A search scores every candidate row on the codes, keeps a shortlist of
+    `rescore * top_k` rows, and rescores only those against the
+    full-precision vectors, which stay memory-mapped on disk.
+    """
+
+    MODES = ('int8', 'binary')
+
+    def __init__(self, df, embeddings, mode="int8", rescore=10, max_memory_mb=256, codes=None):
+        """
+        Args:
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings, normally a memory-mapped store
+            mode (str): "int8" or "binary"
+            rescore (int): Shortlist size as a multiple of top_k
+            max_memory_mb (float): Memory bound for one block while building and rescoring
+            codes (dict): Previously built `codes`, `offset` and `scale` (see `load`)
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {self.MODES}")
+        super().__init__(df, embeddings, max_memory_mb=max_memory_mb)
+        self.mode = mode
+        self.rescore = rescore
+        if codes is not None:
+            self.codes, self.offset, self.scale = codes['codes'], codes['offset'], codes['scale']
+        else:
+            self._quantize()
+
+    def _normalized_blocks(self):
+        for start, stop in self._blocks(len(self.matrix), self.block_rows()):
+            block = np.asarray(self.matrix[start:stop], dtype=np.float32)
+            yield start, stop, block * self.inv_norms[start:stop, None]
+
+    def _quantize(self):
+        n_rows, dim = len(self.matrix), self.dim
+        if self.mode == "binary":
+            self.offset = self.scale = np.empty(0, dtype=np.float32)
+            self.codes = np.empty((n_rows, (dim + 7) // 8), dtype=np.uint8)
+            for start, stop, block in self._normalized_blocks():
+                self.codes[start:stop] = np.packbits(block > 0, axis=1)
+            return
+
+        # Per-dimension ranges, then 256 levels per dimension
+        low = np.full(dim, np.inf, dtype=np.float32)
+        high = np.full(dim, -np.inf, dtype=np.float32)
+        for _, _, block in self._normalized_blocks():
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        self.offset = low
+        self.scale = np.maximum(high - low, 1e-12) / 255
+        self.codes = np.empty((n_rows, dim), dtype=np.int8)
+        for start, stop, block in self._normalized_blocks():
+            levels = np.rint((block - self.offset) / self.scale)
+            self.codes[start:stop] = (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def quantized_scores(self, queries, rows=None):
+        """
+        Score queries against the codes of every row (or of `rows`).
+
+        Scores only rank rows for one query; they are not similarities.
+
+        Args:
+            queries: 2-D array of normalized float32 query vectors
+            rows: Optional row ids to score
+
+        Returns:
+            numpy.ndarray: Scores with one row per query and one column per row scored
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        n_rows = len(codes)
+        if self.mode == "binary":
+            query_bits = np.packbits(queries > 0, axis=1)
+            scores = np.empty((len(queries), n_rows), dtype=np.float32)
+            for i, bits in enumerate(query_bits):
+                # Fewer differing signs means a smaller angle
+                scores[i] = -popcount(codes ^ bits).sum(axis=1, dtype=np.int32)
+            return scores
+
+        # x ~ offset + scale * (code + 128); the offset term is the same for every row
+        weights = (queries * self.scale).T
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        block_rows = max(1, int(self.max_memory_mb * 2 ** 20 // (self.dim * 4)))
+        for start, stop in self._blocks(n_rows, block_rows):
+            scores[:, start:stop] = (codes[start:stop].astype(np.float32) @ weights).T
+        return scores
+
+    def search_batch_indices(self, query_embeddings, top_k=5, rows=None):
+        queries = self.prepare_queries(query_embeddings)
+        candidates = np.arange(len(self.matrix)) if rows is None else rows
+        shortlist_size = max(top_k, self.rescore * top_k)
+        results = []
+        for query, scores in zip(queries, self.quantized_scores(queries, rows)):
+            shortlist = np.sort(candidates[top_k_indices(scores, shortlist_size)])
+            block = np.asarray(self.matrix[shortlist], dtype=np.float32)
+            similarities = (block @ query) * self.inv_norms[shortlist]
+            top = top_k_indices(similarities, top_k)
+            results.append((shortlist[top], similarities[top]))
+        return results
+
+    def search_indices(self, query_embedding, top_k=5, rows=None):
+        return self.search_batch_indices(self.prepare_query(query_embedding).reshape(1, -1), top_k, rows)[0]
+
+    def memory_bytes(self):
+        """
+        Returns:
+            int: Bytes held in memory for search (codes, quantizer and row norms)
+        """
+        return self.codes.nbytes + self.offset.nbytes + self.scale.nbytes + self.inv_norms.nbytes
+
+    def save(self, path, fingerprint=""):
+        """
+        Save the codes and quantizer (the full vectors stay in the store).
+
+        Args:
+            path (str): Output `.npz` file
+            fingerprint (str): Fingerprint of the store the codes were built from (see store_fingerprint)
+        """
+        tmp_file = path + '.tmp.npz'
+        np.savez(tmp_file, codes=self.codes, offset=self.offset, scale=self.scale,
+                 mode=self.mode, rows=len(self.matrix), fingerprint=fingerprint)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path, df, embeddings, fingerprint=None, **params):
+        """
+        Load codes saved with `save` and attach them to the store's vectors.
+
+        Args:
+            path (str): `.npz` file written by `save`
+            df (pandas.DataFrame): Metadata rows, one per embedding
+            embeddings: 2-D array of embeddings the codes were built from
+            fingerprint (str): Current fingerprint of the store; a different saved one raises ValueError
+            **params: Other QuantizedIndex arguments (`rescore`, `max_memory_mb`)
+
+        Returns:
+            QuantizedIndex: Loaded index
+        """
+        data = np.load(path)
+        check_saved_index(path, data, embeddings, fingerprint)
+        codes = {'codes': data['codes'], 'offset': data['offset'], 'scale': data['scale']}
+        return cls(df, embeddings, mode=str(data['mode']), codes=codes, **params)
+
+
+def exact_index_for(index, cls=ExactIndex, **params):
+    """
+    Build an exact index over the same rows and query projection as another index.
+
+    Args:
+        index: Index to copy rows from
+        cls: Exact index class (ExactIndex, or BlockwiseIndex to stay on mmap)
+        **params: Extra arguments for `cls`
+
+    Returns:
+        ExactIndex: Exact index for recall comparisons
+    """
+    exact_index = cls(index.df, index.matrix, **params)
+    exact_index.projection = index.projection
+    return exact_index
+
+
+def recall_at_k(index, queries, top_k=10, exact_index=None):
+    """
+    Measure recall@k of an approximate index against exact search.
+
+    Args:
+        index: Index to evaluate (anything with `search_indices`)
+        queries: 2-D array of query embeddings
+        top_k (int): Number of results compared per query
+        exact_index (ExactIndex): Exact index over the same rows (defaults to `index`'s own matrix)
+
+    Returns:
+        float: Average fraction of the exact top-k found by `index`
+    """
+    if exact_index is None:
+        exact_index = exact_index_for(index)
+    hits = 0
+    for query in queries:
+        approx, _ = index.search_indices(query, top_k)
+        exact, _ = exact_index.search_indices(query, top_k)
+        hits += len(np.intersect1d(approx, exact))
+    return hits / max(1, len(queries) * min(top_k, len(exact_index)))
+
+
+def sample_queries(index, n_queries=100, noise=0.05, random_state=0):
+    """
+    Sample query vectors from an index's own rows, perturbed with a little noise.
+
+    Useful for recall checks when no real query log is available.
+
+    Args:
+        index: Index to sample from
+        n_queries (int): Number of queries
+        noise (float): Standard deviation of the Gaussian noise added to each row
+        random_state (int): Seed for sampling
+
+    Returns:
+        numpy.ndarray: 2-D array of query vectors
+    """
+    rng = np.random.default_rng(random_state)
+    rows = rng.choice(len(index.matrix), min(n_queries, len(index.matrix)), replace=False)
+    queries = np.asarray(index.matrix[rows], dtype=np.float32)
+    return queries + rng.normal(scale=noise / np.sqrt(queries.shape[1]), size=queries.shape).astype(np.float32)
+
+
+def report_recall(index, queries=None, top_k=10, settings=None, param='nprobe', exact_index=None, log=print):
+    """
+    Print recall@k and average latency for several values of a tuning parameter.
+
+    Args:
+        index: Approximate index to evaluate
+        queries: 2-D array of query embeddings (defaults to `sample_queries(index)`)
+        top_k (int): Number of results compared per query
+        settings: Values of `param` to try (defaults to the current value)
+        param (str): Name of the index attribute to vary (e.g. "nprobe")
+        exact_index (ExactIndex): Exact index over the same rows (defaults to one built from `index`'s matrix)
+        log: Function called with each report line
+
+    Returns:
+        list: (value, recall, milliseconds per query) for each setting
+    """
+    if queries is None:
+        queries = sample_queries(index)
+    if settings is None:
+        settings = [getattr(index, param)]
+    if exact_index is None:
+        exact_index = exact_index_for(index)
+    original = getattr(index, param)
+    report = []
+    try:
+        for value in settings:
+            setattr(index, param, value)
+            start_time = time.perf_counter()
+            for query in queries:
+                index.search_indices(query, top_k)
+            latency_ms = (time.perf_counter() - start_time) * 1000 / max(1, len(queries))
+            recall = recall_at_k(index, queries, top_k, exact_index=exact_index)
+            log(f"{param}={value}: recall@{top_k}={recall:.3f}, {latency_ms:.2f} ms/query")
+            report.append((value, recall, latency_ms))
+    finally:
+        setattr(index, param, original)
+    return report
+
+
+def report_throughput(index, queries=None, top_k=10, batch_size=1, log=print):
+    """
+    Print how fast a BlockwiseIndex scans its matrix, to size hardware for large corpora.
+
+    Args:
+        index (BlockwiseIndex): Index to measure
+        queries: 2-D array of query embeddings (defaults to `sample_queries(index, 20)`)
+        top_k (int): Number of results per query
+        batch_size (int): Number of queries scored per scan
+        log: Function called with the report line
+
+    Returns:
+        dict: GB scanned, seconds, GB/s, and queries per second
+    """
+    if queries is None:
+        queries = sample_queries(index, 20)
+    scanned_bytes = 0
+    start_time = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        index.search_batch_indices(queries[start:start + batch_size], top_k)
+        scanned_bytes += index.last_scan['bytes']
+    seconds = time.perf_counter() - start_time
+    report = {'gb_scanned': scanned_bytes / 1e9, 'seconds': seconds,
+              'gb_per_second': scanned_bytes / 1e9 / max(seconds, 1e-9),
+              'queries_per_second': len(queries) / max(seconds, 1e-9)}
+    log(f"Scanned {report['gb_scanned']:.2f} GB in {seconds:.2f}s: {report['gb_per_second']:.2f} GB/s, "
+          f"{report['queries_per_second']:.1f} queries/s ({index.matrix.dtype}, {len(index)} rows, "
+          f"{index.block_rows(batch_size)} rows per block, batch size {batch_size})")
+    return report
+
+
+def report_quantization(index, queries=None, top_k=10, settings=None, log=print):
+    """
+    Print the memory saved by a QuantizedIndex and its recall@k against exact search.
+
+    Args:
+        index (QuantizedIndex): Index to evaluate
+        queries: 2-D array of query embeddings (defaults to `sample_queries(index)`)
+        top_k (int): Number of results compared per query
+        settings: `rescore` values to try (defaults to the current value)
+        log: Function called with each report line
+
+    Returns:
+        dict: Memory use and (rescore, recall, milliseconds per query) for each setting
+    """
+    full_bytes = len(index) * index.dim * 4
+    quantized_bytes = index.memory_bytes()
+    log(f"{index.mode}: {quantized_bytes / 2 ** 20:.1f} MB in memory vs {full_bytes / 2 ** 20:.1f} MB "
+          f"for a float32 ExactIndex ({1 - quantized_bytes / full_bytes:.1%} saved)")
+    if queries is None:
+        queries = sample_queries(index)
+    exact_index = exact_index_for(index, BlockwiseIndex, max_memory_mb=index.max_memory_mb)
+    return {'memory_bytes': quantized_bytes, 'full_bytes': full_bytes,
+            'recall': report_recall(index, queries, top_k, settings=settings, param='rescore',
+                                    exact_index=exact_index, log=log)}
@@ -8,12 +8,49 @@ import tiktoken
 # Initialize OpenAI client
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
 
+def count_tokens(text, model="gpt-4o"):
+    """
+    Count the tokens of a text with the model's tiktoken encoding.
+    """
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return len(encoding.encode(text))
+
+def build_context(talks, model="gpt-4o", max_context_tokens=3000):
+    """
+    Build the prompt context from the talks, most similar first, using at most
+    max_context_tokens tokens. Talks are cut at paragraph boundaries, never mid-paragraph.
+    """
+    context = ""
+    used = 0
+    for talk in sorted(talks, key=lambda talk: talk['similarity'], reverse=True):
+        header = f"Title: {talk['title']}\nSpeaker: {talk['speaker']}\n"
+        header_tokens = count_tokens(header, model)
+        if used + header_tokens >= max_context_tokens:
+            break
+        paragraphs = ""
+        for paragraph in str(talk['text']).split('\n\n'):
+            paragraph_tokens = count_tokens(paragraph + "\n", model)
+            if used + header_tokens + paragraph_tokens > max_context_tokens:
+                break
+            paragraphs += paragraph + "\n"
+            used += paragraph_tokens
+        if paragraphs:
+            context += header + paragraphs + "\n"
+            used += header_tokens
+    return context
+
 def generate_chatgpt_response(search_term, talks, model="gpt-4o", max_context_tokens=3000):
     """
     Generate a ChatGPT response based on the search term and provided talks.
     Ensure that the response uses only the talk content, with no external sources.
     """
     try:
+        # Talk content to include in the prompt, limited to max_context_tokens
+        context = build_context(talks, model, max_context_tokens)
+
         # Return ChatGPT response based on the talks
         return ""
     